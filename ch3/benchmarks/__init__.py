@@ -0,0 +1,8 @@
+"""Performance benchmarks for ricolisp.  Run them from the ch3 directory:
+
+    python -m benchmarks               # The workload suite, with baseline comparison (see runner.py).
+    python -m benchmarks.engines       # Compare the execution engines.
+    python -m benchmarks.tail_calls    # A 10-million-iteration tail-recursive loop.
+    python -m benchmarks.frames        # Memory held by each procedure call.
+    python -m benchmarks.startup       # Time to import ricolisp and construct interpreters.
+"""
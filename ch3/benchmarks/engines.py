@@ -0,0 +1,58 @@
+"""Compare the throughput of the execution engines on the same programs.
+
+    python -m benchmarks.engines [--repeat 3]
+
+Each workload is run on every engine in LispInterpreter.engines, and on the compile engine without
+its JIT, and reported relative to eval, the tree-walking reference implementation.
+"""
+import argparse
+import time
+
+from ricolisp import LispInterpreter
+
+WORKLOADS = {
+    'fib 20': ('(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))', '(fib 20)'),
+    'while 100k': ("""(define sumto (lambda (x)
+                        (begin
+                            (define total 0)
+                            (while (> x 0) (begin (set! total (+ total x)) (set! x (- x 1))))
+                            total)))""", '(sumto 100000)'),
+    'tail loop 100k': ('(define loop (lambda (n acc) (if (= n 0) acc (loop (- n 1) (+ acc 1)))))', '(loop 100000 0)'),
+    'closures 50k': ("""(define make-account (lambda (balance) (lambda (amt) (begin (set! balance (+ balance amt)) balance))))
+                        (define account (make-account 0))
+                        (define spend (lambda (n) (if (= n 0) (account 0) (begin (account 1) (spend (- n 1))))))""",
+                     '(spend 50000)'),
+}
+
+
+# Column name -> LispInterpreter arguments.
+CONFIGURATIONS = {engine: {'engine': engine} for engine in LispInterpreter.engines}
+CONFIGURATIONS['compile, no jit'] = {'engine': 'compile', 'jit': False}
+
+
+def best_time(configuration: dict, setup: str, code: str, repeat: int) -> float:
+    """Run a workload a few times on a fresh interpreter and return the fastest time."""
+    lisp = LispInterpreter(**configuration)
+    lisp.run_stream(setup)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lisp.run(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per workload; the fastest is reported.')
+    args = parser.parse_args(argv)
+
+    print(f'{"workload":<16}' + ''.join(f'{column:>20}' for column in CONFIGURATIONS))
+    for name, (setup, code) in WORKLOADS.items():
+        times = {column: best_time(configuration, setup, code, args.repeat) for column, configuration in CONFIGURATIONS.items()}
+        cells = [f'{times[column] * 1000:9.1f}ms {times["eval"] / times[column]:5.1f}x' for column in CONFIGURATIONS]
+        print(f'{name:<16}' + ''.join(f'{cell:>20}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Measure the memory each procedure call holds while it is running.
+
+    python -m benchmarks.frames [--depth 200]
+
+A non-tail recursion keeps every activation alive until it bottoms out, so the growth in peak
+traced memory between two depths, divided by the difference, is the memory per call: the frame
+holding the arguments plus whatever the engine allocates around it.  When each eval() call built
+a dict-based Env this was about 1000 bytes; with Activation frames it is about 560.
+"""
+import argparse
+import sys
+import tracemalloc
+
+from ricolisp import LispInterpreter
+
+RECURSION = '(define down (lambda (n) (if (= n 0) 0 (+ 1 (down (- n 1))))))'
+
+
+def peak_memory(lisp: LispInterpreter, code: str) -> int:
+    """Run some code and return the most memory it had allocated at once, in bytes."""
+    tracemalloc.start()
+    try:
+        lisp.run(code)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bytes_per_call(engine: str, depth: int) -> float:
+    lisp = LispInterpreter(engine=engine)
+    lisp.run(RECURSION)
+    lisp.run(f'(down {depth})') # Warm up, so caches and the like aren't counted.
+    shallow = peak_memory(lisp, f'(down {depth // 2})')
+    deep = peak_memory(lisp, f'(down {depth})')
+    return (deep - shallow) / (depth - depth // 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--depth', type=int, default=200, help='How deep to recurse.')
+    parser.add_argument('--engine', nargs='*', default=LispInterpreter.engines, choices=LispInterpreter.engines)
+    args = parser.parse_args(argv)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.depth * 20))
+
+    for engine in args.engine:
+        print(f'{engine:<8} {bytes_per_call(engine, args.depth):8.0f} bytes per call')
+
+
+if __name__ == '__main__':
+    main()
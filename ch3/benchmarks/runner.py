@@ -0,0 +1,143 @@
+"""Run the benchmark workloads, save the results, and compare them against a baseline.
+
+    python -m benchmarks [--engine compile] [--scale 4] [--output results.json]
+                         [--baseline benchmarks/baseline.json] [--threshold 0.10] [--save-baseline]
+
+For each workload this reports ops per second (best of --repeat runs) and the peak memory
+allocated during a run (measured in a separate, traced run so tracing doesn't slow the timed ones).
+It also reports startup: the time to import ricolisp in a fresh Python process, and the time to
+construct a LispInterpreter.
+
+With a baseline file, any workload (or startup measurement) that got worse by more than the
+threshold is reported as a regression and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+from typing import Dict, List
+
+from ricolisp import LispInterpreter
+from ricolisp.interpreter import parse, read
+from . import startup
+from .workloads import WORKLOADS, Workload
+
+default_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def prepare(workload: Workload, engine: str, scale: int):
+    """Get a function that does one run of a workload: executing its parsed code, or reading all
+    of its source (see Workload.kind)."""
+    source = workload.code(scale)
+    if workload.kind == 'parse':
+        return lambda: sum(1 for _ in read(source))
+    lisp = LispInterpreter(engine=engine)
+    lisp.run_stream(workload.setup)
+    expression = parse(source)
+    return lambda: lisp.execute(expression)
+
+
+def measure(workload: Workload, engine: str, scale: int, repeat: int) -> Dict:
+    run = prepare(workload, engine, scale)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+
+    run = prepare(workload, engine, scale)
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    ops = workload.ops(scale)
+    return {'unit': workload.unit, 'ops': ops, 'seconds': best, 'ops_per_sec': ops / best, 'peak_kb': peak / 1024}
+
+
+def measure_startup(engine: str, repeat: int) -> Dict:
+    """Time importing ricolisp in a new process, and constructing an interpreter in this one (see startup.py)."""
+    return {'import_ms': startup.import_time(repeat) * 1000, 'interpreter_ms': startup.interpreter_time(engine, 200) * 1000}
+
+
+def run_all(engine: str, scale: int, repeat: int, only: List[str] = None) -> Dict:
+    results = {
+        'engine': engine,
+        'scale': scale,
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'startup': measure_startup(engine, repeat),
+        'workloads': {},
+    }
+    for workload in WORKLOADS:
+        if only and workload.name not in only:
+            continue
+        results['workloads'][workload.name] = measure(workload, engine, scale, repeat)
+    return results
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """List the measurements in results that are worse than the baseline by more than threshold (0.1 = 10%)."""
+    regressions = []
+    for name, result in results['workloads'].items():
+        before = baseline.get('workloads', {}).get(name)
+        if before and result['ops_per_sec'] < before['ops_per_sec'] * (1 - threshold):
+            regressions.append(f'{name}: {result["ops_per_sec"]:,.0f} ops/s, was {before["ops_per_sec"]:,.0f}')
+    for name in ('import_ms', 'interpreter_ms'):
+        before = baseline.get('startup', {}).get(name)
+        now = results['startup'][name]
+        if before and now > before * (1 + threshold):
+            regressions.append(f'startup {name}: {now:.3f}ms, was {before:.3f}ms')
+    return regressions
+
+
+def format_results(results: Dict, baseline: Dict = None) -> str:
+    lines = [f'engine={results["engine"]} scale={results["scale"]} python={results["python"]}',
+        f'{"workload":<14} {"ops/s":>14} {"unit":<11} {"peak KB":>10} {"vs baseline":>12}']
+    for name, result in results['workloads'].items():
+        change = ''
+        before = (baseline or {}).get('workloads', {}).get(name)
+        if before:
+            change = f'{result["ops_per_sec"] / before["ops_per_sec"] - 1:+.1%}'
+        lines.append(f'{name:<14} {result["ops_per_sec"]:>14,.0f} {result["unit"]:<11} {result["peak_kb"]:>10,.1f} '
+            f'{change:>12}')
+    startup = results['startup']
+    lines.append(f'startup: import {startup["import_ms"]:.2f}ms, LispInterpreter() {startup["interpreter_ms"]:.3f}ms')
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', default='compile', choices=LispInterpreter.engines)
+    parser.add_argument('--scale', type=int, default=4, help='Size multiplier for every workload.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per workload; the best one counts.')
+    parser.add_argument('--only', nargs='*', help='Only run these workloads.')
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', default=default_baseline, help='Baseline results to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown before it is a regression.')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    args = parser.parse_args(argv)
+
+    results = run_all(args.engine, args.scale, args.repeat, args.only)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+
+    for filename in [args.output] + ([args.baseline] if args.save_baseline else []):
+        if filename:
+            with open(filename, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
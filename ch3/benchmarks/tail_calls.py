@@ -0,0 +1,45 @@
+"""Time a tail-recursive loop, and non-tail recursion for comparison.
+
+    python -m benchmarks.tail_calls [--iterations 10000000] [--engine compile]
+
+Before tail calls were handled, the loop died with RecursionError after about a thousand
+iterations.  The recursion benchmark checks that making tail calls cheap didn't make ordinary
+deep recursion slower.
+"""
+import argparse
+import time
+
+from ricolisp import LispInterpreter
+
+LOOP = '(define loop (lambda (n acc) (if (= n 0) acc (loop (- n 1) (+ acc 1)))))'
+RECURSION = '(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))'
+
+
+def timed(lisp: LispInterpreter, code: str):
+    """Run some code and return (result, seconds)."""
+    start = time.perf_counter()
+    result = lisp.run(code)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=10_000_000, help='Iterations of the tail-recursive loop.')
+    parser.add_argument('--fib', type=int, default=22, help='Argument for the non-tail recursive fib.')
+    parser.add_argument('--engine', default='compile', choices=LispInterpreter.engines)
+    args = parser.parse_args(argv)
+
+    lisp = LispInterpreter(engine=args.engine)
+    lisp.run(LOOP)
+    lisp.run(RECURSION)
+
+    result, seconds = timed(lisp, f'(loop {args.iterations} 0)')
+    assert result == args.iterations
+    print(f'tail loop  {args.iterations:>12,} iterations  {seconds:8.2f}s  {args.iterations / seconds:>12,.0f} iterations/s')
+
+    result, seconds = timed(lisp, f'(fib {args.fib})')
+    print(f'fib {args.fib:<6} {result:>12,} result      {seconds:8.2f}s')
+
+
+if __name__ == '__main__':
+    main()
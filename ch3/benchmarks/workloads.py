@@ -0,0 +1,94 @@
+"""The Lisp programs the benchmark runner measures.
+
+Each Workload says how much work one run does in ops, in whatever unit suits it (procedure calls,
+loop iterations, list cells, tokens), so results are reported as ops per second and stay
+comparable when the sizes change.  scale multiplies the size of every workload; the runner uses
+a small scale for quick checks.
+"""
+from typing import Callable, List
+
+
+class Workload:
+    def __init__(self, name: str, unit: str, setup: str, code: Callable[[int], str], ops: Callable[[int], int],
+            kind: str = 'run'):
+        """
+        @param name: Name used in reports and in the results file.
+        @param unit: What one op is.
+        @param setup: Lisp code run once before timing, for definitions.
+        @param code: Given the scale, return the code to time (or, for parse workloads, the source to parse).
+        @param ops: Given the scale, return how many ops one run of the code does.
+        @param kind: 'run' to time LispInterpreter.execute on the code, parsed beforehand, so the
+        time is for running it and not for parsing it; or 'parse' to time reading the source with
+        read(), the reader run_stream() and run_file() use.
+        """
+        self.name = name
+        self.unit = unit
+        self.setup = setup
+        self.code = code
+        self.ops = ops
+        self.kind = kind
+
+
+def fib_calls(n: int) -> int:
+    a, b = 1, 1
+    for _ in range(n):
+        a, b = b, a + b + 1
+    return a
+
+
+def tak_calls(x: int, y: int, z: int) -> int:
+    calls = 0
+    def tak(x, y, z):
+        nonlocal calls
+        calls += 1
+        if y < x:
+            return tak(tak(x - 1, y, z), tak(y - 1, z, x), tak(z - 1, x, y))
+        return z
+    tak(x, y, z)
+    return calls
+
+
+def generated_source(forms: int) -> str:
+    """A large program of the kind our tools generate: many small top-level definitions."""
+    return '\n'.join(f'(define entity{i} (lambda (dt) (list (+ x{i} (* vx{i} dt)) (- y{i} (* 0.5 dt)))))'
+        for i in range(forms))
+
+
+WORKLOADS: List[Workload] = [
+    Workload('fib', 'calls',
+        '(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))',
+        lambda scale: f'(fib {16 + scale})', lambda scale: fib_calls(16 + scale)),
+    Workload('tak', 'calls',
+        '(define tak (lambda (x y z) (if (< y x) (tak (tak (- x 1) y z) (tak (- y 1) z x) (tak (- z 1) x y)) z)))',
+        lambda scale: f'(tak {10 + scale} 6 2)', lambda scale: tak_calls(10 + scale, 6, 2)),
+    Workload('make-account', 'calls', """
+        (define make-account
+            (lambda (balance)
+                (lambda (amt)
+                    (begin (set! balance (+ balance amt))
+                            balance))))
+        (define account (make-account 0))
+        (define spend (lambda (n) (if (= n 0) (account 0) (begin (account 1) (spend (- n 1))))))
+        """, lambda scale: f'(spend {5000 * scale})', lambda scale: 5000 * scale),
+    Workload('while', 'iterations', """
+        (define sumto (lambda (x)
+            (begin
+                (define total 0)
+                (while (> x 0)
+                    (begin
+                        (set! total (+ total x))
+                        (set! x (- x 1))))
+                total)))
+        """, lambda scale: f'(sumto {20000 * scale})', lambda scale: 20000 * scale),
+    Workload('cons-cdr', 'cells', """
+        (define build (lambda (n acc) (if (= n 0) acc (build (- n 1) (cons n acc)))))
+        (define walk (lambda (l n) (if (null? l) n (walk (cdr l) (+ n 1)))))
+        """, lambda scale: f'(walk (build {500 * scale} (list)) 0)', lambda scale: 2 * 500 * scale),
+    Workload('map', 'elements', """
+        (define range (lambda (n acc) (if (= n 0) acc (range (- n 1) (cons n acc)))))
+        (define numbers (range 1000 (list)))
+        (define square-all (lambda (n) (if (= n 0) 0 (begin (map (lambda (x) (* x x)) numbers) (square-all (- n 1))))))
+        """, lambda scale: f'(square-all {2 * scale})', lambda scale: 1000 * 2 * scale),
+    Workload('parse', 'forms', '', lambda scale: generated_source(2000 * scale), lambda scale: 2000 * scale,
+        kind='parse'),
+]
@@ -0,0 +1,436 @@
+"""Turn parsed expressions into trees of Python closures.
+
+eval() looks at the shape of an expression every time it runs it: it checks the type of the node,
+compares the operator against each special form name, and unpacks the arguments again.  Inside a
+loop body that work is repeated on every iteration even though the code never changes.
+
+The Compiler here does that analysis once.  compile() walks an expression and returns a Code
+object: a plain Python function taking a frame.  Running it does no syntax dispatch at all; each
+closure already knows what kind of node it is and holds the compiled closures for its children.
+
+Variables are resolved at compile time too (lexical addressing).  A procedure activation is a
+list frame: slot 0 is the enclosing frame and the remaining slots hold the parameters followed by
+any names the body defines.  A local variable compiles to a (depth, index) pair, so reading it is
+a couple of list indexes no matter how deeply the closure is nested.  Anything that isn't local is
+a global and compiles to the Cell for that name in the GlobalEnv.
+
+Calls in tail position (the branches of an if, the last expression of a begin, and a procedure
+body) to another compiled Procedure don't call it.  They return a TailCall instead, and the loop in
+Procedure.__call__ makes the call, so tail-recursive loops run in constant Python stack.
+"""
+from typing import Callable, Dict, Optional
+from typing import List as PythonList
+
+from . import limits, memo, pairs
+from .limits import burn
+from .macros import Macro, expand_macro_definition
+from .interpreter import Symbol, List, Exp, GlobalEnv, Procedure, TailCall, unparse
+
+Frame = list # [enclosing frame, slot 1, slot 2, ...], or None at the top level.
+Code = Callable[[Frame], object] # Compiled code: call it with a frame to run it.
+
+
+class Unassigned:
+    """Marks a frame slot for a name the body defines but hasn't defined yet."""
+    def __repr__(self):
+        return '<unassigned>'
+
+unassigned = Unassigned()
+
+
+class Scope:
+    """Compile-time picture of the frame a procedure activation will use."""
+    def __init__(self, parms, defined, outer: Optional['Scope']):
+        """
+        @param parms: The procedure parameters; they take slots 1 to len(parms).
+        @param defined: Names defined inside the body that aren't parameters; they get the next slots.
+        @param outer: The scope of the enclosing procedure, or None if it is the global scope.
+        """
+        self.slots = {name: i for i, name in enumerate(list(parms) + list(defined), start=1)}
+        self.defined = set(defined)
+        self.outer = outer
+
+
+class Lambda:
+    """What the compiler knows about one lambda expression.
+
+    Every Procedure made by evaluating the same lambda expression shares one of these.
+    """
+    __slots__ = ('parms', 'source', 'nparms', 'locals', 'body', 'bytecode', 'name', 'scope', 'native', 'countdown', 'jit')
+
+    def __init__(self, parms, source: Exp, ndefined: int, body: Code, bytecode=None, name: str = 'lambda',
+            scope: 'Scope' = None, jit: 'Jit' = None):
+        """
+        @param parms: The parameter names.
+        @param source: The parsed body.
+        @param ndefined: How many names the body defines besides the parameters.
+        @param body: Code that runs the body in a frame.
+        @param bytecode: The body as a ricolisp.vm.CodeObject, if it was compiled for the VM.
+        @param name: The name the lambda was defined with, for reports and debugging.
+        @param scope: The Scope of the body.  Its outer scopes describe the frames a Procedure's env
+        links to, so the values a closure captures can be found by name.
+        @param jit: The ricolisp.jit.Jit to translate the body into a Python function once it has
+        been called often enough, or None to always run body.
+        """
+        self.parms = parms
+        self.source = source
+        self.nparms = len(parms)
+        self.locals = (unassigned,) * ndefined # Initial values of the slots after the parameters.
+        self.body = body
+        self.bytecode = bytecode
+        self.name = name
+        self.scope = scope
+        self.native = None # The body as a Python function taking (env, *args), once the Jit has made one.
+        self.countdown = jit.threshold if jit is not None else -1 # Calls to go until it is hot.  Never 0 if it will never be.
+        self.jit = jit
+
+    def __repr__(self):
+        return f'<Lambda {self.name} ({" ".join(self.parms)})>'
+
+
+def defined_names(x: Exp) -> PythonList[Symbol]:
+    """Find the names an expression defines in its own frame, in the order they first appear.
+
+    Nested lambdas have frames of their own, so we don't look inside them.
+    """
+    names = []
+    def scan(x):
+        if not isinstance(x, List) or not x:
+            return
+        if x[0] == 'quote' or x[0] == 'lambda':
+            return
+        if x[0] in ('define', 'define-memo') and len(x) >= 3 and isinstance(x[1], Symbol):
+            if x[1] not in names:
+                names.append(x[1])
+        for part in x:
+            scan(part)
+    scan(x)
+    return names
+
+
+def frame_reader(i: int, depth: int) -> Code:
+    """Make code that reads slot i of the frame depth levels out from the current one."""
+    if depth == 0:
+        return lambda f: f[i]
+    if depth == 1:
+        return lambda f: f[0][i]
+    if depth == 2:
+        return lambda f: f[0][0][i]
+    def read(f):
+        for _ in range(depth):
+            f = f[0]
+        return f[i]
+    return read
+
+
+def frame_writer(i: int, depth: int, value: Code) -> Code:
+    """Make code that stores the result of value into slot i of the frame depth levels out."""
+    if depth == 0:
+        def write(f):
+            f[i] = value(f)
+    elif depth == 1:
+        def write(f):
+            f[0][i] = value(f)
+    else:
+        def write(f):
+            v = value(f)
+            for _ in range(depth):
+                f = f[0]
+            f[i] = v
+    return write
+
+
+class Compiler:
+    """Compiles expressions into closures that run against one GlobalEnv.
+
+    Special forms are looked up in the special_forms table, so new syntax can be added by
+    registering another compile method rather than by editing a chain of if statements.
+    """
+    def __init__(self, env: GlobalEnv, profiler: 'Profiler' = None, optimizer: 'Optimizer' = None, jit: bool = False,
+            tracer: 'Tracer' = None):
+        """
+        @param env: The global environment compiled code will read and write.
+        @param profiler: If given, the code is instrumented to report to this ricolisp.profiler.Profiler.
+        @param optimizer: If given, this ricolisp.optimizer.Optimizer folds constants and inlines
+        calls to builtins.
+        @param jit: Translate procedures into Python functions once they are hot (see ricolisp.jit).
+        @param tracer: If given, every procedure call is recorded on this ricolisp.tracing.Tracer.
+        """
+        self.env = env
+        self.profiler = profiler
+        self.optimizer = optimizer
+        self.tracer = tracer
+        self.lambda_names = {} # id(lambda expression) -> name it is being defined as.
+        self.special_forms: Dict[str, Callable[[List, Optional[Scope], bool], Code]] = {
+            'quote':  self.compile_quote,
+            'if':     self.compile_if,
+            'define': self.compile_define,
+            'define-memo': self.compile_define_memo,
+            'define-macro': self.compile_define_macro,
+            'defmacro': self.compile_define_macro,
+            'define-syntax': self.compile_define_macro,
+            'import': self.compile_import,
+            'require': self.compile_import,
+            'set!':   self.compile_set,
+            'lambda': self.compile_lambda,
+            'while':  self.compile_while,
+            'begin':  self.compile_begin,
+        }
+        self.jit = None
+        if jit:
+            from .jit import Jit
+            self.jit = Jit(env, self.special_forms, tracer=tracer)
+
+    def compile(self, x: Exp, scope: Scope = None, tail: bool = False) -> Code:
+        """Compile an expression into a function that takes a frame and returns the value.
+
+        @param scope: The scope of the procedure the expression appears in, or None at the top level.
+        @param tail: True if the expression is in tail position of a procedure body, in which case
+        the code may return a TailCall instead of a value.
+        """
+        if isinstance(x, Symbol):        # variable reference
+            code = self.compile_symbol(x, scope)
+        elif not isinstance(x, List):    # constant number
+            code = self.compile_constant(x)
+        elif x and isinstance(x[0], Symbol) and x[0] in self.special_forms:
+            code = self.special_forms[x[0]](x, scope, tail)
+        elif x and isinstance(x[0], Symbol) and self._is_global(x[0], scope) and type(self.env.get(x[0])) is Macro:
+            return self.compile(self.env[x[0]].expand(x), scope, tail) # Compile what the macro use expands into.
+        else:
+            code = self.compile_call(x, scope, tail)
+        if self.profiler:
+            code = self.profiler.count_node(code)
+        return code
+
+    def compile_symbol(self, name: Symbol, scope: Optional[Scope], depth: int = 0) -> Code:
+        while scope is not None and name not in scope.slots:
+            scope, depth = scope.outer, depth + 1
+        if scope is None:
+            return self._global_reference(name)
+
+        read = frame_reader(scope.slots[name], depth)
+        if name not in scope.defined:
+            return read
+
+        # Until the body runs its define, the name still refers to whatever it meant outside.
+        outside = self.compile_symbol(name, scope.outer, depth + 1)
+        def defined_variable(f):
+            value = read(f)
+            return outside(f) if value is unassigned else value
+        return defined_variable
+
+    def _global_reference(self, name: Symbol) -> Code:
+        cell = self.env.cell(name)
+        def global_variable(f):
+            try:
+                return cell.value
+            except AttributeError:
+                raise Exception(f'Variable "{name}" not found') from None
+        if self.optimizer:
+            self.optimizer.global_reference(name, global_variable)
+        return global_variable
+
+    def compile_constant(self, value: Exp) -> Code:
+        code = lambda f: value
+        if self.optimizer:
+            self.optimizer.constant(code, value)
+        return code
+
+    def compile_quote(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        (_, value) = self._expect(x, 2)
+        return self.compile_constant(pairs.from_python(value))
+
+    def compile_if(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        (_, test, conseq, alt) = self._expect(x, 4)
+        test = self.compile(test, scope)
+        if self.optimizer and test in self.optimizer.static: # Don't fold constants in the branch that won't be taken.
+            taken = bool(self.optimizer.static[test][0])
+            with self.optimizer.unreachable(not taken):
+                conseq = self.compile(conseq, scope, tail)
+            with self.optimizer.unreachable(taken):
+                alt = self.compile(alt, scope, tail)
+        else:
+            conseq, alt = self.compile(conseq, scope, tail), self.compile(alt, scope, tail)
+        return lambda f: conseq(f) if test(f) else alt(f)
+
+    def compile_define(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        (_, symbol, exp) = self._expect(x, 3)
+        self.lambda_names[id(exp)] = symbol
+        value = self.compile(exp, scope)
+        self.lambda_names.pop(id(exp), None)
+        if scope is None:
+            env = self.env
+            def define_global(f):
+                env[symbol] = value(f)
+            return define_global
+        return frame_writer(scope.slots[symbol], 0, value)
+
+    def compile_define_memo(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        define = memo.expand_define_memo(x)
+        self.lambda_names[id(x[2])] = x[1]
+        code = self.compile_define(define, scope, tail)
+        self.lambda_names.pop(id(x[2]), None)
+        return code
+
+    def compile_define_macro(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        return self.compile_define(expand_macro_definition(x, scope is None), scope, tail)
+
+    def compile_import(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        from .modules import expand_import
+        return self.compile(expand_import(x), scope, tail)
+
+    def compile_set(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        (_, symbol, exp) = self._expect(x, 3)
+        return self._assignment(symbol, self.compile(exp, scope), scope)
+
+    def _assignment(self, name: Symbol, value: Code, scope: Optional[Scope], depth: int = 0) -> Code:
+        """Compile set! of name, with the new value coming from the given code."""
+        while scope is not None and name not in scope.slots:
+            scope, depth = scope.outer, depth + 1
+        if scope is None:
+            env = self.env
+            def set_global(f):
+                v = value(f)
+                if name not in env:
+                    raise Exception(f'Variable "{name}" not found')
+                env[name] = v
+            return set_global
+
+        i = scope.slots[name]
+        write = frame_writer(i, depth, value)
+        if name not in scope.defined:
+            return write
+
+        # Like a reference, assigning a name before the body defines it affects the outer binding.
+        read = frame_reader(i, depth)
+        outside = self._assignment(name, value, scope.outer, depth + 1)
+        def set_defined(f):
+            if read(f) is unassigned:
+                return outside(f)
+            write(f)
+        return set_defined
+
+    def compile_lambda(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        (_, parms, body) = self._expect(x, 3)
+        if not isinstance(parms, List) or not all(isinstance(p, Symbol) for p in parms):
+            raise SyntaxError(f'lambda parameters must be a list of symbols, got {parms}')
+        defined = [name for name in defined_names(body) if name not in parms]
+        inner = Scope(parms, defined, scope)
+        name = self.lambda_names.pop(id(x), 'lambda')
+        code = Lambda(parms, body, len(defined), self.compile(body, inner, tail=True), name=name, scope=inner, jit=self.jit)
+        if self.profiler:
+            code.body = self.profiler.wrap_procedure(code, name, code.body)
+        if self.tracer:
+            code.body = self.tracer.wrap_procedure(code, name, code.body)
+        return lambda f: Procedure(parms, body, f, code)
+
+    def compile_while(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        (_, cond, statement) = self._expect(x, 3)
+        cond, statement = self.compile(cond, scope), self.compile(statement, scope)
+        laps = range(limits.lap)
+        def while_(f):
+            result = None
+            while True:
+                # Burn fuel for the iterations a lap at a time (see ricolisp.limits).
+                for n in laps:
+                    if not cond(f):
+                        burn(n)
+                        return result
+                    result = statement(f)
+                burn(limits.lap)
+        return while_
+
+    def compile_begin(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        if len(x) == 1:
+            return self.compile_constant(None)
+        *first, last = [self.compile(exp, scope) for exp in x[1:-1]] + [self.compile(x[-1], scope, tail)]
+        if len(first) == 0:
+            return last
+        if len(first) == 1:
+            (a,) = first
+            def begin(f):
+                a(f)
+                return last(f)
+            return begin
+        def begin(f):
+            for exp in first:
+                exp(f)
+            return last(f)
+        return begin
+
+    def compile_call(self, x: List, scope: Optional[Scope], tail: bool) -> Code:
+        proc, *args = [self.compile(exp, scope) for exp in x]
+        if self.profiler:
+            return self._profiled_call(proc, args, tail, unparse(x[0]))
+        code = self._tail_call(proc, args) if tail else self._call(proc, args)
+        if self.optimizer and isinstance(x[0], Symbol) and self._is_global(x[0], scope):
+            code = self.optimizer.call(x[0], args, code)
+        return code
+
+    def _is_global(self, name: Symbol, scope: Optional[Scope]) -> bool:
+        while scope is not None:
+            if name in scope.slots:
+                return False
+            scope = scope.outer
+        return True
+
+    def _call(self, proc: Code, args: PythonList[Code]) -> Code:
+        # Calls with a few arguments are by far the most common, so give them closures that
+        # don't need to build an argument list.
+        if len(args) == 0:
+            return lambda f: proc(f)()
+        if len(args) == 1:
+            (a,) = args
+            return lambda f: proc(f)(a(f))
+        if len(args) == 2:
+            (a, b) = args
+            return lambda f: proc(f)(a(f), b(f))
+        if len(args) == 3:
+            (a, b, c) = args
+            return lambda f: proc(f)(a(f), b(f), c(f))
+        return lambda f: proc(f)(*[arg(f) for arg in args])
+
+    def _tail_call(self, proc: Code, args: PythonList[Code]) -> Code:
+        """Compile a call in tail position.
+
+        Calls to Procedures are handed back to the trampoline in Procedure.__call__; anything else,
+        such as a builtin, is just called.
+        """
+        if len(args) == 1:
+            (a,) = args
+            def tail_call(f):
+                p = proc(f)
+                if type(p) is Procedure:
+                    return TailCall(p, (a(f),))
+                return p(a(f))
+        elif len(args) == 2:
+            (a, b) = args
+            def tail_call(f):
+                p = proc(f)
+                if type(p) is Procedure:
+                    return TailCall(p, (a(f), b(f)))
+                return p(a(f), b(f))
+        else:
+            def tail_call(f):
+                p = proc(f)
+                if type(p) is Procedure:
+                    return TailCall(p, tuple([arg(f) for arg in args]))
+                return p(*[arg(f) for arg in args])
+        return tail_call
+
+    def _profiled_call(self, proc: Code, args: PythonList[Code], tail: bool, name: str) -> Code:
+        """Compile a call that reports calls to primitives to the profiler."""
+        call_primitive = self.profiler.call_primitive
+        def profiled_call(f):
+            p = proc(f)
+            values = [arg(f) for arg in args]
+            if type(p) is Procedure:
+                return TailCall(p, tuple(values)) if tail else p(*values)
+            return call_primitive(name, p, values)
+        return profiled_call
+
+    def _expect(self, x: List, length: int) -> List:
+        """Check that a special form has the right number of parts before unpacking it."""
+        if len(x) != length:
+            raise SyntaxError(f'{x[0]} expects {length - 1} arguments, got {len(x) - 1}')
+        return x
@@ -0,0 +1,103 @@
+"""Reading S-expression data files too big to hold as one string.
+
+    for record in read_data('events.sexp', skip={'payload'}):
+        ...
+
+    (define events (read-data (quote "events.sexp") (quote (payload))))
+    (car events) ; Reads only as far as the first record.
+
+parse() wants the whole program as a str, and even read() decodes the text and copies it into
+token strings.  read_data() instead memory-maps the file and scans the bytes in place, building
+one top-level datum at a time as a lisp list (see ricolisp.pairs) and handing it over before
+reading the next, so only the record being built is ever in memory, and the operating system pages
+the file in and out as needed.
+
+Lists whose first element is one of the skip symbols are stepped over by looking only at the
+parentheses, without building anything: they are left out of the list they are in, and out of
+the results if they are at the top level.  From lisp, (read-data path [skip]) gives the data as a
+LazyList, which reads each item the first time it is asked for.  The reader has no strings, so the
+path is a quoted symbol, with or without double quotes around it.
+"""
+import mmap
+import re
+from typing import Iterable, Iterator
+
+from .interpreter import atom
+from .pairs import LazyList, make_list
+
+token_pattern = re.compile(rb'[()]|[^\s()]+')
+paren_pattern = re.compile(rb'[()]')
+atom_cache_size = 4096 # Data files repeat the same symbols and small numbers over and over.
+
+
+def skip_list(data, position: int) -> int:
+    """Find where the list whose head ends at position ends, without reading what is in it."""
+    depth = 1
+    for match in paren_pattern.finditer(data, position):
+        depth += 1 if data[match.start()] == 40 else -1 # 40 is (
+        if not depth:
+            return match.end()
+    raise SyntaxError('unexpected EOF in a skipped list')
+
+
+def scan(data, skip: Iterable[str] = ()) -> Iterator:
+    """Generate each top-level datum in a bytes-like object."""
+    skip = {symbol.encode() for symbol in skip}
+    atoms = {} # Token -> its atom, for the first atom_cache_size distinct tokens.
+    stack = [] # Items of the lists we are still reading, innermost last.
+    position = 0
+    scanning = True
+    while scanning:
+        scanning = False
+        opened = False # Whether the last token was (, so this one is the head of a list.
+        for match in token_pattern.finditer(data, position):
+            token = match.group()
+            if token == b'(':
+                stack.append([])
+                opened = True
+                continue
+            if opened and token in skip:
+                stack.pop()
+                position = skip_list(data, match.end())
+                scanning = True # Carry on scanning from after the skipped list.
+                break
+            opened = False
+            if token == b')':
+                if not stack:
+                    raise SyntaxError('unexpected )')
+                value = make_list(stack.pop())
+            else:
+                value = atoms.get(token)
+                if value is None:
+                    value = atom(token.decode())
+                    if len(atoms) < atom_cache_size:
+                        atoms[token] = value
+            if stack:
+                stack[-1].append(value)
+            else:
+                yield value
+    if stack:
+        raise SyntaxError('unexpected EOF')
+
+
+def read_data(path: str, skip: Iterable[str] = ()) -> Iterator:
+    """Generate each top-level datum in a file, reading it through a memory map.
+
+    @param skip: Symbols marking lists to step over without building them.
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # An empty file can't be mapped.
+            return
+    with data:
+        yield from scan(data, skip)
+
+
+def lisp_read_data(path: str, skip=()) -> LazyList:
+    """The read-data builtin."""
+    return LazyList(read_data(path.strip('"'), list(skip)))
+
+
+def builtins() -> dict:
+    return {'read-data': lisp_read_data}
@@ -1,27 +1,76 @@
+from typing import Iterable, Iterator, Optional
 from typing import List as PythonList
 import math
 import operator as op
+import os
+import re
+import weakref
+
+from . import macros, memo, pairs, ports
+from .limits import Budget, metered, refuel, tick
+from .macros import Macro, expand_macro_definition
+from .pairs import LazyList, Pair, nil
+from .ports import OutputPort, output_to, write_value
+from .tracing import traced
 
 #from .token import Token
 
 Symbol = str              # Symbol is implemented as a Python str
 Number = (int, float)     # Number is implemented as either a Python int or float
 Atom   = (Symbol, Number) # An Atom is a Symbol or Number
-List   = list             # List is implemented as a Python list
+List   = list             # List is implemented as a Python list in parsed code; data lists are Pairs (see pairs.py)
 Exp    = (Atom, List)     # An expression is either an Atom or List
 
-diagnostic_trace = False
-#diagnostic_trace = True
+token_pattern = re.compile(r'[()]|[^\s()]+') # A parenthesis, or a run of anything else that isn't whitespace.
+read_chunk_size = 64 * 1024 # How much to read from a file object at a time.
 
 def tokenize(chars: str):
     """Convert a string of characters into a list of tokens."""
-    return chars.replace('(', ' ( ').replace(')', ' ) ').split()
+    return token_pattern.findall(chars)
+
+def source_chunks(source) -> Iterator[str]:
+    """Break a source into strings.
+
+    @param source: A string, a file object with a read() method, or an iterable of strings.
+    """
+    if isinstance(source, str):
+        for start in range(0, len(source), read_chunk_size):
+            yield source[start:start + read_chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(read_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+def read_tokens(source) -> Iterator[str]:
+    """Generate the tokens in a source (see source_chunks) one at a time, as it is read.
+
+    A token can be split across two chunks, so a token touching the end of a chunk is held back
+    until we see what comes next.
+    """
+    partial = ''
+    for chunk in source_chunks(source):
+        if partial:
+            chunk = partial + chunk
+            partial = ''
+        tokens = token_pattern.findall(chunk)
+        if tokens and chunk[-1] not in '()' and not chunk[-1].isspace():
+            partial = tokens.pop()
+        yield from tokens
+    if partial:
+        yield partial
 
 def atom(token: str) -> Atom:
     """Create an atom from a string.
 
     Numbers remain numbers; every other token becomes a symbol.
     """
+    first = token[0]
+    if first.isalpha() and first not in 'iInN': # Only inf, nan and infinity start with a letter.
+        return Symbol(token)
     try:
         return int(token)
     except ValueError:
@@ -30,27 +79,53 @@ def atom(token: str) -> Atom:
         except ValueError:
             return Symbol(token)
 
-def read_from_tokens(tokens: PythonList) -> Exp:
-    """Read an expression from a sequence of tokens."""
-    if len(tokens) == 0:
+def read_form(token: str, tokens: Iterator[str]) -> Exp:
+    """Read one expression that starts with token, taking any further tokens it needs from tokens.
+
+    This keeps its own stack of unfinished lists instead of recursing, so it is linear in the
+    number of tokens and deep nesting can't overflow the Python stack.
+    """
+    stack = [] # Lists we are still reading, innermost last.
+    while True:
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if not stack:
+                raise SyntaxError('unexpected )')
+            L = stack.pop()
+            if not stack:
+                return L
+            stack[-1].append(L)
+        else:
+            value = atom(token)
+            if not stack:
+                return value
+            stack[-1].append(value)
+        token = next(tokens, None)
+        if token is None:
+            raise SyntaxError('unexpected EOF')
+
+def read_from_tokens(tokens: Iterable[str]) -> Exp:
+    """Read an expression from a sequence of tokens.
+
+    If tokens is an iterator, only the tokens of the first expression are taken from it, so calling
+    this again reads the next expression.
+    """
+    tokens = iter(tokens)
+    token = next(tokens, None)
+    if token is None:
         raise SyntaxError('unexpected EOF')
-    
-    token = tokens.pop(0)
-    if token == '(':
-        L = []
-        while tokens[0] != ')':
-            L.append(read_from_tokens(tokens))
-        tokens.pop(0) # pop off ')'
-        return L
-    
-    if token == ')':
-        raise SyntaxError('unexpected )')
-        
-    return atom(token)
+    return read_form(token, tokens)
+
+def read(source) -> Iterator:
+    """Generate each top-level expression in a source (see source_chunks) as soon as it has been read."""
+    tokens = read_tokens(source)
+    for token in tokens:
+        yield read_form(token, tokens)
 
 def parse(program: str) -> Exp:
     """Read a string and turn it into an Expression."""
-    return read_from_tokens(tokenize(program))
+    return read_from_tokens(read_tokens(program))
 
 
 class Env(dict):
@@ -58,6 +133,8 @@ class Env(dict):
     An environment contains variable definitions, and may be linked to a parent environment.
     You can think of it as a dictionary with an optional parent dictionary.
     """
+    globals = None # The GlobalEnv at the end of the chain, for environments that keep track of it.
+
     def __init__(self, parms=(), args=(), outer: 'Env'=None):
         """
         @param parms: Variable names to bind arguments to.
@@ -76,157 +153,811 @@ class Env(dict):
         """
         if var in self:
             return self
-        if self.outer:
+        if self.outer is not None:
             return self.outer.find(var)
         raise Exception(f'Variable "{var}" not found')
 
 
-def standard_env() -> Env:
-    """Create the standard top-level environment (variable namespace) with some Scheme standard procedures."""
-    env = Env()
-    env.update(vars(math)) # sin, cos, sqrt, pi, ...
-    env.update({
-        '+':op.add, '-':op.sub, '*':op.mul, '/':op.truediv, 
-        '>':op.gt, '<':op.lt, '>=':op.ge, '<=':op.le, '=':op.eq, 
-        'abs':     abs,
-        'append':  op.add,  
-        'apply':   lambda proc, args: proc(*args),
-        'begin':   lambda *x: x[-1],
-        'car':     lambda x: x[0],
-        'cdr':     lambda x: x[1:], 
-        'cons':    lambda x,y: [x] + y,
-        'eq?':     op.is_, 
-        'expt':    pow,
-        'equal?':  op.eq, 
-        'length':  len, 
-        'list':    lambda *x: List(x), 
-        'list?':   lambda x: isinstance(x, List), 
-        'map':     lambda *x: list(map(*x)), # Plain python map does nothing unless iterated.
-        'max':     max,
-        'min':     min,
-        'not':     op.not_,
-        'null?':   lambda x: x == [], 
-        'number?': lambda x: isinstance(x, Number),  
-        'print':   print,
-        'procedure?': callable,
-        'round':   round,
-        'symbol?': lambda x: isinstance(x, Symbol),
-    })
-    return env
+class Activation:
+    """
+    The variables of one call to an interpreted Procedure.
+
+    Most procedure bodies only use their parameters, so instead of a whole Env (a dict) per call
+    this holds the Procedure's list of parameter names and a list of the argument values.  Names
+    the body defines go in a dict that is only created when the first define runs.  It has the
+    same find() and item access as an Env, which is all eval() needs.
+    """
+    __slots__ = ('parms', 'args', 'outer', 'defined', 'globals')
+
+    def __init__(self, parms: PythonList[str], args: PythonList, outer):
+        """
+        @param parms: The procedure's parameter names.  This is shared, not copied.
+        @param args: Values for the parameters, in the same order.  The Activation owns this list.
+        @param outer: The environment the procedure was created in.
+        """
+        self.parms = parms
+        self.args = args
+        self.outer = outer
+        self.defined = None
+        self.globals = None if outer is None else outer.globals
+
+    def __contains__(self, var: str) -> bool:
+        return var in self.parms or (self.defined is not None and var in self.defined)
+
+    def find(self, var: str):
+        """Finds the innermost environment where the given name appears."""
+        if var in self.parms or (self.defined is not None and var in self.defined):
+            return self
+        return self.outer.find(var)
+
+    def __getitem__(self, var: str):
+        try:
+            return self.args[self.parms.index(var)]
+        except ValueError:
+            if self.defined is not None and var in self.defined:
+                return self.defined[var]
+            raise KeyError(var) from None
+
+    def __setitem__(self, var: str, value):
+        try:
+            self.args[self.parms.index(var)] = value
+        except ValueError:
+            if self.defined is None:
+                self.defined = {}
+            if var not in self.defined and self.globals is not None:
+                self.globals.shadowed(var)
+            self.defined[var] = value
+
+
+class Cell:
+    """A box holding the value of one global variable.
+
+    Compiled code looks up the Cell for a global name once, at compile time, and afterwards reads
+    and writes the box directly.  A Cell for a name that has not been defined yet has no value
+    attribute at all, so reading it raises AttributeError.
+
+    Code that was optimized on the assumption that a name keeps its value (see ricolisp.optimizer)
+    registers a watcher, whose invalidate() is called when the name is rebound or deleted.
+    """
+    __slots__ = ('name', 'value', 'watchers')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.watchers = None
+
+    def watch(self, watcher):
+        """Call watcher.invalidate() the next time this variable changes.  Watchers are held weakly."""
+        if self.watchers is None:
+            self.watchers = weakref.WeakSet()
+        self.watchers.add(watcher)
+
+    def changed(self):
+        watchers, self.watchers = self.watchers, None
+        for watcher in watchers:
+            watcher.invalidate()
+
+
+class CallSite:
+    """An inline cache for one procedure call in interpreted code, (f args...) where f is a global.
+
+    The first time eval() runs the call, it looks f up the slow way and, if f is global, remembers
+    its Cell, its value and what kind of thing that is, and watches the Cell.  After that the call
+    uses the remembered procedure without looking anything up, until the Cell sees f rebound (or
+    a procedure define a local f) and invalidates the cache, which makes the next call look again.
+    """
+    __slots__ = ('expression', 'cell', 'callee', 'kind', 'hits', 'misses', '__weakref__')
+
+    # Kinds of callee.
+    interpreted = 'procedure' # An interpreted Procedure taking as many arguments as the call passes.
+    primitive = 'primitive'   # Anything else that can be called.
+    macro = 'macro'           # A Macro (see ricolisp.macros): the form is replaced by its expansion.
+    local = 'local'           # f is a local variable here, so the call can't be cached.
+
+    def __init__(self, expression: List):
+        self.expression = expression # Kept so its id isn't reused for another list while this exists.
+        self.cell = None
+        self.callee = None
+        self.kind = None # None until the callee has been looked up, and after the cache is invalidated.
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, env):
+        """Look up the callee for a call being made in env, and cache it if it is global."""
+        self.misses += 1
+        name = self.expression[0]
+        frame = env
+        while type(frame) is Activation:
+            if name in frame:
+                self.kind = CallSite.local
+                return
+            frame = frame.outer
+        if name in env.globals.shadowing:
+            # Some activation has defined the name locally, and another activation running this
+            # site may do so too, after the site was resolved here: look it up every time.
+            self.kind = CallSite.local
+            return
+        if frame is not env.globals or name not in frame:
+            return # Unbound or in an Env of some other kind: leave it to the ordinary lookup.
+        self.cell = frame.cell(name)
+        self.cell.watch(self)
+        self.callee = self.cell.value
+        if type(self.callee) is Procedure and self.callee.code is None and len(self.callee.parms) == len(self.expression) - 1:
+            self.kind = CallSite.interpreted
+        elif type(self.callee) is Macro:
+            self.kind = CallSite.macro
+        else:
+            self.kind = CallSite.primitive
+
+    def invalidate(self):
+        if self.kind is not CallSite.local:
+            self.kind = self.callee = None
+
+    def row(self) -> list:
+        """The site as a lisp list: (operator kind hits misses)."""
+        return [self.expression[0], self.kind or 'unresolved', self.hits, self.misses]
+
+
+class GlobalEnv(Env):
+    """
+    The top-level environment.  It is still a dictionary of names to values, so eval() and
+    Python code can use it like any other Env, but it also hands out a Cell per name for compiled
+    code.  Assigning through the dictionary (env[name] = value, or update()) keeps the cells in step.
+    """
+    max_call_sites = 10000 # Inline caches to keep before starting again, so one-off top-level code can't pile them up.
+    max_quotations = 10000 # Likewise for quoted lists.
+
+    def __init__(self):
+        self.cells = {}
+        self.globals = self
+        self.call_sites = {} # id(call expression) -> CallSite, for eval().
+        self.quotations = {} # id(quote expression) -> (expression, the quoted list as lisp data), for eval().
+        self.shadowing = set() # Names some interpreted procedure has defined locally (see shadowed).
+        self.frozen = False
+        super().__init__()
+
+    def call_site(self, x: List) -> CallSite:
+        """Get the inline cache for a call evaluated with this global environment."""
+        site = self.call_sites.get(id(x))
+        if site is None or site.expression is not x:
+            if len(self.call_sites) >= self.max_call_sites:
+                self.call_sites.clear()
+            site = self.call_sites[id(x)] = CallSite(x)
+        return site
+
+    def quotation(self, x: List):
+        """The lisp list a (quote (...)) evaluated with this global environment gives, made the
+        first time, so it is the same list every time, as it is in compiled code."""
+        cached = self.quotations.get(id(x))
+        if cached is None or cached[0] is not x:
+            if len(self.quotations) >= self.max_quotations:
+                self.quotations.clear()
+            cached = self.quotations[id(x)] = (x, pairs.from_python(x[1])) # Keeping x means its id can't be reused while it is here.
+        return cached[1]
+
+    def shadowed(self, name: str):
+        """Note that a procedure has defined a local variable with a global's name."""
+        self.shadowing.add(name)
+        cell = self.cells.get(name)
+        if cell is not None and cell.watchers:
+            cell.changed()
+
+    def cell(self, name: str) -> Cell:
+        """Get the Cell for a global name, creating it (possibly unbound) if needed."""
+        cell = self.cells.get(name)
+        if cell is None:
+            cell = self.cells[name] = Cell(name)
+            if name in self:
+                cell.value = self[name]
+        return cell
+
+    def overlay(self) -> 'OverlayEnv':
+        """Make a new global environment that starts with everything in this one, without copying it."""
+        return OverlayEnv(self)
+
+    def freeze(self):
+        """Make assigning or deleting a name here raise TypeError from now on.
+
+        Use this on the base of overlays that must not affect each other.  Overlays assign their
+        own names, but procedures defined in the base were compiled against its Cells, so without
+        this a set! inside one of them would change the base for every overlay.
+        """
+        self.frozen = True
+
+    def _frozen(self, name: str) -> TypeError:
+        return TypeError(f'Can\'t change {name}: it belongs to a shared environment, which is frozen')
+
+    def __setitem__(self, name: str, value):
+        if self.frozen:
+            raise self._frozen(name)
+        dict.__setitem__(self, name, value)
+        cell = self.cells.get(name)
+        if cell is not None:
+            cell.value = value
+            if cell.watchers:
+                cell.changed()
+
+    def __delitem__(self, name: str):
+        if self.frozen:
+            raise self._frozen(name)
+        dict.__delitem__(self, name)
+        self._unbind(name)
+
+    def _unbind(self, name: str):
+        cell = self.cells.get(name)
+        if cell is not None:
+            del cell.value
+            if cell.watchers:
+                cell.changed()
+
+    def update(self, *args, **kwargs):
+        for name, value in dict(*args, **kwargs).items():
+            self[name] = value
+
+
+class OverlayEnv(GlobalEnv):
+    """
+    A global environment layered over a shared base, such as the builtins or one with a prelude loaded.
+
+    Making one is O(1): names are read from the base until they are assigned here, and assigning
+    only ever changes the overlay, so the base can be shared by any number of overlays.  The base
+    shouldn't change while overlays are using it, because a name an overlay has already looked up
+    keeps the value it had then.  Deleting a name that is in the base hides it from the overlay.
+    """
+    def __init__(self, base: GlobalEnv):
+        super().__init__()
+        self.base = base
+        self.deleted = set() # Names in the base that have been deleted from the overlay.
+
+    def __missing__(self, name: str):
+        if name in self.deleted:
+            raise KeyError(name)
+        return self.base[name]
+
+    def __contains__(self, name) -> bool:
+        return dict.__contains__(self, name) or (name in self.base and name not in self.deleted)
+
+    def get(self, name: str, default=None):
+        return self[name] if name in self else default
+
+    def __setitem__(self, name: str, value):
+        self.deleted.discard(name)
+        super().__setitem__(name, value)
+
+    def __delitem__(self, name: str):
+        if name not in self:
+            raise KeyError(name)
+        if name in self.base:
+            self.deleted.add(name)
+        if dict.__contains__(self, name):
+            dict.__delitem__(self, name)
+        self._unbind(name)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from dict.__iter__(self)
+        for name in self.base:
+            if not dict.__contains__(self, name) and name not in self.deleted:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+
+class BuiltinEnv(GlobalEnv):
+    """The builtins, shared by every interpreter in the process (see builtin_env), so it can't be changed."""
+    def __setitem__(self, name: str, value):
+        raise TypeError(f'Can\'t set {name}: the builtin environment is shared.  Use an overlay() of it.')
+
+    def __delitem__(self, name: str):
+        raise TypeError(f'Can\'t delete {name}: the builtin environment is shared.')
+
+    def cell(self, name: str) -> Cell:
+        raise TypeError('Compile code against an overlay() of the builtin environment, not the shared one.')
+
+
+_builtins = None
+
+def builtin_env() -> BuiltinEnv:
+    """Get the Scheme standard procedures, math and the other builtins.  They are built the first time this is called."""
+    global _builtins
+    if _builtins is None:
+        from . import data, tables, vectors
+        env = {**vars(math)} # sin, cos, sqrt, pi, ...
+        env.update({
+            '+':op.add, '-':op.sub, '*':op.mul, '/':op.truediv, 
+            '>':op.gt, '<':op.lt, '>=':op.ge, '<=':op.le, '=':op.eq, 
+            'abs':     abs,
+            'append':  pairs.append,
+            'apply':   lambda proc, args: proc(*args),
+            'begin':   lambda *x: x[-1],
+            'car':     pairs.car,
+            'cdr':     pairs.cdr,
+            'cons':    pairs.cons,
+            'eq?':     op.is_, 
+            'expt':    pow,
+            'equal?':  op.eq, 
+            'length':  pairs.length,
+            'list':    pairs.lisp_list,
+            'list?':   pairs.is_list,
+            'map':     pairs.lisp_map,
+            'max':     max,
+            'min':     min,
+            'not':     op.not_,
+            'null?':   pairs.is_null,
+            'number?': lambda x: isinstance(x, Number),  
+            'procedure?': callable,
+            'round':   round,
+            'symbol?': lambda x: isinstance(x, Symbol),
+        })
+        env.update(memo.builtins())
+        env.update(macros.builtins())
+        env.update(ports.builtins())
+        env.update(data.builtins())
+        env.update(tables.builtins())
+        env.update(vectors.builtins()) # Numeric vectors, if NumPy is installed.
+        _builtins = BuiltinEnv()
+        dict.update(_builtins, env)
+    return _builtins
+
+def standard_env() -> GlobalEnv:
+    """Create the standard top-level environment (variable namespace): an overlay of the builtins."""
+    return OverlayEnv(builtin_env())
 
 def eval(x: Exp, env: Env) -> Exp:
     """
     Evaluate an expression in an environment.
+
+    Expressions in tail position (the branches of an if, the last expression of a begin, and the
+    body of a procedure) are evaluated by going around the loop again rather than by calling eval
+    recursively, so tail calls don't use up the Python stack.
     """
-    if diagnostic_trace:
-        print(f'--eval Exp: ', x)
-    if isinstance(x, Symbol):        # variable reference
-        return env.find(x)[x]
+    while True:
+        if isinstance(x, Symbol):        # variable reference
+            return env.find(x)[x]
 
-    if not isinstance(x, List):      # constant number
-        return x
-    
-    op, *args = x
-    if op == 'quote':              # Quote an expression without evaluating it
-        return args[0]
-    
-    if op == 'if':               # conditional
-        (test, conseq, alt) = args
-        result = eval(test,env)
-        if result:
-            exp = conseq
-        else:
-            exp = alt
-        return eval(exp, env)
-
-    if op == 'define':           # definition
-        (symbol, exp) = args
-        env[symbol] = eval(exp, env)
-        return None
-
-    if op == 'set!':             # assignment
-        (symbol, exp) = args
-        value = eval(exp, env)
-        env.find(symbol)[symbol] = value
-        return None
-    
-    if op == 'lambda':           # procedure
-        (parms, body) = args
-        return Procedure(parms, body, env)
-    
-    if op == 'while':
-        (cond, statement) = args
-        result = None
-        while True:
-            conditional_result = eval(cond, env)
-            if not conditional_result:
-                break
-            result = eval(statement, env)
-        return result
+        if not isinstance(x, List):      # constant number
+            return x
+        
+        op = x[0] # Not op, *args = x, which would build a new list every time.
+        if op == 'quote':              # Quote an expression without evaluating it
+            if type(x[1]) is not List:
+                return x[1]
+            return pairs.from_python(x[1]) if env.globals is None else env.globals.quotation(x)
         
-    # Procedure call.
-    proc = eval(x[0], env)
-    args = [eval(arg, env) for arg in x[1:]]
-    if diagnostic_trace:
-        print(f'procedure {x[0]} call with {len(args)} args: ', args)
-    return proc(*args)
+        if op == 'if':               # conditional
+            (_, test, conseq, alt) = x
+            result = eval(test,env)
+            if result:
+                x = conseq
+            else:
+                x = alt
+            continue
+
+        if op == 'define':           # definition
+            (_, symbol, exp) = x
+            env[symbol] = eval(exp, env)
+            return None
+
+        if op == 'define-memo':      # memoized definition
+            x = memo.expand_define_memo(x)
+            continue
+
+        if op == 'define-macro' or op == 'defmacro' or op == 'define-syntax': # macro (see ricolisp.macros)
+            x = expand_macro_definition(x, isinstance(env, GlobalEnv))
+            continue
+
+        if op == 'import' or op == 'require': # module (see ricolisp.modules)
+            from .modules import expand_import
+            x = expand_import(x)
+            continue
+
+        if op == 'set!':             # assignment
+            (_, symbol, exp) = x
+            value = eval(exp, env)
+            env.find(symbol)[symbol] = value
+            return None
+        
+        if op == 'lambda':           # procedure
+            (_, parms, body) = x
+            return Procedure(parms, body, env)
+        
+        if op == 'while':
+            (_, cond, statement) = x
+            result = None
+            while True:
+                try:
+                    tick() # Burn fuel for each iteration (see ricolisp.limits).
+                except IndexError:
+                    refuel()
+                conditional_result = eval(cond, env)
+                if not conditional_result:
+                    break
+                result = eval(statement, env)
+            return result
+
+        if op == 'begin':            # sequence
+            if len(x) == 1:
+                return None
+            for exp in x[1:-1]:
+                eval(exp, env)
+            x = x[-1]
+            continue
+            
+        # Procedure call.
+        kind = None
+        if type(op) is str and env.globals is not None:
+            site = env.globals.call_site(x)
+            kind = site.kind
+            if kind is None:
+                site.resolve(env)
+                kind = site.kind
+            elif kind is CallSite.local:
+                site.misses += 1
+            else:
+                site.hits += 1
+        if kind is None or kind is CallSite.local:
+            proc = eval(op, env)
+        else:
+            proc = site.callee # The inline cache saves looking it up.
+        if type(proc) is Macro:
+            x = proc.expand(x) # Cached, so this only runs the macro the first time.
+            continue
+        args = [eval(arg, env) for arg in x[1:]]
+        if kind is CallSite.interpreted:
+            # Already known to be an interpreted Procedure with the right number of parameters.
+            try:
+                tick() # Burn fuel for each body we run (see ricolisp.limits).
+            except IndexError:
+                refuel()
+            x = proc.body
+            env = Activation(proc.parms, args, proc.env)
+            continue
+        if kind is not CallSite.primitive and isinstance(proc, Procedure) and proc.code is None:
+            # Run the body here instead of through proc(), which would call eval again.
+            try:
+                tick()
+            except IndexError:
+                refuel()
+            x = proc.body
+            env = proc.activation(args)
+            continue
+        return proc(*args)
 
 def unparse(exp):
     """Convert a Python object back into a lisp parsable string.
 
-    This will for example convert [1,2,3] into '(1,2,3)'.
+    This will for example convert [1,2,3] or the lisp list (list 1 2 3) into '(1 2 3)'.
     """
-    if isinstance(exp, List):
-        return '(' + ' '.join(map(unparse, exp)) + ')' 
-    else:
-        return str(exp)
+    if not isinstance(exp, (List, Pair, LazyList)):
+        return '()' if exp is nil else str(exp)
+    pieces = []
+    write_value(exp, pieces.append)
+    return ''.join(pieces)
+
+
+class TailCall:
+    """A call that compiled code left for Procedure.__call__ to make, so the Python stack doesn't grow."""
+    __slots__ = ('proc', 'args')
+
+    def __init__(self, proc: 'Procedure', args: tuple):
+        self.proc = proc
+        self.args = args
 
 
 class Procedure:
     """A user-defined procedure with variable name bindings.
     """
-    def __init__(self, parms, body, env):
+    __slots__ = ('parms', 'body', 'env', 'code')
+
+    def __init__(self, parms, body, env, code=None):
         """
         @param pams: A sequence of names that will be used in the procedure.
         @param body: Parsed code forming the body of this procedure.
-        @param env: The environment (closure) this procedure runs in.
+        @param env: The environment (closure) this procedure runs in.  For compiled procedures this is
+        the enclosing frame list rather than an Env.
+        @param code: The Lambda made by ricolisp.compiler for this procedure, or None to interpret
+        the body with eval().
         """
         self.parms = parms
         self.body = body
         self.env = env
+        self.code = code
+
+    def activation(self, args: PythonList) -> Activation:
+        """Create the environment for one call of an interpreted procedure."""
+        if len(args) != len(self.parms):
+            raise TypeError(f'procedure expected {len(self.parms)} arguments, got {len(args)}')
+        return Activation(self.parms, args, self.env)
     
     def __call__(self, *args):
-        # Create an environment with bindings for this one invocation.
-        env = Env(self.parms, args, self.env)
-        return eval(self.body, env)   
+        code = self.code
+        proc = self
+        while True:
+            if code is None:
+                try:
+                    tick() # Burn fuel for each body we run (see ricolisp.limits).
+                except IndexError:
+                    refuel()
+                return eval(proc.body, proc.activation(list(args)))
+            if len(args) != code.nparms:
+                raise TypeError(f'procedure expected {code.nparms} arguments, got {len(args)}')
+            native = code.native
+            if native is not None:
+                result = native(proc.env, *args) # The body translated to Python (see ricolisp.jit), which burns its own fuel.
+            else:
+                try:
+                    tick()
+                except IndexError:
+                    refuel()
+                code.countdown -= 1
+                if not code.countdown:
+                    code.jit.tier_up(code) # It's hot: translate it, for the calls after this one.
+                # Compiled procedures keep their variables in a list: the enclosing frame, then the
+                # arguments, then a slot for each name the body defines.
+                result = code.body([proc.env, *args, *code.locals])
+            if type(result) is not TailCall:
+                return result
+            # The body ended by calling another procedure: run it here, in the same Python frame.
+            proc, args = result.proc, result.args
+            code = proc.code
 
 class Console:
     """A terminal to read input and print things.
 
     Make your own implementation of the public methods here to make a repl work with other kinds of devices.
     """
+    def __init__(self, output: OutputPort = None):
+        """
+        @param output: Where print() writes.  Defaults to the stdout port.
+        """
+        self.output = ports.stdout if output is None else output
+
     def input(self, prompt: str):
         """Display a prompt to the console and await input."""
+        self.flush()
+        return self.read(prompt)
+
+    def flush(self):
+        """Write out what has been printed, so it shows up before the prompt."""
+        self.output.flush()
+
+    def read(self, prompt: str):
+        """Display a prompt and await input, without touching the output port, so it can be called
+        from another thread while tasks keep printing (see LispInterpreter.repl_async)."""
         return input(prompt)
     
     def print(self, value):
         """Print output to the console."""
         if value is not None:
-            print(unparse(value))
+            self.output.write_value(value)
+            self.output.write('\n')
 
 stdio_console = Console() # Singleton for the console attached to stdio.
 
 class LispInterpreter:
-    def __init__(self):
-        self.env = standard_env() # The top-level global environment for this interpreter.
+    engines = ('compile', 'eval', 'vm')
+
+    def __init__(self, engine: str = 'compile', profile: bool = False, optimize: bool = True, env: GlobalEnv = None,
+            output: OutputPort = None, jit: bool = True, trace: bool = False):
+        """
+        @param engine: How to execute code.  'compile' turns each expression into closures before
+        running it (see ricolisp.compiler); 'vm' compiles to bytecode for a stack machine (see
+        ricolisp.vm); 'eval' walks the expression tree directly, and is kept as the simple
+        reference implementation.
+        @param profile: Collect call counts, times and node counts for each procedure and primitive
+        into self.profiler (see ricolisp.profiler).  This needs the 'compile' engine.
+        @param optimize: Fold constant expressions and inline arithmetic on builtins (see
+        ricolisp.optimizer).  This applies to the 'compile' engine, and is off while profiling so
+        that the report shows every call to a primitive.
+        @param env: The global environment to use, for example an overlay of a shared one (see
+        GlobalEnv.overlay).  By default a new standard_env() is made.
+        @param output: The port print and display write to while this interpreter runs code (see
+        ricolisp.ports).  By default the stdout port.
+        @param jit: Translate procedures that have been called often into Python functions (see
+        ricolisp.jit).  This applies to the 'compile' engine, and is off while profiling.
+        @param trace: Record each procedure call and run into self.tracer, a timeline that can be
+        saved for a trace viewer (see ricolisp.tracing).  This needs the 'compile' engine.
+        """
+        if engine not in self.engines:
+            raise ValueError(f'Unknown engine "{engine}", expected one of {self.engines}')
+        if profile and engine != 'compile':
+            raise ValueError(f'Profiling needs the compile engine, not "{engine}"')
+        if trace and engine != 'compile':
+            raise ValueError(f'Tracing needs the compile engine, not "{engine}"')
+        self.engine = engine
+        self.env = standard_env() if env is None else env # The top-level global environment for this interpreter.
+        self.output = ports.stdout if output is None else output
+        self.profiler = None
+        if profile:
+            from .profiler import Profiler
+            self.profiler = Profiler()
+        self.tracer = None
+        if trace:
+            from .tracing import Tracer
+            self.tracer = Tracer()
+        self.pool = None # The ricolisp.parallel.Pool for pmap, made when it is first used.
+        self.modules = None # The ricolisp.modules.ModuleLoader for import and require, made when it is first used.
+        self.directory = None # Where relative import paths start from: the directory of the file being run.
+        # Builtins bound to this interpreter, on top of the shared ones from builtin_env().
+        self.builtins = {
+            'profile-report': lambda: pairs.from_python(self.profile_report()),
+            'call-site-report': lambda: pairs.from_python(self.call_site_report()),
+            'macro-report':   lambda: pairs.from_python(self.macro_report()),
+            'macroexpand':    lambda form: pairs.from_python(self.macroexpand(pairs.to_python(form))),
+            'jit-source':     lambda proc: self.jit_source(proc),
+            'trace-save':     lambda path: self.save_trace(path.strip('"')),
+            'pmap':           lambda proc, items, chunk_size=None: pairs.make_list(self.pmap(proc, items, chunk_size)),
+            'import-module':  lambda path, prefix=None: self.module_loader().import_module(self, path, prefix),
+            'require-module': lambda path: self.module_loader().require_module(self, path),
+        }
+        if engine == 'compile':
+            from .compiler import Compiler
+            optimizer = None
+            if optimize and not profile:
+                from .optimizer import Optimizer
+                optimizer = Optimizer(self.env)
+            self.compiler = Compiler(self.env, self.profiler, optimizer, jit and not profile, self.tracer)
+        elif engine == 'vm':
+            from .vm import BytecodeCompiler
+            self.compiler = BytecodeCompiler(self.env)
+        from .tasks import Scheduler
+        self.scheduler = Scheduler(self.env, self.compiler if engine == 'vm' else None)
+        self.builtins.update(self.scheduler.builtins())
+        self.env.update(self.builtins)
+
+    def module_loader(self):
+        """Get the ricolisp.modules.ModuleLoader that runs this interpreter's imports."""
+        if self.modules is None:
+            from .modules import ModuleLoader
+            self.modules = ModuleLoader(self)
+        return self.modules
+
+    def pmap(self, proc, items, chunk_size: int = None) -> list:
+        """Call a procedure on each item, splitting the work across processes, and return the results.
+
+        The procedure should be pure.  See ricolisp.parallel for how it is sent to the workers.
+        @param chunk_size: How many items to send to a worker process at a time.
+        """
+        if self.pool is None:
+            from .parallel import Pool
+            self.pool = Pool(self.env)
+        return self.pool.map(proc, items, chunk_size)
+
+    def close(self):
+        """Stop any worker processes this interpreter started."""
+        if self.pool is not None:
+            self.pool.shutdown()
 
-    def run(self, source_code: str):
+    def run(self, source_code: str, budget: Budget = None):
         """
         Parse some code, execute it, and return the result.
+
+        @param budget: Limits on the steps, time and list cells the code may use, for code you
+        don't trust (see ricolisp.limits).  Going over one raises ResourceExhausted.
         """
         expression = parse(source_code)
-        return eval(expression, self.env)
+        with output_to(self.output), metered(budget), traced(self.tracer, 'run'):
+            return self.execute(expression)
+
+    def execute(self, expression: Exp):
+        """Execute an expression that has already been parsed, and return the result."""
+        if type(expression) is List and expression and expression[0] == 'begin':
+            # Run a top-level begin one form at a time, so a macro one form defines is defined
+            # before the forms after it are compiled.
+            result = None
+            for exp in expression[1:]:
+                result = self.execute(exp)
+            return result
+        if self.engine == 'eval':
+            return eval(expression, self.env)
+        code = self.compiler.compile(expression)
+        if self.profiler:
+            return self.profiler.timed(self.profiler.top_level, code, None)
+        return code(None)
+
+    def profile_report(self) -> PythonList[PythonList]:
+        """
+        Get what the profiler has collected, most expensive first, as a list of
+        (name kind calls inclusive-ms exclusive-ms nodes) lists.  This is the (profile-report) builtin.
+        It is empty unless the interpreter was created with profile=True.
+        """
+        if self.profiler is None:
+            return []
+        return [entry.row() for entry in self.profiler.report()]
+
+    def call_site_report(self) -> PythonList[PythonList]:
+        """
+        Get the inline caches of the calls eval() has made, busiest first, as a list of
+        (operator kind hits misses) lists.  This is the (call-site-report) builtin.  Only the 'eval'
+        engine has them: the compilers look up global procedures' Cells once, at compile time.
+        """
+        sites = sorted(self.env.call_sites.values(), key=lambda site: site.hits + site.misses, reverse=True)
+        return [site.row() for site in sites]
+
+    def macro_report(self) -> PythonList[PythonList]:
+        """
+        Get how much work each macro has done, as a list of (name expansions hits ms) lists, the
+        macros that took longest to expand first.  Hits are uses that found their expansion
+        already cached.  This is the (macro-report) builtin.
+        """
+        macros = [value for value in self.env.values() if type(value) is Macro]
+        return [macro.report() for macro in sorted(macros, key=lambda macro: macro.seconds, reverse=True)]
+
+    def macroexpand(self, x: Exp) -> Exp:
+        """Expand x, if it is a use of a global macro, until it isn't.  This is the (macroexpand form) builtin."""
+        while isinstance(x, List) and x and isinstance(x[0], Symbol) and type(self.env.get(x[0])) is Macro:
+            x = self.env[x[0]].expand(x)
+        return x
+
+    def save_trace(self, path: str):
+        """
+        Write what the tracer has recorded to a file in the Chrome Trace Event Format, for
+        chrome://tracing or Perfetto.  This is the (trace-save path) builtin.  It needs trace=True.
+        """
+        if self.tracer is None:
+            raise ValueError('This interpreter is not tracing: make it with LispInterpreter(trace=True)')
+        self.tracer.save(path)
+
+    def jit_source(self, proc: Procedure) -> Optional[str]:
+        """
+        Get the Python source a procedure's body was translated into, or a comment saying why it
+        hasn't been, for debugging.  This is the (jit-source proc) builtin.  It is None if the
+        procedure isn't one the Jit looks at: with jit=False, or an engine other than 'compile'.
+        """
+        code = getattr(proc, 'code', None)
+        if code is None or code.jit is None:
+            return None
+        return code.jit.source(code)
+
+    def run_stream(self, source, budget: Budget = None):
+        """
+        Execute every top-level expression in a source as it is read, and return the last result.
+
+        @param source: A string, a file object, or an iterable of strings.
+        @param budget: Limits for the whole source, as for run().
+        """
+        result = None
+        with output_to(self.output), metered(budget), traced(self.tracer, 'run'):
+            for expression in read(source):
+                result = self.execute(expression)
+        return result
+
+    def run_file(self, filename: str, budget: Budget = None):
+        """Execute a file of lisp code, and return the result of the last expression in it."""
+        directory, self.directory = self.directory, os.path.dirname(os.path.abspath(filename))
+        try:
+            with open(filename) as f:
+                return self.run_stream(f, budget)
+        finally:
+            self.directory = directory
     
+    async def repl_async(self, prompt: str = '> ', console: Console = stdio_console):
+        """Like repl(), but tasks (see ricolisp.tasks) keep running in the background while it waits for input.
+
+            asyncio.run(lisp.repl_async())
+        """
+        import asyncio
+        background = asyncio.ensure_future(self.scheduler.run_async())
+        try:
+            while True:
+                # Ports aren't thread-safe, so flush here, on the thread the tasks print from, and
+                # only wait for input on the other one.
+                console.flush()
+                text = await asyncio.to_thread(console.read, prompt)
+                if text == 'exit':
+                    break
+                console.print(self.run(text))
+        finally:
+            background.cancel()
+
     def repl(self, prompt:str = '> ', console: Console = stdio_console):
         """Start a read-eval-print loop with the given console device."""
         while True:
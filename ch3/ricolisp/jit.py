@@ -0,0 +1,544 @@
+"""Tiered compilation: translate hot compiled procedures into Python functions.
+
+The closures made by ricolisp.compiler still cost a Python call per node: (+ a b) runs three
+closures and a call to op.add.  Once a Lambda has been called threshold times, the Jit translates
+its body into Python source and builds a function from it with compile() and exec, so the same
+body runs as ordinary Python bytecode:
+
+    (define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))
+
+becomes
+
+    def fib(_f, n):
+        try:
+            while True:
+                ...                # Burn fuel.
+                if (n < 2):
+                    return n
+                else:
+                    return (_self(None, (n - 1)) + _self(None, (n - 2)))
+        except AttributeError as _error:
+            raise _variable_error(_error) from None
+
+Parameters and the names the body defines are Python locals, and _f is the frame the procedure
+was made in, for the variables it closes over.  if and while become Python if and while.  Calls
+to builtins call the builtin directly, and arithmetic and comparisons on the standard builtins are
+written as Python operators.  A call the procedure makes to itself through its global name calls
+the Python function directly, or in tail position loops back to the top of it.  Other calls in
+tail position return a TailCall, as compiled code does, so tail calls still run in constant stack.
+
+Procedure.__call__ counts the calls of each Lambda and runs the function once there is one, and
+the function burns fuel for limits the way compiled code does.  Only calls count, so a procedure
+called once that loops for a long time runs as closures throughout.  Bodies that use something the
+translator doesn't handle, such as lambda, define-memo or import, just stay as closures.
+
+Like the optimizer's, the translation bets that the builtins it calls, and the procedure it calls
+itself through, keep their values.  The Cells of those names are watched, and rebinding one of them
+drops the function, so the next calls run the closures again until the Lambda is hot once more.
+A call already running the Python function finishes with it.
+
+The generated source is kept for debugging: LispInterpreter.jit_source() and (jit-source proc)
+return it, and tracebacks through it show its lines.  LispInterpreter(jit=False) turns all this off.
+"""
+import itertools
+import keyword
+import linecache
+import math
+import operator as op
+import re
+from typing import Dict, List as PythonList, Optional, Tuple
+
+from . import limits, pairs
+from .compiler import Lambda, Scope, unassigned
+from .interpreter import Cell, Exp, GlobalEnv, List, Procedure, Symbol, TailCall
+from .limits import burn, refuel, tick
+from .macros import Macro
+from .optimizer import pure_builtins
+
+threshold = 1000 # Calls of a Lambda before it is translated.
+
+# Builtins that are written as Python operators: builtin -> (number of arguments, format).
+operators = {
+    op.add:     (2, '({} + {})'),
+    op.sub:     (2, '({} - {})'),
+    op.mul:     (2, '({} * {})'),
+    op.truediv: (2, '({} / {})'),
+    op.gt:      (2, '({} > {})'),
+    op.lt:      (2, '({} < {})'),
+    op.ge:      (2, '({} >= {})'),
+    op.le:      (2, '({} <= {})'),
+    op.eq:      (2, '({} == {})'),
+    op.not_:    (1, '(not {})'),
+}
+
+# The special forms the translator handles.  Any other special form leaves the body as closures.
+translated_forms = ('quote', 'if', 'define', 'set!', 'while', 'begin')
+
+_missing = object()
+_files = itertools.count(1)
+
+
+class Unsupported(Exception):
+    """The body uses something the translator doesn't handle."""
+
+
+def variable_error(error: AttributeError) -> Exception:
+    """The error to raise for an AttributeError from generated code: reading a global Cell with no
+    value means the variable isn't defined, as compiled code reports it."""
+    if type(getattr(error, 'obj', None)) is Cell and error.name == 'value':
+        return Exception(f'Variable "{error.obj.name}" not found')
+    return error
+
+
+def set_global(env: GlobalEnv, name: Symbol, value):
+    """set! of a global."""
+    if name not in env:
+        raise Exception(f'Variable "{name}" not found')
+    env[name] = value
+
+
+def python_name(name: str, used: set) -> str:
+    """A Python identifier for a lisp name that isn't in used.  It never starts with _, which the
+    generated code keeps for its own names."""
+    candidate = re.sub(r'\W', '_', name).strip('_')
+    if not candidate.isidentifier():
+        candidate = 'v_' + candidate
+    while candidate in used or keyword.iskeyword(candidate):
+        candidate += '_'
+    used.add(candidate)
+    return candidate
+
+
+class NativeCode:
+    """A Lambda's body translated to a Python function.
+
+    Cells whose values the translation relies on watch this, so it is also what gets invalidated.
+    """
+    __slots__ = ('lam', 'jit', 'source', 'filename', 'function', '__weakref__')
+
+    def __init__(self, lam: Lambda, jit: 'Jit'):
+        self.lam = lam
+        self.jit = jit
+        self.source = None
+        self.filename = f'<jit-{next(_files)} {lam.name}>'
+        self.function = None
+
+    def invalidate(self):
+        """A global the translation relied on has changed: go back to running the closures."""
+        if self.function is not None and self.lam.native is self.function:
+            self.lam.native = None
+            self.lam.countdown = self.jit.threshold # Translate it again if it gets hot again.
+            linecache.cache.pop(self.filename, None)
+
+
+class Jit:
+    """Translates the Lambdas a Compiler makes once they are hot."""
+    def __init__(self, env: GlobalEnv, special_forms, threshold: int = threshold, tracer: 'Tracer' = None):
+        """
+        @param env: The global environment the code runs in.
+        @param special_forms: The names the Compiler treats as special forms.
+        @param threshold: How many calls make a Lambda hot.  Lambdas made afterwards use a new value.
+        @param tracer: If given, the functions record their calls on this ricolisp.tracing.Tracer,
+        as the Compiler's traced procedure bodies do.
+        """
+        self.env = env
+        self.special_forms = special_forms
+        self.threshold = threshold
+        self.tracer = tracer
+        self.rejected: Dict[int, Tuple[Lambda, str]] = {} # id(Lambda) -> (Lambda, why it wasn't translated).
+
+    def tier_up(self, lam: Lambda):
+        """Translate a hot Lambda, so that Procedure.__call__ runs the Python function from now on."""
+        try:
+            native = Translator(self, lam).translate()
+        except Unsupported as e:
+            self.rejected[id(lam)] = (lam, str(e))
+            return
+        lam.native = native.function
+
+    def source(self, lam: Lambda) -> Optional[str]:
+        """The Python source of a Lambda's translation, or a comment saying why there isn't one."""
+        if lam.native is not None:
+            return lam.native.native_code.source
+        lam_rejected, reason = self.rejected.get(id(lam), (None, None))
+        if lam_rejected is lam:
+            return f'# {lam.name} is not translated: {reason}'
+        return f'# {lam.name} is not translated yet: {max(lam.countdown, 0)} more calls to go'
+
+
+class Translator:
+    """Writes the Python source for one Lambda."""
+    def __init__(self, jit: Jit, lam: Lambda):
+        self.jit = jit
+        self.env = jit.env
+        self.lam = lam
+        self.scope: Scope = lam.scope
+        self.native = NativeCode(lam, jit)
+        self.namespace = {
+            '_Procedure': Procedure, '_TailCall': TailCall, '_type': type, '_unassigned': unassigned,
+            '_tick': tick, '_refuel': refuel, '_burn': burn, '_lap': limits.lap,
+            '_variable_error': variable_error, '_set_global': set_global, '_env': self.env,
+        }
+        self.constants = {} # id(value) -> name in the namespace, for values used as constants.
+        used = set()
+        self.locals = {name: python_name(name, used) for name in self.scope.slots}
+        self.function_name = python_name(lam.name, used)
+        self.lines: PythonList[str] = []
+        self.depth = 0 # Indentation.
+        self.temps = itertools.count(1)
+        self.assigned = set(lam.parms) # Local names certain to have a value by now.
+        self.self_procedure = None # The Procedure the body calls itself through, if it does.
+        self.tail_calls = False # Whether the function can return a TailCall.
+
+    def translate(self) -> NativeCode:
+        lam = self.lam
+        defined = [self.locals[name] for name in self.scope.slots if name in self.scope.defined]
+        self.emit(f'def {self.function_name}(_f{"".join(", " + self.locals[p] for p in lam.parms)}):')
+        self.depth += 1
+        self.emit('try:')
+        self.depth += 1
+        self.emit('while True:') # Calls the procedure makes to itself in tail position continue this loop.
+        self.depth += 1
+        self.emit('try:')
+        self.emit('    _tick()')
+        self.emit('except IndexError:')
+        self.emit('    _refuel()')
+        if defined:
+            self.emit(f'{" = ".join(defined)} = _unassigned')
+        tracer = self.jit.tracer
+        if tracer is None:
+            self.statement(lam.source, 'return')
+        else:
+            name = self.constant(lam.name, 'name')
+            self.namespace.update(_enter=tracer.enter, _exit=tracer.exit)
+            self.emit(f'_enter({name})')
+            self.emit('try:')
+            self.block(lam.source, 'return')
+            self.emit('finally:')
+            self.emit(f'    _exit({name})')
+        self.depth -= 2
+        self.emit('except AttributeError as _error:')
+        self.emit('    raise _variable_error(_error) from None')
+        source = '\n'.join(self.lines) + '\n'
+
+        native = self.native
+        try:
+            exec(compile(source, native.filename, 'exec'), self.namespace)
+        except (SyntaxError, RecursionError, MemoryError) as e:
+            raise Unsupported(f'Python could not compile the translation: {e}') from None
+        function = self.namespace[self.function_name]
+        if self.self_procedure is None:
+            pass
+        elif self.tail_calls: # The function may return a TailCall, so calls to itself have to go through the trampoline.
+            proc = self.self_procedure
+            self.namespace['_self'] = lambda _f, *args: proc(*args)
+        else:
+            self.namespace['_self'] = function
+        function.native_code = native
+        native.source = source
+        native.function = function
+        linecache.cache[native.filename] = (len(source), None, source.splitlines(True), native.filename)
+        return native
+
+    # -- Writing lines.
+
+    def emit(self, line: str):
+        self.lines.append('    ' * self.depth + line)
+
+    def block(self, x: Exp, target: Optional[str]):
+        """Emit x indented, as the body of an if, else or while."""
+        self.depth += 1
+        count = len(self.lines)
+        self.statement(x, target)
+        if len(self.lines) == count:
+            self.emit('pass')
+        self.depth -= 1
+
+    def temp(self) -> str:
+        return f'_t{next(self.temps)}'
+
+    def constant(self, value, hint: str = 'k') -> str:
+        """The name of a value put into the function's namespace."""
+        name = self.constants.get(id(value))
+        if name is None:
+            name = '_' + (re.sub(r'\W', '_', hint).strip('_') or 'k')
+            while name in self.namespace:
+                name += '_'
+            self.namespace[name] = value
+            self.constants[id(value)] = name
+        return name
+
+    def literal(self, value) -> str:
+        if value is None or (type(value) in (int, float) and math.isfinite(value)):
+            return repr(value)
+        return self.constant(value)
+
+    def finish(self, value: str, target: Optional[str]):
+        """Do what target says with the value of an expression: 'return' it, assign it to the
+        variable target names, or, if target is None, just evaluate it."""
+        if target == 'return':
+            self.emit(f'return {value}')
+        elif target is not None:
+            self.emit(f'{target} = {value}')
+        elif not re.fullmatch(r'[\w.+-]+', value) or '.value' in value:
+            self.emit(value) # Reading a local or a constant does nothing, but reading a global can fail.
+
+    # -- Variables.
+
+    def is_global(self, name: Symbol) -> bool:
+        scope = self.scope
+        while scope is not None:
+            if name in scope.slots:
+                return False
+            scope = scope.outer
+        return True
+
+    def slot(self, name: Symbol, scope: Optional[Scope], depth: int) -> Tuple[Optional[Scope], int, Optional[str]]:
+        """Find the scope defining name, from scope outwards, and the Python for its variable."""
+        while scope is not None and name not in scope.slots:
+            scope, depth = scope.outer, depth + 1
+        if scope is None:
+            return None, depth, None
+        if depth == 0:
+            return scope, depth, self.locals[name]
+        return scope, depth, '_f' + '[0]' * (depth - 1) + f'[{scope.slots[name]}]'
+
+    def read(self, name: Symbol, scope: Optional[Scope] = _missing, depth: int = 0) -> str:
+        scope, depth, variable = self.slot(name, self.scope if scope is _missing else scope, depth)
+        if scope is None:
+            return f'{self.constant(self.env.cell(name), "g_" + name)}.value'
+        if name not in scope.defined or (depth == 0 and name in self.assigned):
+            return variable
+        # Until the body runs its define, the name still refers to whatever it meant outside.
+        outside = self.read(name, scope.outer, depth + 1)
+        if depth == 0:
+            return f'({variable} if {variable} is not _unassigned else {outside})'
+        t = self.temp()
+        return f'({t} if ({t} := {variable}) is not _unassigned else {outside})'
+
+    def assign(self, name: Symbol, value: str, scope: Optional[Scope] = _missing, depth: int = 0):
+        scope, depth, variable = self.slot(name, self.scope if scope is _missing else scope, depth)
+        if scope is None:
+            self.emit(f'_set_global(_env, {name!r}, {value})')
+        elif name not in scope.defined or (depth == 0 and name in self.assigned):
+            self.emit(f'{variable} = {value}')
+        else:
+            self.emit(f'if {variable} is _unassigned:')
+            self.depth += 1
+            self.assign(name, value, scope.outer, depth + 1)
+            self.depth -= 1
+            self.emit('else:')
+            self.emit(f'    {variable} = {value}')
+
+    # -- Expressions.
+
+    def special_form(self, x: Exp) -> Optional[Symbol]:
+        """The special form x is, if it is one, after expanding any macro use."""
+        if not isinstance(x, List) or not x or not isinstance(x[0], Symbol):
+            return None
+        if x[0] in translated_forms:
+            return x[0]
+        if x[0] in self.jit.special_forms:
+            raise Unsupported(f'{x[0]} is not translated')
+        return None
+
+    def macro(self, x: Exp) -> Optional[Macro]:
+        if isinstance(x, List) and x and isinstance(x[0], Symbol) and self.is_global(x[0]):
+            value = self.env.get(x[0])
+            if type(value) is Macro:
+                return value
+        return None
+
+    def expression(self, x: Exp) -> Optional[str]:
+        """A Python expression for x, or None if x needs statements."""
+        if isinstance(x, Symbol):
+            return self.read(x)
+        if not isinstance(x, List):
+            return self.literal(x)
+        if not x:
+            raise Unsupported('() is not a valid expression')
+        form = self.special_form(x)
+        if form == 'quote':
+            return self.constant(pairs.from_python(x[1]))
+        if form == 'if':
+            parts = [self.expression(part) for part in x[1:]]
+            return None if None in parts else f'({parts[1]} if {parts[0]} else {parts[2]})'
+        if form is not None:
+            return None
+        macro = self.macro(x)
+        if macro is not None:
+            return self.expression(macro.expand(x))
+        inline = self.operator(x)
+        if inline is not None:
+            operands = [self.expression(arg) for arg in x[1:]]
+            return None if None in operands else inline.format(*operands)
+        callee, env, _ = self.callee(x)
+        operands = [self.expression(arg) for arg in x[1:]]
+        if callee is None or None in operands:
+            return None
+        return f'{callee}({", ".join(env + operands)})'
+
+    def operands(self, xs: list) -> PythonList[str]:
+        """Python expressions for the values of xs, evaluated in order.  If any of them needs
+        statements, they are all evaluated into temporary variables first."""
+        expressions = [self.expression(x) for x in xs]
+        if None not in expressions:
+            return expressions
+        temps = []
+        for x in xs:
+            temps.append(self.temp())
+            self.statement(x, temps[-1])
+        return temps
+
+    def operator(self, x: List) -> Optional[str]:
+        """The format for a call that can be written as a Python operator, if x is one."""
+        name = x[0]
+        if not isinstance(name, Symbol) or not self.is_global(name):
+            return None
+        cell = self.env.cell(name)
+        value = getattr(cell, 'value', None)
+        if value is None or pure_builtins().get(name) is not value or value not in operators:
+            return None
+        nargs, format = operators[value]
+        if nargs != len(x) - 1:
+            return None
+        cell.watch(self.native)
+        return format
+
+    def callee(self, x: List) -> Tuple[Optional[str], PythonList[str], bool]:
+        """A Python expression for the procedure x calls, any arguments to pass before x's own, and
+        whether the expression is a constant, so it doesn't matter when it is evaluated.
+
+        The expression is None if the procedure needs statements to evaluate."""
+        name = x[0]
+        if not isinstance(name, Symbol) or not self.is_global(name):
+            return self.expression(name), [], False
+        cell = self.env.cell(name)
+        value = getattr(cell, 'value', None)
+        if self.is_self(value, len(x) - 1):
+            cell.watch(self.native)
+            self.self_procedure = value
+            return '_self', [self.self_env(value)], True
+        if callable(value) and type(value) not in (Procedure, Macro):
+            cell.watch(self.native)
+            hint = name if re.search(r'\w', name) else getattr(value, '__name__', 'k')
+            return self.constant(value, hint), [], True # A builtin: call it directly.
+        return self.read(name), [], False
+
+    def is_self(self, value, nargs: int) -> bool:
+        return type(value) is Procedure and value.code is self.lam and nargs == self.lam.nparms
+
+    def self_env(self, proc: Procedure) -> str:
+        return 'None' if proc.env is None else self.constant(proc.env, 'self_env')
+
+    # -- Statements.
+
+    def statement(self, x: Exp, target: Optional[str]):
+        """Emit the statements that run x.  See finish() for target."""
+        form = self.special_form(x)
+        if form is None:
+            macro = self.macro(x)
+            if macro is not None:
+                return self.statement(macro.expand(x), target)
+            if target == 'return' and isinstance(x, List) and x:
+                return self.tail_call(x)
+            value = self.expression(x)
+            if value is None:
+                value = self.call(x)
+            return self.finish(value, target)
+        if form == 'quote':
+            return self.finish(self.expression(x), target)
+        if form == 'if':
+            (test,) = self.operands([x[1]])
+            before = set(self.assigned)
+            self.emit(f'if {test}:')
+            self.block(x[2], target)
+            assigned, self.assigned = self.assigned, before
+            self.emit('else:')
+            self.block(x[3], target)
+            self.assigned &= assigned
+            return
+        if form == 'begin':
+            if len(x) == 1:
+                return self.finish('None', target)
+            for exp in x[1:-1]:
+                self.statement(exp, None)
+            return self.statement(x[-1], target)
+        if form == 'define':
+            variable = self.locals[x[1]]
+            self.statement(x[2], variable)
+            self.assigned.add(x[1])
+            return self.finish('None', target)
+        if form == 'set!':
+            (value,) = self.operands([x[2]])
+            self.assign(x[1], value)
+            return self.finish('None', target)
+        if form == 'while':
+            return self.while_loop(x, target)
+
+    def call(self, x: List) -> str:
+        """An expression for a call whose operands need statements to evaluate first."""
+        inline = self.operator(x)
+        if inline is not None:
+            return inline.format(*self.operands(x[1:]))
+        callee, env, constant = self.callee(x)
+        if constant:
+            operands = self.operands(x[1:])
+        else: # The procedure has to be evaluated before the operands.
+            callee, *operands = self.operands(x)
+        return f'{callee}({", ".join(env + operands)})'
+
+    def tail_call(self, x: List):
+        """Emit a call in tail position."""
+        name = x[0]
+        if isinstance(name, Symbol) and self.is_global(name):
+            value = getattr(self.env.cell(name), 'value', None)
+            if self.is_self(value, len(x) - 1):
+                # Call ourselves by going round the loop again with the new arguments.
+                self.env.cell(name).watch(self.native)
+                operands = self.operands(x[1:])
+                parms = ''.join(', ' + self.locals[p] for p in self.lam.parms)
+                self.emit(f'_f{parms} = {self.self_env(value)}{"".join(", " + o for o in operands)}')
+                self.emit('continue')
+                return
+            if callable(value) and type(value) not in (Procedure, Macro):
+                value = self.expression(x)
+                return self.finish(self.call(x) if value is None else value, 'return')
+        callee, *operands = self.operands(x)
+        args = ', '.join(operands)
+        p = self.temp()
+        self.emit(f'{p} = {callee}')
+        self.emit(f'if _type({p}) is _Procedure:')
+        self.emit(f'    return _TailCall({p}, ({args}{"," if len(operands) == 1 else ""}))')
+        self.emit(f'return {p}({args})')
+        self.tail_calls = True
+
+    def while_loop(self, x: List, target: Optional[str]):
+        result = None
+        if target is not None:
+            result = self.temp()
+            self.emit(f'{result} = None')
+        laps = self.temp()
+        self.emit(f'{laps} = 0')
+        before = set(self.assigned)
+        cond = self.expression(x[1])
+        if cond is not None:
+            self.emit(f'while {cond}:')
+            self.depth += 1
+        else:
+            self.emit('while True:')
+            self.depth += 1
+            (cond,) = self.operands([x[1]])
+            self.emit(f'if not {cond}:')
+            self.emit('    break')
+        self.statement(x[2], result)
+        # Burn fuel for the iterations a lap at a time, as compiled code does.
+        self.emit(f'{laps} += 1')
+        self.emit(f'if {laps} == _lap:')
+        self.emit('    _burn(_lap)')
+        self.emit(f'    {laps} = 0')
+        self.depth -= 1
+        self.emit(f'_burn({laps})')
+        self.assigned = before # The loop may not have run at all.
+        if target is not None:
+            self.finish(result, target)
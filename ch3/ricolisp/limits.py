@@ -0,0 +1,138 @@
+"""Limits on how much work untrusted code may do.
+
+    lisp.run(source, budget=Budget(steps=1000000, seconds=2, cells=100000))
+
+A Budget caps, for one run, the number of steps (procedure calls and while loop iterations, in
+every engine), the wall time in seconds, and the number of list cells (Pairs) allocated.  When a
+run goes over any of them it raises ResourceExhausted, which unwinds the run like any other error
+and leaves the interpreter usable.
+
+Checking a budget on every step would slow everything down, so the engines only burn fuel: each
+step pops one item off the fuel deque, which is a single call into C.  When the fuel runs out,
+refuel() charges what was burnt to the budgets being run under, checks them, and refills the deque
+with at most batch more steps, or only as many as the tightest step limit has left.  So the time
+and cell limits are checked every batch steps.  Compiled while loops, whose iterations can be
+cheaper than popping the deque, count their own iterations and burn() them lap steps at a time,
+so they may run up to a lap past the step limit; otherwise it is exact.  With no budget the fuel
+is simply refilled, and costs the same as with one.
+
+Cells are counted as they are made (see ricolisp.pairs.allocated), including those freed again
+since, so the cell limit caps the garbage a run can make as well as what it keeps.
+"""
+import contextlib
+import time
+from collections import deque
+from itertools import repeat
+from typing import Optional
+
+from . import pairs
+
+batch = 1000 # Steps between checks of the time and cell limits.
+lap = 100 # Iterations a compiled while loop runs between burning fuel for them.
+
+fuel = deque() # One item per step left before the budgets are next checked.
+tick = fuel.popleft # Burn one step.  Raises IndexError when the fuel has run out; call refuel() then.
+_filled = 0 # How much fuel there was after the last refill.
+_burnt = 0 # Steps burnt by burn() since the last refill.
+_running = [] # The Budgets of the runs in progress, innermost last.
+
+
+class ResourceExhausted(Exception):
+    """A run went over one of the limits of its Budget."""
+
+
+class Budget:
+    """The most one run may use.  Use it as a context manager around the run, or pass it to LispInterpreter.run."""
+    def __init__(self, steps: Optional[int] = None, seconds: Optional[float] = None, cells: Optional[int] = None):
+        """
+        @param steps: Procedure calls plus loop iterations.
+        @param seconds: Wall time.
+        @param cells: List cells allocated.
+        Leave any of them None not to limit it.
+        """
+        self.steps = steps
+        self.seconds = seconds
+        self.cells = cells
+        self.steps_used = 0
+        self.cells_at_start = 0
+        self.deadline = None
+
+    @property
+    def cells_used(self) -> int:
+        return pairs.allocated - self.cells_at_start
+
+    def __enter__(self) -> 'Budget':
+        _charge()
+        self.steps_used = 0
+        self.cells_at_start = pairs.allocated
+        self.deadline = None if self.seconds is None else time.monotonic() + self.seconds
+        _running.append(self)
+        _refill()
+        return self
+
+    def __exit__(self, *exc_info):
+        _charge()
+        _running.remove(self)
+        _refill()
+
+    def check(self):
+        """Raise ResourceExhausted if the run has gone over a limit."""
+        if self.steps is not None and self.steps_used > self.steps:
+            raise ResourceExhausted(f'used more than {self.steps} steps')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ResourceExhausted(f'ran for more than {self.seconds} seconds')
+        if self.cells is not None and self.cells_used > self.cells:
+            raise ResourceExhausted(f'allocated more than {self.cells} list cells')
+
+    def __repr__(self):
+        return f'<Budget steps={self.steps} seconds={self.seconds} cells={self.cells}>'
+
+
+def _charge(extra: int = 0):
+    """Add the fuel burnt since the last refill, and extra steps, to every running budget."""
+    global _filled, _burnt
+    used = _filled - len(fuel) + _burnt + extra
+    for budget in _running:
+        budget.steps_used += used
+    _filled = len(fuel)
+    _burnt = 0
+
+
+def _refill():
+    global _filled, _burnt
+    amount = batch
+    for budget in _running:
+        if budget.steps is not None:
+            amount = min(amount, max(budget.steps - budget.steps_used, 0))
+    fuel.clear()
+    fuel.extend(repeat(None, amount))
+    _filled = amount
+    _burnt = 0
+
+
+def refuel(extra: int = 1):
+    """Called by an engine when tick() finds no fuel: check the budgets, then carry on with more fuel.
+
+    @param extra: Steps to charge besides the fuel burnt.  By default the step that found the tank
+    empty, so a run that has used exactly its steps fails on the next one.
+    """
+    _charge(extra)
+    for budget in _running:
+        budget.check()
+    _refill()
+
+
+def burn(steps: int):
+    """Burn several steps at once."""
+    global _burnt
+    _burnt += steps
+    if _burnt > len(fuel):
+        refuel(0)
+
+
+def metered(budget: Optional[Budget]):
+    """A context manager that runs under budget, or a do-nothing one if it is None."""
+    return contextlib.nullcontext() if budget is None else budget
+
+
+_refill()
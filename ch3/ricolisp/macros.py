@@ -0,0 +1,236 @@
+"""Macros: procedures that rewrite code before it runs.
+
+    (define-macro (unless test . body) (list (quote if) test 0 (cons (quote begin) body)))
+    (defmacro inc! (name) (list (quote set!) name (list (quote +) name 1))) ; The Common Lisp spelling.
+    (define-syntax my-or
+      (syntax-rules ()
+        ((_) 0)
+        ((_ e) e)
+        ((_ e rest ...) (if e e (my-or rest ...)))))
+
+A macro is a global variable whose value is a Macro.  When a form starts with its name, the
+operands are handed to the macro unevaluated, as lisp data, and whatever code it returns is run in
+place of the form.  define-macro and defmacro make the macro from a procedure, whose last
+parameter gets a list of the remaining operands if it follows a dot.  define-syntax with
+syntax-rules makes it from patterns: the first rule whose pattern matches the form has its template
+filled in with what the pattern variables matched, and a variable followed by ... matches any
+number of operands and repeats the part of the template it is in.  Neither kind is hygienic, so
+a macro that binds names should make them with (gensym).
+
+Expansion happens once per use.  The compilers expand a use when they compile it, so compiled code
+never sees the macro at all.  eval() expands a use the first time it meets it and then uses the
+expansion every time after that: each Macro keeps a cache of expansions by source form, like the
+call site caches.  So a macro in the body of a hot loop or procedure costs a dict lookup in eval
+and nothing in the compilers.  Macro.report() gives the expansions, cache hits and time spent,
+which LispInterpreter.macro_report() and (macro-report) collect for every macro.
+
+A macro can be used by the top-level forms after the one that defines it, including the later
+forms of a top-level begin, which LispInterpreter runs one form at a time.  A procedure compiled
+before the macro was defined has already compiled the use as a call, and calling a Macro raises
+TypeError.  Macros are global: defining one inside a procedure is a SyntaxError, because the
+compilers expand uses while they compile the procedure, before any of it has run.
+"""
+import itertools
+import time
+from typing import Callable, Dict, List, Tuple
+
+from .pairs import from_python, make_list, to_python
+
+Symbol = str
+ellipsis = '...'
+_gensyms = itertools.count(1)
+
+
+class Macro:
+    """Rewrites each form that starts with its name, remembering the result for each form."""
+    __slots__ = ('name', 'transform', 'expansions', 'misses', 'hits', 'seconds')
+    max_cached = 10000 # Expansions to keep before starting again, so one-off top-level code can't pile them up.
+
+    def __init__(self, name: Symbol, transform: Callable[[list], object]):
+        """
+        @param transform: Takes a whole use of the macro, as parsed code, and returns the code to run instead.
+        """
+        self.name = name
+        self.transform = transform
+        self.expansions: Dict[int, Tuple[list, object]] = {} # id(form) -> (form, expansion).
+        self.misses = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def expand(self, x: list):
+        """The code to run in place of x, a use of this macro."""
+        cached = self.expansions.get(id(x))
+        if cached is not None and cached[0] is x:
+            self.hits += 1
+            return cached[1]
+        start = time.perf_counter()
+        expansion = self.transform(x)
+        self.seconds += time.perf_counter() - start
+        self.misses += 1
+        if len(self.expansions) >= self.max_cached:
+            self.expansions.clear()
+        self.expansions[id(x)] = (x, expansion) # Keeping x means its id can't be reused while it is here.
+        return expansion
+
+    def __call__(self, *args):
+        raise TypeError(f'{self.name} is a macro, so it can only be used at the start of a form, after it is defined')
+
+    def report(self) -> list:
+        """(name expansions hits ms)."""
+        return [self.name, self.misses, self.hits, round(self.seconds * 1000, 3)]
+
+    def __repr__(self):
+        return f'<Macro {self.name}>'
+
+
+def procedure_macro(name: Symbol, proc: Callable, rest: bool) -> Macro:
+    """Make a Macro from a procedure of the operands, as define-macro and defmacro do.
+
+    @param rest: Whether the procedure's last parameter takes a list of the operands left over.
+    """
+    def transform(x: list):
+        operands = [from_python(operand) for operand in x[1:]]
+        if rest:
+            fixed = len(proc.parms) - 1
+            if len(operands) < fixed:
+                raise SyntaxError(f'{name} expects at least {fixed} operands, got {len(operands)}')
+            operands[fixed:] = [make_list(operands[fixed:])]
+        return to_python(proc(*operands))
+    return Macro(name, transform)
+
+
+def syntax_rules_macro(name: Symbol, literals, rules) -> Macro:
+    """Make a Macro from (syntax-rules literals rules...)."""
+    return Macro(name, SyntaxRules(name, to_python(literals), to_python(rules)))
+
+
+def expand_macro_definition(x: list, top_level: bool = True) -> list:
+    """Rewrite define-macro, defmacro or define-syntax as a define of a Macro.
+
+    Like define-memo (see ricolisp.memo), the function that makes the Macro goes into the code
+    itself, so the form works whatever the program has defined.
+
+    @param top_level: False if x is inside a procedure, where macros can't be defined.
+    """
+    if not top_level:
+        raise SyntaxError(f'{x[0]}: macros can only be defined at top level, not inside a procedure')
+    if x[0] == 'define-syntax':
+        if len(x) != 3 or not isinstance(x[1], Symbol) or not isinstance(x[2], list) or x[2][:1] != ['syntax-rules'] \
+                or len(x[2]) < 2 or not isinstance(x[2][1], list):
+            raise SyntaxError(f'define-syntax expects a name and (syntax-rules (literals...) rules...), got {x[1:]}')
+        return ['define', x[1], [syntax_rules_macro, ['quote', x[1]], ['quote', x[2][1]], ['quote', x[2][2:]]]]
+    if x[0] == 'defmacro':
+        if len(x) < 4 or not isinstance(x[1], Symbol) or not isinstance(x[2], list):
+            raise SyntaxError(f'defmacro expects a name, a parameter list and a body, got {x[1:]}')
+        name, parms, body = x[1], x[2], x[3:]
+    elif len(x) >= 3 and isinstance(x[1], list) and x[1] and isinstance(x[1][0], Symbol):
+        name, parms, body = x[1][0], x[1][1:], x[2:]
+    elif len(x) == 3 and isinstance(x[1], Symbol): # (define-macro name procedure)
+        return ['define', x[1], [procedure_macro, ['quote', x[1]], x[2], False]]
+    else:
+        raise SyntaxError(f'define-macro expects (name parameters...) and a body, got {x[1:]}')
+    rest = len(parms) >= 2 and parms[-2] == '.'
+    if rest:
+        parms = parms[:-2] + parms[-1:]
+    body = body[0] if len(body) == 1 else ['begin', *body]
+    return ['define', name, [procedure_macro, ['quote', name], ['lambda', parms, body], rest]]
+
+
+class Repeated(list):
+    """What a pattern variable under an ellipsis matched: one value, or Repeated, per repetition."""
+
+
+class SyntaxRules:
+    """The transformer of a syntax-rules macro."""
+    def __init__(self, name: Symbol, literals: List[Symbol], rules: List[list]):
+        self.name = name
+        self.literals = set(literals)
+        self.rules = []
+        for rule in rules:
+            if not isinstance(rule, list) or len(rule) != 2 or not isinstance(rule[0], list) or not rule[0]:
+                raise SyntaxError(f'{name}: a syntax-rules rule should be (pattern template), got {rule}')
+            self.rules.append((rule[0][1:], rule[1])) # The keyword at the start of the pattern is ignored.
+
+    def __call__(self, x: list):
+        for pattern, template in self.rules:
+            bindings = {}
+            if self.match(pattern, x[1:], bindings):
+                return self.fill(template, bindings)
+        raise SyntaxError(f'{self.name}: no syntax-rules pattern matches {x}')
+
+    def match(self, pattern, form, bindings: dict) -> bool:
+        if isinstance(pattern, Symbol):
+            if pattern in self.literals:
+                return form == pattern
+            if pattern != '_':
+                bindings[pattern] = form
+            return True
+        if not isinstance(pattern, list):
+            return form == pattern
+        if not isinstance(form, list):
+            return False
+        if len(pattern) >= 2 and pattern[-2] == '.': # (a b . rest)
+            head = pattern[:-2]
+            return len(form) >= len(head) and self.match(head, form[:len(head)], bindings) \
+                and self.match(pattern[-1], form[len(head):], bindings)
+        if ellipsis in pattern:
+            i = pattern.index(ellipsis) - 1
+            before, repeated, after = pattern[:i], pattern[i], pattern[i + 2:]
+            count = len(form) - len(before) - len(after)
+            if count < 0 or not self.match(before, form[:len(before)], bindings) \
+                    or not self.match(after, form[len(form) - len(after):], bindings):
+                return False
+            matches = []
+            for item in form[len(before):len(before) + count]:
+                item_bindings = {}
+                if not self.match(repeated, item, item_bindings):
+                    return False
+                matches.append(item_bindings)
+            for variable in self.variables(repeated):
+                bindings[variable] = Repeated(match[variable] for match in matches)
+            return True
+        return len(pattern) == len(form) and all(self.match(p, f, bindings) for p, f in zip(pattern, form))
+
+    def variables(self, pattern) -> List[Symbol]:
+        """The pattern variables in a pattern."""
+        if isinstance(pattern, Symbol):
+            return [] if pattern in self.literals or pattern in ('_', ellipsis, '.') else [pattern]
+        if isinstance(pattern, list):
+            return [variable for part in pattern for variable in self.variables(part)]
+        return []
+
+    def fill(self, template, bindings: dict):
+        """Substitute what the pattern variables matched into a template."""
+        if isinstance(template, Symbol):
+            value = bindings.get(template, template)
+            if isinstance(value, Repeated):
+                raise SyntaxError(f'{self.name}: {template} needs a ... after it in the template')
+            return value
+        if not isinstance(template, list):
+            return template
+        result = []
+        i = 0
+        while i < len(template):
+            part = template[i]
+            if part == '.' and i == len(template) - 2: # (a b . rest): splice in the list rest matched.
+                return result + self.fill(template[i + 1], bindings)
+            if i + 1 < len(template) and template[i + 1] == ellipsis:
+                repeated = [variable for variable in self.variables(part) if isinstance(bindings.get(variable), Repeated)]
+                if not repeated:
+                    raise SyntaxError(f'{self.name}: nothing to repeat in {part} ...')
+                for values in zip(*(bindings[variable] for variable in repeated)):
+                    result.append(self.fill(part, {**bindings, **dict(zip(repeated, values))}))
+                i += 2
+                continue
+            result.append(self.fill(part, bindings))
+            i += 1
+        return result
+
+
+def gensym(prefix: Symbol = 'g') -> Symbol:
+    """A new symbol that no program will have used, for a macro to bind."""
+    return f'{prefix}__{next(_gensyms)}'
+
+
+def builtins() -> dict:
+    return {'gensym': gensym}
@@ -0,0 +1,133 @@
+"""Memoized procedures.
+
+(memoize proc) returns a procedure that remembers the results proc gave for each set of arguments,
+and (define-memo name exp) is short for (define name (memoize exp)):
+
+    (define-memo choose (lambda (n k)
+        (if (or (= k 0) (= k n)) 1 (+ (choose (- n 1) (- k 1)) (choose (- n 1) k)))))
+
+Recursive calls go through the global name, so they hit the cache too.  The cache holds the most
+recently used results, 128 by default, and (memo-stats proc) / (memo-clear! proc) read and reset
+it.  Lists can be arguments: they're looked up by their contents, not by identity.
+"""
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from .pairs import Pair, force, from_python, nil
+
+default_size = 128
+
+
+def canonical_key(x):
+    """Convert lists in x, including nested ones, to tuples so that x can be a dict key."""
+    x = force(x)
+    if type(x) is Pair:
+        items = []
+        while type(x) is Pair:
+            items.append(canonical_key(x.car))
+            x = force(x.cdr)
+        if x is not nil:
+            items.append(('.', canonical_key(x))) # Keep dotted pairs apart from proper lists.
+        return tuple(items)
+    if isinstance(x, (list, tuple)):
+        return tuple(canonical_key(item) for item in x)
+    if x is nil:
+        return ()
+    return x
+
+
+class Memoized:
+    """A procedure wrapped with a least-recently-used cache of its results."""
+    __slots__ = ('proc', 'maxsize', 'cache', 'hits', 'misses', 'evictions')
+
+    def __init__(self, proc: Callable, maxsize: Optional[int] = default_size):
+        """
+        @param proc: What to call on a cache miss.  It should be pure: same arguments, same result.
+        @param maxsize: How many results to keep, or None for no limit.
+        """
+        if not callable(proc):
+            raise TypeError(f'memoize expected a procedure, got {proc!r}')
+        if maxsize is not None and (not isinstance(maxsize, int) or maxsize < 1):
+            raise ValueError(f'memoize cache size must be a positive integer, got {maxsize!r}')
+        self.proc = proc
+        self.maxsize = maxsize
+        self.cache = OrderedDict() # key -> result, least recently used first.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, *args):
+        cache = self.cache
+        key = args
+        try:
+            result = cache[key]
+        except KeyError:
+            return self._miss(key, args)
+        except TypeError: # Something unhashable, such as a list, in the arguments.
+            key = canonical_key(args)
+            if key not in cache:
+                return self._miss(key, args)
+            result = cache[key]
+        self.hits += 1
+        if self.maxsize is not None:
+            cache.move_to_end(key)
+        return result
+
+    def _miss(self, key, args):
+        self.misses += 1
+        result = self.proc(*args)
+        cache = self.cache
+        cache[key] = result
+        if self.maxsize is not None and len(cache) > self.maxsize:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def stats(self) -> dict:
+        """The cache statistics: hits, misses, evictions, size and maxsize."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            'size': len(self.cache), 'maxsize': self.maxsize}
+
+    def clear(self):
+        """Empty the cache and reset the statistics."""
+        self.cache.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def __repr__(self):
+        return f'<Memoized {self.proc!r} hits={self.hits} misses={self.misses} size={len(self.cache)}>'
+
+
+def memoize(proc: Callable, maxsize: Optional[int] = default_size) -> Memoized:
+    return Memoized(proc, maxsize)
+
+
+def expand_define_memo(x: list) -> list:
+    """Rewrite (define-memo name exp) or (define-memo name exp size) as a define of a Memoized.
+
+    The memoize function itself goes into the code rather than the symbol memoize, so the form
+    still works if a program defines its own memoize.
+    """
+    if len(x) not in (3, 4) or not isinstance(x[1], str):
+        raise SyntaxError(f'define-memo expects a name, a procedure and optionally a cache size, got {x[1:]}')
+    return ['define', x[1], [memoize, *x[2:]]]
+
+
+def _as_memoized(proc) -> Memoized:
+    if not isinstance(proc, Memoized):
+        raise TypeError(f'expected a memoized procedure, got {proc!r}')
+    return proc
+
+def memo_stats(proc):
+    """The statistics of a memoized procedure as an association list: ((hits 3) (misses 2) ...)."""
+    return from_python([[name, value] for name, value in _as_memoized(proc).stats().items()])
+
+def memo_clear(proc):
+    _as_memoized(proc).clear()
+
+
+def builtins() -> dict:
+    return {
+        'memoize':     memoize,
+        'memo-stats':  memo_stats,
+        'memo-clear!': memo_clear,
+    }
@@ -0,0 +1,131 @@
+"""Splitting a program across files.
+
+    (import "geometry.lisp")        ; Defines geometry/area, geometry/distance, ...
+    (import "lib/geometry.lisp" g)  ; Defines g/area, g/distance, ...
+    (require "geometry.lisp")       ; Defines area, distance, ... without a prefix.
+
+A module is a file of lisp code run in its own global environment by its own LispInterpreter: it
+sees the builtins, but not the globals of whoever imports it.  After it has run, the globals it
+defined are copied into the importer, prefixed with the module's name (the file name without
+.lisp, or the prefix given) and a slash, or without a prefix for require.  Because they are copied,
+a later set! inside the module isn't seen by the importer.  Relative paths are relative to the
+directory of the file doing the importing (see LispInterpreter.directory).
+
+Each interpreter runs a module once, however many files import it, until the file changes.  The
+parsed code is also cached on disk, pickled into __lispcache__ next to the source and keyed by the
+source's mtime and size and the reader_version, so loading an unchanged module, even in a new
+process, doesn't tokenize or parse it.  Compiled code is closures or bytecode full of Cells, which
+can't be pickled, so the cache stops at the parsed form.
+"""
+import os
+import pickle
+from typing import Dict, List, Optional
+
+from .interpreter import LispInterpreter, Symbol, read
+
+reader_version = 1 # Change this when the reader parses anything differently, so old caches are ignored.
+cache_directory = '__lispcache__'
+
+
+def expand_import(x: list) -> list:
+    """Rewrite (import path [prefix]) or (require path) as a call to import-module or require-module."""
+    if x[0] == 'import' and len(x) in (2, 3) and all(isinstance(part, Symbol) for part in x[1:]):
+        return ['import-module', *[['quote', part] for part in x[1:]]]
+    if x[0] == 'require' and len(x) == 2 and isinstance(x[1], Symbol):
+        return ['require-module', ['quote', x[1]]]
+    raise SyntaxError(f'{x[0]} expects a path{" and optionally a prefix" if x[0] == "import" else ""}, got {x[1:]}')
+
+
+def cache_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, cache_directory, f'{name}.r{reader_version}.pickle')
+
+
+def read_module(path: str, stat: os.stat_result) -> List:
+    """Get the parsed top-level expressions of a module, from the disk cache if it is up to date."""
+    cached = cache_path(path)
+    key = (reader_version, stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(cached, 'rb') as f:
+            cached_key, forms = pickle.load(f)
+        if cached_key == key:
+            return forms
+    except Exception:
+        pass # Missing, stale or unreadable: parse the source instead.
+    with open(path) as f:
+        forms = list(read(f))
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temporary = f'{cached}.{os.getpid()}'
+        with open(temporary, 'wb') as f:
+            pickle.dump((key, forms), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cached) # So another process never reads half a file.
+    except OSError:
+        pass # Can't write next to the source; it just won't be cached.
+    return forms
+
+
+class Module:
+    """A loaded file of lisp code."""
+    __slots__ = ('path', 'name', 'lisp', 'stamp', 'exports')
+
+    def __init__(self, path: str, lisp: LispInterpreter, stamp: tuple):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.lisp = lisp # The interpreter the module ran in, whose env holds its globals.
+        self.stamp = stamp # (mtime, size) of the file when it was loaded.
+        self.exports: Dict[Symbol, object] = {}
+
+    def __repr__(self):
+        return f'<Module {self.name} from {self.path}>'
+
+
+class ModuleLoader:
+    """Loads modules for a LispInterpreter and everything it imports, and remembers them."""
+    module_builtins = ('import-module', 'require-module') # Bound to each module's own interpreter.
+
+    def __init__(self, lisp: LispInterpreter):
+        self.lisp = lisp
+        self.modules: Dict[str, Module] = {} # Absolute path -> Module.
+        self.loading = set() # Paths of modules being run right now, to catch circular imports.
+
+    def load(self, path: str, directory: Optional[str] = None) -> Module:
+        """Get a module, running it if it hasn't been yet or its file has changed since.
+
+        @param directory: What a relative path is relative to.  Defaults to the current directory.
+        """
+        path = os.path.abspath(os.path.join(directory or '', path.strip('"')))
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        module = self.modules.get(path)
+        if module is not None and module.stamp == stamp:
+            return module
+        if path in self.loading:
+            raise ImportError(f'Circular import of {path}')
+        lisp = LispInterpreter(engine=self.lisp.engine)
+        lisp.modules = self
+        lisp.directory = os.path.dirname(path)
+        lisp.env.update({name: value for name, value in self.lisp.builtins.items() if name not in self.module_builtins})
+        module = Module(path, lisp, stamp)
+        self.loading.add(path)
+        try:
+            for expression in read_module(path, stat):
+                lisp.execute(expression)
+        finally:
+            self.loading.discard(path)
+        module.exports = {name: lisp.env[name] for name in dict.keys(lisp.env) if name not in lisp.builtins}
+        self.modules[path] = module
+        return module
+
+    def import_module(self, importer: LispInterpreter, path: str, prefix: Optional[Symbol] = None) -> Module:
+        """Load a module and define its globals in the importer as prefix/name."""
+        module = self.load(path, importer.directory)
+        prefix = module.name if prefix is None else prefix
+        importer.env.update({f'{prefix}/{name}': value for name, value in module.exports.items()})
+        return module
+
+    def require_module(self, importer: LispInterpreter, path: str) -> Module:
+        """Load a module and define its globals in the importer under their own names."""
+        module = self.load(path, importer.directory)
+        importer.env.update(module.exports)
+        return module
@@ -0,0 +1,210 @@
+"""Constant folding and primitive inlining for the Compiler.
+
+Without this, (+ 1 (* 5 10)) looks up * and + in their Cells every time it runs, then makes a
+generic Python call to each.  With an Optimizer the Compiler instead:
+
+* folds calls to pure builtins whose arguments are all known at compile time, so (+ 1 (* 5 10))
+  compiles to the constant 51 and (* 2 pi) to 6.283...;
+* inlines calls to the arithmetic and comparison operators, so (+ a b) runs a(f) + b(f) with no
+  lookup of + and no call to op.add.
+
+Both are bets that the global names involved keep the values they had at compile time.  Each
+optimized node holds an Assumption, which the Cells of those names watch: a later define, set! or
+del of +, pi and so on invalidates it, and from then on the node runs the ordinary compiled code it
+was built from.  A name that is a local variable anywhere in scope is never optimized.
+
+Folding runs at compile time, outside any Budget, so it sticks to builtins that are cheap for small
+arguments (arithmetic, comparisons and the float functions in math, but not factorial or comb), to
+integers of at most max_folded_bits bits, and to code that can run: the branch an if can be
+seen never to take is compiled without folding.
+"""
+import contextlib
+import operator as op
+import weakref
+from typing import Callable, Dict, Iterable, Tuple
+
+from .interpreter import GlobalEnv, Number, Symbol, builtin_env
+
+Code = Callable[[list], object]
+
+# Builtins that always give the same result for the same arguments, have no side effects, and are
+# quick for numbers no bigger than max_folded_bits.
+pure_names = ('+', '-', '*', '/', '>', '<', '>=', '<=', '=', 'abs', 'max', 'min', 'not', 'round',
+    'sqrt', 'exp', 'log', 'log10', 'log2', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2',
+    'sinh', 'cosh', 'tanh', 'floor', 'ceil', 'trunc', 'fabs', 'hypot', 'degrees', 'radians',
+    'copysign', 'fmod', 'isfinite', 'isinf', 'isnan')
+constant_names = ('pi', 'e', 'tau', 'inf', 'nan')
+max_folded_bits = 1024 # Bigger integers are left to be computed at run time.
+
+_pure = None
+
+def pure_builtins() -> Dict[Symbol, object]:
+    """The values of the pure names and constants in builtin_env(), which is the same for every interpreter."""
+    global _pure
+    if _pure is None:
+        builtins = builtin_env()
+        _pure = {name: builtins[name] for name in pure_names + constant_names if name in builtins}
+    return _pure
+
+
+def small(value) -> bool:
+    """Whether value is a number cheap enough to compute with at compile time."""
+    return isinstance(value, Number) and (type(value) is float or value.bit_length() <= max_folded_bits)
+
+
+class Assumption:
+    """Valid until a Cell it watches is rebound."""
+    __slots__ = ('valid', '__weakref__')
+
+    def __init__(self):
+        self.valid = True
+
+    def invalidate(self):
+        self.valid = False
+
+
+def folded(value, assumption: Assumption, fallback: Code) -> Code:
+    def folded_constant(f):
+        return value if assumption.valid else fallback(f)
+    return folded_constant
+
+
+# Inlined operators.  Each takes the compiled arguments, the Assumption and the code to fall back to.
+
+def inline_add(a, b, assumption, fallback):
+    def add(f):
+        return a(f) + b(f) if assumption.valid else fallback(f)
+    return add
+
+def inline_sub(a, b, assumption, fallback):
+    def sub(f):
+        return a(f) - b(f) if assumption.valid else fallback(f)
+    return sub
+
+def inline_mul(a, b, assumption, fallback):
+    def mul(f):
+        return a(f) * b(f) if assumption.valid else fallback(f)
+    return mul
+
+def inline_truediv(a, b, assumption, fallback):
+    def truediv(f):
+        return a(f) / b(f) if assumption.valid else fallback(f)
+    return truediv
+
+def inline_gt(a, b, assumption, fallback):
+    def gt(f):
+        return a(f) > b(f) if assumption.valid else fallback(f)
+    return gt
+
+def inline_lt(a, b, assumption, fallback):
+    def lt(f):
+        return a(f) < b(f) if assumption.valid else fallback(f)
+    return lt
+
+def inline_ge(a, b, assumption, fallback):
+    def ge(f):
+        return a(f) >= b(f) if assumption.valid else fallback(f)
+    return ge
+
+def inline_le(a, b, assumption, fallback):
+    def le(f):
+        return a(f) <= b(f) if assumption.valid else fallback(f)
+    return le
+
+def inline_eq(a, b, assumption, fallback):
+    def eq(f):
+        return a(f) == b(f) if assumption.valid else fallback(f)
+    return eq
+
+def inline_not(a, assumption, fallback):
+    def not_(f):
+        return (not a(f)) if assumption.valid else fallback(f)
+    return not_
+
+# builtin -> (number of arguments, function to build the inlined code)
+inline_operators = {
+    op.add:     (2, inline_add),
+    op.sub:     (2, inline_sub),
+    op.mul:     (2, inline_mul),
+    op.truediv: (2, inline_truediv),
+    op.gt:      (2, inline_gt),
+    op.lt:      (2, inline_lt),
+    op.ge:      (2, inline_ge),
+    op.le:      (2, inline_le),
+    op.eq:      (2, inline_eq),
+    op.not_:    (1, inline_not),
+}
+
+
+class Optimizer:
+    def __init__(self, env: GlobalEnv):
+        """
+        @param env: The global environment the code will run in.  Names in it that are bound to
+        the standard builtins (see builtin_env) are the ones that get folded and inlined.
+        """
+        self.env = env
+        self.pure = pure_builtins()
+        # Compiled code whose value is known at compile time -> (value, names it depends on).
+        self.static: Dict[Code, Tuple[object, frozenset]] = weakref.WeakKeyDictionary()
+        self.unreachable_depth = 0 # How many ifs the code being compiled is in the untaken branch of.
+
+    def _builtin(self, name: Symbol):
+        """The pure builtin a global name refers to, or None if it isn't one (any more)."""
+        if name not in self.pure:
+            return None
+        value = getattr(self.env.cell(name), 'value', None)
+        return value if value is self.pure[name] else None
+
+    def assume(self, names: Iterable[Symbol]) -> Assumption:
+        """Make an Assumption that the names keep their current values."""
+        assumption = Assumption()
+        for name in names:
+            self.env.cell(name).watch(assumption)
+        return assumption
+
+    def constant(self, code: Code, value):
+        """Note that compiled code is the constant value."""
+        if small(value):
+            self.static[code] = (value, frozenset())
+
+    @contextlib.contextmanager
+    def unreachable(self, dead: bool = True):
+        """If dead, don't fold anything compiled inside this, because it won't run while the
+        assumptions hold.  If they stop holding it might, so it is still compiled and inlined."""
+        self.unreachable_depth += dead
+        try:
+            yield
+        finally:
+            self.unreachable_depth -= dead
+
+    def global_reference(self, name: Symbol, code: Code):
+        """Note that compiled code reads a global, which may be a known constant such as pi."""
+        value = self._builtin(name)
+        if name in constant_names and isinstance(value, Number):
+            self.static[code] = (value, frozenset((name,)))
+
+    def call(self, name: Symbol, args: Iterable[Code], code: Code) -> Code:
+        """Optimize a call to a global name, if it is a pure builtin.
+
+        @param args: The compiled arguments.
+        @param code: The call compiled the ordinary way, to fall back to.
+        """
+        proc = self._builtin(name)
+        if proc is None or name in constant_names:
+            return code
+        statics = [self.static.get(arg) for arg in args]
+        if None not in statics and not self.unreachable_depth:
+            try:
+                value = proc(*[value for value, _ in statics])
+            except Exception:
+                pass # Leave it to fail at run time, if it is ever run.
+            else:
+                if small(value):
+                    names = frozenset((name,)).union(*[names for _, names in statics])
+                    result = folded(value, self.assume(names), code)
+                    self.static[result] = (value, names)
+                    return result
+        nargs, inline = inline_operators.get(proc, (None, None))
+        if nargs == len(args):
+            return inline(*args, self.assume((name,)), code)
+        return code
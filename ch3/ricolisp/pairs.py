@@ -0,0 +1,261 @@
+"""Lisp lists made of cons cells.
+
+Parsed code is made of Python lists, but lists built by running Lisp code are chains of Pairs
+ending in nil, the empty list.  cons, car and cdr are O(1), and cons shares the list it is given
+as the tail of the new one instead of copying it, so walking a list with cdr is linear.
+
+Pairs compare equal to Python lists and tuples with equal elements, and iterate like them, so
+Python code can mostly treat them as sequences.  from_python() and to_python() convert at the
+boundary when a real Python list is needed.
+
+A LazyList is a list whose items come from a Python iterator as they are needed, such as the data
+read from a huge file (see ricolisp.data).  car, cdr and null? force it one Pair at a time, and
+the cdr of each Pair is another LazyList, so a program that walks it without holding on to the
+head only keeps the items it hasn't got to yet.
+
+allocated counts the Pairs made by cons, make_list and LazyList, for ricolisp.limits.
+"""
+from typing import Iterable, Iterator
+
+allocated = 0 # Pairs made so far.  Only ever goes up.
+
+
+class Nil:
+    """The empty list.  There is only one: nil."""
+    __slots__ = ()
+
+    def __iter__(self) -> Iterator:
+        return iter(())
+
+    def __len__(self) -> int:
+        return 0
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, tuple)):
+            return not other
+        return other is self
+
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return '()'
+
+    def __reduce__(self):
+        return 'nil' # Unpickle as the module's singleton.
+
+nil = Nil()
+
+
+class Pair:
+    """A cons cell: car is the first element of a list, cdr is the rest of it."""
+    __slots__ = ('car', 'cdr', '__weakref__')
+
+    def __init__(self, car, cdr):
+        self.car = car
+        self.cdr = cdr
+
+    def __iter__(self) -> Iterator:
+        x = self
+        while True:
+            while type(x) is Pair:
+                yield x.car
+                x = x.cdr
+            if type(x) is not LazyList:
+                return
+            x = x.force()
+
+    def __len__(self) -> int:
+        n = 0
+        x = self
+        while True:
+            while type(x) is Pair:
+                n += 1
+                x = x.cdr
+            if type(x) is not LazyList:
+                return n
+            x = x.force()
+
+    def __bool__(self) -> bool:
+        return True # A Pair is never the empty list; don't walk the list to find that out.
+
+    def __eq__(self, other) -> bool:
+        x = self
+        if isinstance(other, Pair):
+            y = other
+            while True:
+                while type(x) is Pair and type(y) is Pair:
+                    if x is y:
+                        return True # Shared tails are equal without looking at them.
+                    if not x.car == y.car:
+                        return False
+                    x, y = x.cdr, y.cdr
+                if type(x) is not LazyList and type(y) is not LazyList:
+                    return x == y
+                x, y = force(x), force(y)
+        if isinstance(other, (list, tuple)):
+            for item in other:
+                x = force(x)
+                if type(x) is not Pair or not x.car == item:
+                    return False
+                x = x.cdr
+            return force(x) is nil
+        return NotImplemented
+
+    __hash__ = None # Like a Python list, a Pair isn't hashable.
+
+    def __reduce__(self):
+        # Pickle the whole list flat.  Pickling Pair by Pair would recurse once per element.
+        items = []
+        x = self
+        while type(x) is Pair:
+            items.append(x.car)
+            x = force(x.cdr)
+        return make_list, (items, x)
+
+    def __repr__(self) -> str:
+        from .interpreter import unparse
+        return unparse(self)
+
+
+class LazyList:
+    """A list that reads its items from an iterator when they are first needed.
+
+    force() turns it into nil or a Pair whose cdr is a LazyList for the rest of the items, and
+    remembers that, so the items are only read once however many times the list is walked.
+    """
+    __slots__ = ('items', 'value')
+
+    def __init__(self, items: Iterator):
+        self.items = items
+        self.value = None # The Pair or nil, once forced.
+
+    def force(self):
+        global allocated
+        if self.value is None:
+            for item in self.items:
+                self.value = Pair(item, LazyList(self.items))
+                allocated += 1
+                break
+            else:
+                self.value = nil
+            self.items = None
+        return self.value
+
+    def __iter__(self) -> Iterator:
+        return iter(self.force())
+
+    def __len__(self) -> int:
+        return len(self.force())
+
+    def __bool__(self) -> bool:
+        return self.force() is not nil
+
+    def __eq__(self, other) -> bool:
+        return self.force() == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return make_list, (list(self),)
+
+    def __repr__(self) -> str:
+        from .interpreter import unparse
+        return unparse(self)
+
+
+def force(x):
+    """x itself, unless it is a LazyList, which is forced into a Pair or nil."""
+    return x.force() if type(x) is LazyList else x
+
+
+def make_list(items: Iterable, tail=nil):
+    """Make a lisp list of the items, without converting the items themselves.
+
+    @param tail: What the last Pair's cdr should be.
+    """
+    global allocated
+    if not isinstance(items, (list, tuple)):
+        items = list(items)
+    allocated += len(items)
+    result = tail
+    for item in reversed(items):
+        result = Pair(item, result)
+    return result
+
+
+def from_python(x):
+    """Convert Python lists and tuples, including nested ones, to lisp lists.  Anything else is unchanged."""
+    if isinstance(x, (list, tuple)):
+        return make_list([from_python(item) for item in x])
+    return x
+
+
+def to_python(x):
+    """Convert lisp lists, including nested ones, to Python lists.  Anything else is unchanged."""
+    if x is nil:
+        return []
+    if type(x) is Pair or type(x) is LazyList:
+        return [to_python(item) for item in x]
+    return x
+
+
+def as_lisp_list(x):
+    """Accept a list from lisp code, converting a Python list that came from outside if needed."""
+    if type(x) is Pair or x is nil:
+        return x
+    if type(x) is LazyList:
+        return x.force()
+    if isinstance(x, (list, tuple)):
+        return make_list(x)
+    raise TypeError(f'expected a list, got {x!r}')
+
+
+# -- Builtins for the standard environment.
+
+def cons(x, y):
+    global allocated
+    allocated += 1
+    if isinstance(y, (list, tuple)):
+        y = make_list(y)
+    return Pair(x, y)
+
+def car(x):
+    if type(x) is Pair:
+        return x.car
+    return as_lisp_list(x).car
+
+def cdr(x):
+    if type(x) is Pair:
+        return x.cdr
+    return as_lisp_list(x).cdr
+
+def lisp_list(*items):
+    return make_list(items)
+
+def append(*lists):
+    """Join lists.  The last one is shared by the result rather than copied."""
+    if not lists:
+        return nil
+    result = as_lisp_list(lists[-1])
+    for x in reversed(lists[:-1]):
+        result = make_list(list(as_lisp_list(x)), result)
+    return result
+
+def length(x) -> int:
+    if isinstance(x, (list, tuple)):
+        return len(x)
+    return len(as_lisp_list(x))
+
+def lisp_map(proc, *lists):
+    if len(lists) == 1:
+        return make_list([proc(x) for x in lists[0]])
+    return make_list([proc(*xs) for xs in zip(*lists)])
+
+def is_null(x) -> bool:
+    return x is nil or (isinstance(x, (list, tuple, LazyList)) and not x)
+
+def is_list(x) -> bool:
+    return type(x) is Pair or x is nil or isinstance(x, (list, LazyList))
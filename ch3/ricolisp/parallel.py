@@ -0,0 +1,255 @@
+"""pmap: map a procedure over a list on a pool of worker processes.
+
+A Procedure can't be pickled as it is: its body may be compiled Python closures, and its
+environment links all the way up to a GlobalEnv full of builtins.  So serialize() turns it into a
+ProcedureSpec holding only its source and the values of the variables it actually uses:
+
+* variables captured from enclosing procedures are looked up in the closure's frames;
+* globals the program defined are sent along too, except for builtins, which every worker already
+  has from its own LispInterpreter.  A builtin bound to some other name, as after
+  (define max min), is sent as a BuiltinRef to the builtin it is.
+
+Procedures among those values are serialized the same way, so helpers and recursive procedures
+come along with the procedure being mapped, and a define-memo procedure is sent as the procedure
+it memoizes, to be wrapped in a new (empty) cache on the worker.  A worker rebuilds the procedure by compiling its
+source inside a lambda taking the captured names, then runs it over its chunk of the list.
+
+Only pure procedures make sense here: a worker's set! of a global is not seen by anyone else.
+"""
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .compiler import defined_names, unassigned
+from .interpreter import GlobalEnv, LispInterpreter, Procedure, Symbol, builtin_env
+from .memo import Memoized
+
+sequential_below = 100 # Lists shorter than this are mapped in this process.
+
+
+class ProcedureSpec:
+    """A picklable description of a Procedure."""
+    __slots__ = ('parms', 'body', 'captured', 'name')
+
+    def __init__(self, parms: List[Symbol], body, name: str):
+        self.parms = parms
+        self.body = body
+        self.captured = [] # (name, value) for each variable captured from an enclosing procedure.
+        self.name = name
+
+
+class MemoizedSpec:
+    """A picklable description of a Memoized procedure.  The cache stays behind."""
+    __slots__ = ('proc', 'maxsize')
+
+    def __init__(self, proc, maxsize: Optional[int]):
+        self.proc = proc
+        self.maxsize = maxsize
+
+
+class BuiltinRef:
+    """Stands for the builtin with the given name, which the worker has too."""
+    __slots__ = ('name',)
+
+    def __init__(self, name: Symbol):
+        self.name = name
+
+
+def free_variables(x, bound=frozenset()) -> List[Symbol]:
+    """Find the symbols an expression uses without binding them itself, in order of first use."""
+    names = []
+    def scan(x, bound):
+        if isinstance(x, Symbol):
+            if x not in bound and x not in names:
+                names.append(x)
+        elif isinstance(x, list) and x:
+            if x[0] == 'quote':
+                return
+            if x[0] == 'lambda' and len(x) == 3:
+                scan(x[2], bound | set(x[1]) | set(defined_names(x[2])))
+                return
+            for part in x:
+                scan(part, bound)
+    scan(x, frozenset(bound))
+    return names
+
+
+def captured_value(proc: Procedure, name: Symbol):
+    """Find a variable that proc captured from an enclosing procedure.
+
+    @returns: (True, value), or (False, None) if the name is global (or unbound).
+    """
+    env = proc.env
+    if proc.code is None: # Interpreted: env is an Activation or Env chain ending in the GlobalEnv.
+        try:
+            env = env.find(name)
+        except Exception:
+            return False, None
+        return (False, None) if isinstance(env, GlobalEnv) else (True, env[name])
+
+    scope = proc.code.scope.outer # Describes proc.env, the frame the lambda was evaluated in.
+    while scope is not None:
+        if name in scope.slots:
+            value = env[scope.slots[name]]
+            if not (value is unassigned and name in scope.defined):
+                return True, value
+        scope, env = scope.outer, env[0]
+    return False, None
+
+
+class Serializer:
+    """Turns Procedures into ProcedureSpecs, collecting the globals they need along the way."""
+    builtin_names = None # Names a new LispInterpreter starts with, which workers already have.
+    builtin_procedures = None # id(builtin procedure) -> a name it has in builtin_env().
+
+    def __init__(self, env: GlobalEnv):
+        if Serializer.builtin_names is None:
+            Serializer.builtin_names = frozenset(LispInterpreter().env)
+            Serializer.builtin_procedures = {id(value): name for name, value in builtin_env().items() if callable(value)}
+        self.env = env
+        self.specs: Dict[int, ProcedureSpec] = {} # id(Procedure) -> its spec, so cycles are fine.
+        self.globals = {}
+
+    def value(self, x):
+        if isinstance(x, Procedure):
+            return self.procedure(x)
+        if isinstance(x, Memoized):
+            return MemoizedSpec(self.value(x.proc), x.maxsize)
+        name = self.builtin_procedures.get(id(x))
+        if name is not None and builtin_env()[name] is x:
+            return BuiltinRef(name)
+        return x
+
+    def procedure(self, proc: Procedure) -> ProcedureSpec:
+        spec = self.specs.get(id(proc))
+        if spec is not None:
+            return spec
+        name = proc.code.name if proc.code is not None else 'lambda'
+        spec = self.specs[id(proc)] = ProcedureSpec(proc.parms, proc.body, name)
+        bound = set(proc.parms) | set(defined_names(proc.body))
+        for name in free_variables(proc.body, bound):
+            found, value = captured_value(proc, name)
+            if found:
+                spec.captured.append((name, self.value(value)))
+            else:
+                self.global_variable(name)
+        return spec
+
+    def global_variable(self, name: Symbol):
+        if name in self.globals or name not in self.env:
+            return
+        value = self.env[name]
+        if value is builtin_env().get(name):
+            return # A builtin the worker has under the same name.
+        if name in self.builtin_names and name not in builtin_env() and callable(value) \
+                and not isinstance(value, (Procedure, Memoized)) and id(value) not in self.builtin_procedures:
+            return # One of the builtins each LispInterpreter makes for itself, such as spawn.
+        self.globals[name] = None # In case the value refers back to this name.
+        self.globals[name] = self.value(value)
+
+
+def serialize(proc: Procedure, env: GlobalEnv) -> bytes:
+    """Pickle a Procedure with everything it needs from env."""
+    serializer = Serializer(env)
+    spec = serializer.procedure(proc)
+    return pickle.dumps((spec, serializer.globals), pickle.HIGHEST_PROTOCOL)
+
+
+# -- The worker side.
+
+worker_lisp: Optional[LispInterpreter] = None # Only the base of the environments payloads are loaded into.
+worker_procedures: Dict[bytes, Procedure] = {} # Rebuilt procedures, by their serialized form.
+
+def start_worker():
+    """Run in each worker process as it starts."""
+    global worker_lisp
+    worker_lisp = LispInterpreter()
+
+
+def rebuild(lisp: LispInterpreter, spec: ProcedureSpec, built: dict) -> Procedure:
+    """Make a Procedure from a ProcedureSpec in the worker's interpreter."""
+    proc = built.get(id(spec))
+    if proc is not None:
+        return proc
+    names = [name for name, _ in spec.captured]
+    # (lambda (captured names...) (lambda parms body)) makes a closure over a frame with a slot
+    # for each captured variable, which are filled in below.
+    make = lisp.compiler.compile(['lambda', names, ['lambda', spec.parms, spec.body]])(None)
+    proc = built[id(spec)] = make(*[None] * len(names))
+    proc.code.name = spec.name
+    for i, (name, value) in enumerate(spec.captured, start=1):
+        proc.env[i] = restore(lisp, value, built)
+    return proc
+
+
+def restore(lisp: LispInterpreter, value, built: dict):
+    """Turn a value that was serialized back into what it stood for."""
+    if isinstance(value, ProcedureSpec):
+        return rebuild(lisp, value, built)
+    if isinstance(value, MemoizedSpec):
+        return Memoized(restore(lisp, value.proc, built), value.maxsize)
+    if isinstance(value, BuiltinRef):
+        return builtin_env()[value.name]
+    return value
+
+
+def load(payload: bytes) -> Procedure:
+    proc = worker_procedures.get(payload)
+    if proc is None:
+        if len(worker_procedures) > 32:
+            worker_procedures.clear()
+        spec, global_values = pickle.loads(payload)
+        # Each payload gets an overlay of its own, so the globals one payload brings (or sets) are
+        # gone for the next, which only sends what differs from the builtins.
+        lisp = LispInterpreter(env=worker_lisp.env.overlay())
+        lisp.pool = Pool(lisp.env, workers=1) # A pmap inside a pmap runs in the worker.
+        built = {}
+        for name, value in global_values.items():
+            lisp.env[name] = restore(lisp, value, built)
+        proc = worker_procedures[payload] = rebuild(lisp, spec, built)
+    return proc
+
+
+def map_chunk(payload: bytes, items: list) -> list:
+    proc = load(payload)
+    return [proc(item) for item in items]
+
+
+class Pool:
+    """A pool of worker processes for pmap, started when it is first needed."""
+    def __init__(self, env: GlobalEnv, workers: Optional[int] = None):
+        """
+        @param env: The global environment procedures are mapped from.
+        @param workers: How many processes to use.  Defaults to the number of CPUs.
+        """
+        self.env = env
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+
+    def map(self, proc: Callable, items: Iterable, chunk_size: Optional[int] = None) -> list:
+        """Call proc on each item, in parallel if it is worth it, and return a list of the results.
+
+        @param chunk_size: How many items to send to a worker at a time.  Defaults to splitting
+        the items into about four chunks per worker.
+        """
+        items = list(items)
+        if not isinstance(proc, Procedure) or self.workers < 2 or len(items) < sequential_below:
+            return [proc(item) for item in items]
+        if chunk_size is None:
+            chunk_size = -(-len(items) // (self.workers * 4))
+        if chunk_size < 1:
+            raise ValueError(f'pmap chunk size must be positive, got {chunk_size}')
+        payload = serialize(proc, self.env)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=start_worker)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        results = []
+        for chunk in self.executor.map(map_chunk, [payload] * len(chunks), chunks):
+            results.extend(chunk)
+        return results
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,248 @@
+"""Output ports: where print and display send their text.
+
+    (define out (open-output-string))
+    (display (list 1 2) out)
+    (get-output-string out)          ; -> (1 2)
+    (define log (open-output-file (quote "game.log")))
+    (display (quote started) log)
+    (print (quote frame) 1)          ; To the current output port, stdout unless the interpreter was given another.
+    (flush-output)
+
+A port keeps what is written to it in a list of strings and hands it on in one piece when there
+is buffer_size of it, when it is flushed, or, if it is line_buffered, at the end of each line.  So
+a loop printing thousands of lines makes a few large writes instead of a write and a flush per
+line.  stdout is a port like that, flushed when a LispInterpreter.run finishes, before the console
+or the task scheduler waits for anything, and when Python exits.  Other file ports are flushed
+when Python exits too, or when they are garbage collected, if they haven't been closed by then.
+
+write_value() writes a value the way unparse() shows it, straight into a port piece by piece, so
+printing a big nested list doesn't build a string for every sublist on the way.
+"""
+import atexit
+import contextlib
+import sys
+import weakref
+from typing import Callable, TextIO
+
+from .pairs import LazyList, Pair, nil
+
+default_buffer_size = 64 * 1024 # Characters.
+
+
+def write_value(exp, write: Callable[[str], object]):
+    """Write exp as lisp text by calling write with each piece of it.
+
+    This will for example write [1,2,3] or the lisp list (list 1 2 3) as '(1 2 3)'.
+    """
+    if isinstance(exp, list):
+        write('(')
+        first = True
+        for item in exp:
+            if not first:
+                write(' ')
+            first = False
+            write_value(item, write)
+        write(')')
+    elif type(exp) is Pair or type(exp) is LazyList:
+        write('(')
+        first = True
+        while True:
+            while type(exp) is Pair:
+                if not first:
+                    write(' ')
+                first = False
+                write_value(exp.car, write)
+                exp = exp.cdr
+            if type(exp) is not LazyList:
+                break
+            if exp.value is None:
+                write(' ...' if not first else '...') # Don't read what hasn't been read yet just to print it.
+                exp = nil
+                break
+            exp = exp.value
+        if exp is not nil:
+            write(' . ')
+            write_value(exp, write)
+        write(')')
+    elif exp is nil:
+        write('()')
+    else:
+        write(str(exp))
+
+
+class OutputPort:
+    """Buffers text written to it.  Subclasses say where the text goes when it is flushed, in write_out()."""
+    def __init__(self, buffer_size: int = default_buffer_size, line_buffered: bool = False):
+        """
+        @param buffer_size: How many characters to collect before writing them out.  0 writes out every write.
+        @param line_buffered: Also write out at the end of every line, as for a terminal.
+        """
+        self.buffer = []
+        self.size = 0 # Characters in the buffer.
+        self.buffer_size = buffer_size
+        self.line_buffered = line_buffered
+        self.closed = False
+
+    def write(self, text: str):
+        if self.closed:
+            raise ValueError('write to a closed port')
+        self.buffer.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size or (self.line_buffered and '\n' in text):
+            self.flush()
+
+    def write_value(self, exp):
+        write_value(exp, self.write)
+
+    def flush(self):
+        if self.buffer:
+            text = ''.join(self.buffer)
+            self.buffer.clear()
+            self.size = 0
+            self.write_out(text)
+
+    def write_out(self, text: str):
+        raise NotImplementedError
+
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.closed = True
+
+    def __enter__(self) -> 'OutputPort':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StringPort(OutputPort):
+    """Collects everything written to it, for getvalue()."""
+    def __init__(self):
+        super().__init__(buffer_size=sys.maxsize)
+
+    def flush(self):
+        pass # The buffer is where the text is kept.
+
+    def getvalue(self) -> str:
+        text = ''.join(self.buffer)
+        self.buffer[:] = [text] # So the next getvalue() doesn't join it all again.
+        return text
+
+    def __repr__(self):
+        return f'<StringPort {self.size} characters>'
+
+
+class FilePort(OutputPort):
+    """Writes to a text file."""
+    def __init__(self, file: TextIO, buffer_size: int = default_buffer_size, line_buffered: bool = False,
+            owned: bool = False):
+        """
+        @param owned: Close the file when the port is closed.
+        """
+        super().__init__(buffer_size, line_buffered)
+        self._file = file
+        self.owned = owned
+        _open_files.add(self)
+
+    @property
+    def file(self) -> TextIO:
+        return self._file
+
+    def write_out(self, text: str):
+        self.file.write(text)
+
+    def flush(self):
+        if self.buffer:
+            super().flush()
+            self.file.flush()
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            _open_files.discard(self)
+            if self.owned:
+                self.file.close()
+
+    def __del__(self):
+        if not self.closed and self.buffer:
+            self.flush() # Dropped without being closed, which would lose what is still buffered.
+
+    def __repr__(self):
+        return f'<FilePort {getattr(self.file, "name", self.file)!r}>'
+
+
+class StdoutPort(FilePort):
+    """Writes to whatever sys.stdout is when it flushes, so contextlib.redirect_stdout still works."""
+    def __init__(self, buffer_size: int = default_buffer_size, line_buffered: bool = False):
+        super().__init__(None, buffer_size, line_buffered)
+
+    @property
+    def file(self) -> TextIO:
+        return sys.stdout
+
+    def close(self):
+        self.flush() # Never really closed: the next write just goes to stdout again.
+
+_open_files = weakref.WeakSet() # FilePorts that haven't been closed, to flush at exit.
+
+@atexit.register
+def _flush_open_files():
+    for port in list(_open_files):
+        port.flush()
+
+stdout = StdoutPort() # The port for stdout.
+
+_current = stdout # Where print and display write by default.
+
+def current_output_port() -> OutputPort:
+    return _current
+
+@contextlib.contextmanager
+def output_to(port: OutputPort):
+    """Make port the current output port for the duration, and flush it at the end."""
+    global _current
+    previous, _current = _current, port
+    try:
+        yield port
+    finally:
+        _current = previous
+        port.flush()
+
+
+# -- Builtins for the standard environment.
+
+def lisp_print(*values):
+    """Write the values to the current output port, with spaces between them, and end the line."""
+    write = _current.write
+    for i, value in enumerate(values):
+        if i:
+            write(' ')
+        write_value(value, write)
+    write('\n')
+
+def display(value, port: OutputPort = None):
+    (port or _current).write_value(value)
+
+def newline(port: OutputPort = None):
+    (port or _current).write('\n')
+
+def flush_output(port: OutputPort = None):
+    (port or _current).flush()
+
+def open_output_file(path: str, append: bool = False) -> FilePort:
+    return FilePort(open(path.strip('"'), 'a' if append else 'w'), owned=True)
+
+
+def builtins() -> dict:
+    return {
+        'print':               lisp_print,
+        'display':             display,
+        'newline':             newline,
+        'flush-output':        flush_output,
+        'current-output-port': current_output_port,
+        'open-output-string':  StringPort,
+        'get-output-string':   lambda port: port.getvalue(),
+        'open-output-file':    open_output_file,
+        'close-port':          lambda port: port.close(),
+    }
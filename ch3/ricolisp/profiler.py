@@ -0,0 +1,116 @@
+"""Per-procedure profiling for compiled code.
+
+A Profiler is handed to the Compiler, which then builds instrumented closures: procedure bodies
+record their call count and time, calls to primitives (anything that isn't a Procedure) are timed
+through call_primitive(), and every node counts itself against the procedure that is running.
+Code compiled without a profiler contains none of this, so profiling costs nothing when it's off.
+"""
+import time
+from typing import Callable, Dict, List
+
+
+class ProfileEntry:
+    """The numbers collected for one procedure or primitive."""
+    __slots__ = ('name', 'kind', 'target', 'calls', 'inclusive', 'exclusive', 'nodes', 'active')
+
+    def __init__(self, name: str, kind: str, target=None):
+        """
+        @param name: What to call this in reports.
+        @param kind: 'procedure', 'primitive' or 'top level'.
+        @param target: The Lambda or primitive being profiled.
+        """
+        self.name = name
+        self.kind = kind
+        self.target = target
+        self.calls = 0
+        self.inclusive = 0.0 # Seconds spent in this, including whatever it called.
+        self.exclusive = 0.0 # Seconds spent in this, not counting whatever it called.
+        self.nodes = 0       # Expression nodes evaluated while this was the innermost procedure.
+        self.active = 0      # How many calls of this are in progress (more than one if it recursed).
+
+    def row(self) -> list:
+        """The entry as a lisp list: (name kind calls inclusive-ms exclusive-ms nodes)."""
+        return [self.name, self.kind, self.calls, round(self.inclusive * 1000, 3),
+            round(self.exclusive * 1000, 3), self.nodes]
+
+    def __repr__(self):
+        return (f'<ProfileEntry {self.name} calls={self.calls} inclusive={self.inclusive:.6f} '
+            f'exclusive={self.exclusive:.6f} nodes={self.nodes}>')
+
+
+class Profiler:
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.entries: Dict[int, ProfileEntry] = {} # id(target) -> entry
+        # One [entry, start time, time spent in callees] for each call in progress, innermost last.
+        self.stack = []
+        self.top_level = self.entry(self, '<top level>', 'top level')
+
+    def entry(self, target, name: str, kind: str) -> ProfileEntry:
+        """Get the entry for something being profiled, creating it if needed."""
+        entry = self.entries.get(id(target))
+        if entry is None:
+            # The entry keeps the target alive, so its id can't be reused by something else.
+            entry = self.entries[id(target)] = ProfileEntry(name, kind, target)
+        return entry
+
+    def reset(self):
+        """Forget everything collected so far."""
+        for entry in self.entries.values():
+            entry.calls = entry.nodes = 0
+            entry.inclusive = entry.exclusive = 0.0
+
+    def _enter(self, entry: ProfileEntry):
+        entry.calls += 1
+        entry.active += 1
+        self.stack.append([entry, self.clock(), 0.0])
+
+    def _exit(self):
+        entry, start, in_callees = self.stack.pop()
+        elapsed = self.clock() - start
+        entry.active -= 1
+        if entry.active == 0: # Only the outermost call of a recursion counts towards inclusive time.
+            entry.inclusive += elapsed
+        entry.exclusive += elapsed - in_callees
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def timed(self, entry: ProfileEntry, code: Callable, *args):
+        """Call code(*args), recording the call and its time against entry."""
+        self._enter(entry)
+        try:
+            return code(*args)
+        finally:
+            self._exit()
+
+    def wrap_procedure(self, lam, name: str, body: Callable) -> Callable:
+        """Instrument the compiled body of a Lambda."""
+        entry = self.entry(lam, name, 'procedure')
+        def profiled_body(frame):
+            return self.timed(entry, body, frame)
+        return profiled_body
+
+    def call_primitive(self, name: str, proc: Callable, args: list):
+        """Call something that isn't a Procedure, such as a builtin, and record it."""
+        return self.timed(self.entry(proc, name, 'primitive'), proc, *args)
+
+    def count_node(self, code: Callable) -> Callable:
+        """Instrument compiled code so it counts each time it runs."""
+        stack, top_level = self.stack, self.top_level
+        def counted(frame):
+            (stack[-1][0] if stack else top_level).nodes += 1
+            return code(frame)
+        return counted
+
+    def report(self) -> List[ProfileEntry]:
+        """Get the entries that have been used, most expensive (by exclusive time) first."""
+        used = [entry for entry in self.entries.values() if entry.calls or entry.nodes]
+        return sorted(used, key=lambda entry: entry.exclusive, reverse=True)
+
+    def format_report(self) -> str:
+        """Get the report as a table of text."""
+        lines = [f'{"name":<24} {"kind":<10} {"calls":>10} {"incl ms":>12} {"excl ms":>12} {"nodes":>12}']
+        for entry in self.report():
+            lines.append(f'{entry.name:<24} {entry.kind:<10} {entry.calls:>10} {entry.inclusive * 1000:>12.3f} '
+                f'{entry.exclusive * 1000:>12.3f} {entry.nodes:>12}')
+        return '\n'.join(lines)
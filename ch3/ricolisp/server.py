@@ -0,0 +1,299 @@
+"""Serve evaluation requests from a pool of pre-warmed interpreters.
+
+    python -m ricolisp.server [--tcp 127.0.0.1:7373 | --unix /tmp/ricolisp.sock] [--workers 4]
+                              [--prelude prelude.lisp ...] [--timeout 5] [--engine compile]
+
+Each worker process builds one interpreter and loads the preludes into it once.  Every request then
+runs in a fresh LispInterpreter on an overlay of that environment (see OverlayEnv), which costs
+almost nothing to make, so requests see the prelude but can't change it for each other.  Once the
+preludes are loaded the worker freezes their environment: a request can define its own version of a
+prelude name, but a set! of a prelude global, even from inside a prelude procedure, is an error.
+Data structures the prelude made, such as tables, are still shared, so requests shouldn't mutate them.
+
+The protocol is one JSON object per line in each direction:
+
+    {"source": "(fact 10)", "timeout": 2}
+        -> {"ok": true, "value": "3628800", "output": "", "ms": 0.41}
+    {"source": "(car 1)"}
+        -> {"ok": false, "error": "TypeError: expected a list, got 1", "output": "", "ms": 0.3}
+    {"stats": true}
+        -> {"ok": true, "stats": {"count": 2, "p50_ms": 0.3, "p90_ms": 0.41, "p99_ms": 0.41, "max_ms": 0.41}}
+
+value is the unparsed result of the last expression in source, and output is whatever it printed.
+Requests on different connections, or sent without waiting for the previous answer, run
+concurrently on different workers.  A request that runs past its timeout is interrupted; if the
+worker doesn't answer soon after that, it is killed and replaced.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+from .interpreter import LispInterpreter, unparse
+from .ports import StringPort
+
+default_address = ('127.0.0.1', 7373)
+default_timeout = 5.0
+kill_grace = 1.0 # Seconds past the timeout before a worker that hasn't answered is killed.
+
+
+class RequestTimeout(Exception):
+    pass
+
+
+def _timed_out(signum, frame):
+    raise RequestTimeout('request took too long')
+
+
+def check_timeout(timeout):
+    """Raise ValueError unless timeout is None or a positive number of seconds."""
+    if timeout is not None and (type(timeout) not in (int, float) or not 0 < timeout < math.inf):
+        raise ValueError(f'timeout should be a positive number of seconds, got {timeout!r}')
+
+
+def evaluate(base: LispInterpreter, source: str, timeout: Optional[float]) -> dict:
+    """Run source in an overlay of base's environment and describe the outcome."""
+    output = StringPort()
+    lisp = LispInterpreter(engine=base.engine, env=base.env.overlay(), output=output)
+    timer = timeout and hasattr(signal, 'setitimer')
+    try:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        result = lisp.run_stream(source)
+        response = {'ok': True, 'value': None if result is None else unparse(result)}
+    except Exception as error:
+        response = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+    finally:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    response['output'] = output.getvalue()
+    return response
+
+
+def worker_main(connection, engine: str, preludes: List[str]):
+    """The loop run by each worker process: load the preludes, then answer requests until told to stop."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is for the server to handle.
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _timed_out)
+    try:
+        base = LispInterpreter(engine=engine)
+        for prelude in preludes:
+            base.run_file(prelude)
+        base.env.freeze()
+    except Exception as error:
+        connection.send({'ok': False, 'error': f'{type(error).__name__}: {error}'})
+        return
+    connection.send({'ok': True})
+    while True:
+        request = connection.recv()
+        if request is None:
+            return
+        try:
+            source, timeout = request
+            response = evaluate(base, source, timeout)
+        except Exception as error: # Whatever goes wrong, the worker stays up to answer the next request.
+            response = {'ok': False, 'error': f'{type(error).__name__}: {error}', 'output': ''}
+        connection.send(response)
+
+
+class Worker:
+    """A worker process and the pipe to it."""
+    def __init__(self, engine: str, preludes: List[str]):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_main, args=(child, engine, preludes), daemon=True)
+        self.process.start()
+        child.close()
+        ready = self.connection.recv()
+        if not ready['ok']:
+            self.stop()
+            raise RuntimeError(f'Worker failed to load the prelude: {ready["error"]}')
+
+    def stop(self, kill: bool = False):
+        if kill:
+            self.process.kill()
+        else:
+            with contextlib.suppress(OSError):
+                self.connection.send(None)
+        self.process.join()
+        self.connection.close()
+
+
+class LatencyStats:
+    """Keeps the latencies of recent requests and reports percentiles of them."""
+    def __init__(self, size: int = 10000):
+        self.latencies = deque(maxlen=size) # Seconds.
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def report(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)] * 1000, 3)
+        return {'count': self.count, 'p50_ms': percentile(50), 'p90_ms': percentile(90),
+            'p99_ms': percentile(99), 'max_ms': percentile(100)}
+
+
+class InterpreterPool:
+    """Worker processes with warmed interpreters, handed out to one request at a time."""
+    def __init__(self, workers: int = None, preludes: List[str] = (), engine: str = 'compile',
+            timeout: float = default_timeout):
+        """
+        @param workers: How many processes.  Defaults to the number of CPUs.
+        @param preludes: Files of lisp code every request can use.
+        @param timeout: The default time limit for a request, in seconds, or None for no limit.
+        """
+        check_timeout(timeout)
+        self.engine = engine
+        self.preludes = list(preludes)
+        self.timeout = timeout
+        self.stats = LatencyStats()
+        self.workers = [Worker(engine, self.preludes) for _ in range(workers or os.cpu_count() or 1)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def evaluate(self, source: str, timeout: float = None) -> dict:
+        """Run source on the next free worker.  This blocks, and is safe to call from many threads."""
+        start = time.perf_counter()
+        timeout = self.timeout if timeout is None else timeout
+        check_timeout(timeout)
+        worker = self.idle.get()
+        try:
+            try:
+                worker.connection.send((source, timeout))
+                answered = worker.connection.poll(timeout + kill_grace if timeout else None)
+                response = worker.connection.recv() if answered else None
+            except (EOFError, OSError) as error: # BrokenPipeError is an OSError.
+                response = {'ok': False, 'error': f'WorkerDied: {type(error).__name__}: {error}', 'output': ''}
+                worker = self._replace(worker)
+            else:
+                if response is None:
+                    # Stuck somewhere the timer can't interrupt.  Replace the worker.
+                    response = {'ok': False, 'error': 'RequestTimeout: request took too long', 'output': ''}
+                    worker = self._replace(worker)
+        finally:
+            self.idle.put(worker)
+        elapsed = time.perf_counter() - start
+        self.stats.record(elapsed)
+        response['ms'] = round(elapsed * 1000, 3)
+        return response
+
+    def _replace(self, worker: Worker) -> Worker:
+        worker.stop(kill=True)
+        new = Worker(self.engine, self.preludes)
+        self.workers[self.workers.index(worker)] = new
+        return new
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+
+class Server:
+    """Accepts connections and passes each request line to an InterpreterPool."""
+    def __init__(self, pool: InterpreterPool):
+        self.pool = pool
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock() # Responses go out whole, one at a time, in whatever order they finish.
+        pending = set()
+        async def answer(line: bytes):
+            response = await self.respond(line)
+            async with lock:
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.ensure_future(answer(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            writer.close()
+
+    async def respond(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            if request.get('stats'):
+                return {'ok': True, 'stats': self.pool.stats.report()}
+            source, timeout = request['source'], request.get('timeout')
+            check_timeout(timeout)
+        except (ValueError, KeyError, AttributeError) as error:
+            return {'ok': False, 'error': f'Bad request: {error!r}'}
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.pool.evaluate, source, timeout)
+
+    async def serve(self, tcp: tuple = None, unix: str = None, started: threading.Event = None):
+        """Serve forever on a TCP (host, port) or a Unix socket path."""
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            server = await asyncio.start_server(self.handle, *(tcp or default_address))
+        if started:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+
+def request(address, message: dict) -> dict:
+    """Send one request to a server and return the response.
+
+    @param address: A (host, port) tuple, or the path of a Unix socket.
+    """
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.connect(address)
+        connection.sendall(json.dumps(message).encode() + b'\n')
+        connection.shutdown(socket.SHUT_WR)
+        return json.loads(connection.makefile('rb').readline())
+
+
+def parse_address(text: str) -> tuple:
+    host, _, port = text.rpartition(':')
+    return (host or default_address[0], int(port))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument('--tcp', type=parse_address, help='host:port to listen on (default 127.0.0.1:7373).')
+    where.add_argument('--unix', help='Path of a Unix socket to listen on.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU).')
+    parser.add_argument('--prelude', nargs='*', default=[], help='Files of lisp code to load into every worker.')
+    parser.add_argument('--timeout', type=float, default=default_timeout, help='Default per-request time limit in seconds.')
+    parser.add_argument('--engine', default='compile', choices=LispInterpreter.engines)
+    args = parser.parse_args(argv)
+
+    pool = InterpreterPool(args.workers, args.prelude, args.engine, args.timeout)
+    print(f'Serving on {args.unix or args.tcp or default_address} with {len(pool.workers)} workers')
+    try:
+        asyncio.run(Server(pool).serve(args.tcp, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
+        print(json.dumps(pool.stats.report()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Hash tables, and association lists that get an index when they are long.
+
+    (define ages (make-hash))
+    (hash-set! ages (quote alice) 31)
+    (hash-set! ages (list 1 2) (quote pair)) ; Lists can be keys.
+    (hash-ref ages (list 1 2))               ; -> pair
+    (hash-ref ages (quote bob) 0)            ; -> 0, the default
+    (hash-for-each ages (lambda (k v) (print k)))
+
+Keys are compared like equal?: two lists with the same contents are the same key, however they
+were made.  A HashTable is a Python dict underneath, and lists, which aren't hashable, are looked
+up by a tuple of their contents (see ricolisp.memo.canonical_key).
+
+(assoc key alist) and (assq key alist) find the first entry of an association list whose car is
+equal? or eq? to key, and return it, or False if there isn't one.  They walk the list like any
+lisp would, but once a list turns out to have index_threshold entries or more it gets an index,
+kept as long as the list is, so looking things up in the same long list again is O(1).  Lisp code
+can't change a list once it is made, so the index never goes stale.
+
+A list grown with cons, (set! env (cons (list k v) env)), has a new head after every cons.  Its
+index is made by taking over the index of the longest indexed list it ends with and adding the
+few entries in front of that, so growing a list and looking things up in it as it grows costs
+O(1) per cons, and there is only ever one index for the whole chain.
+"""
+import weakref
+from typing import Iterator
+
+from .memo import canonical_key
+from .pairs import LazyList, Pair, as_lisp_list, car, force, make_list, nil
+
+index_threshold = 32 # Association lists with at least this many entries get an index.
+
+
+def table_key(x):
+    """The dict key for x: x itself, or a tuple of its contents if it is a list."""
+    if type(x) is Pair or type(x) is LazyList or isinstance(x, (list, tuple)):
+        x = force(x)
+        return canonical_key(x) if x else nil # Every empty list is nil.
+    return x
+
+
+class HashTable:
+    """A mutable mapping from lisp values to lisp values, with keys compared by equal?."""
+    __slots__ = ('entries',)
+
+    def __init__(self, alist=nil):
+        """
+        @param alist: Entries to start with, as an association list of (key value) lists.
+        """
+        self.entries = {} # table_key(key) -> (key, value), so the keys can be given back as they were.
+        for entry in as_lisp_list(alist):
+            entry = as_lisp_list(entry)
+            self.set(entry.car, car(entry.cdr))
+
+    def ref(self, key, *default):
+        try:
+            return self.entries[table_key(key)][1]
+        except KeyError:
+            if default:
+                return default[0]
+            raise KeyError(f'hash-ref: no value for key {key!r}') from None
+
+    def set(self, key, value):
+        self.entries[table_key(key)] = (key, value)
+
+    def remove(self, key):
+        self.entries.pop(table_key(key), None)
+
+    def __contains__(self, key) -> bool:
+        return table_key(key) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator:
+        return (key for key, _ in self.entries.values())
+
+    def items(self) -> Iterator:
+        return iter(list(self.entries.values())) # A copy, so a procedure called on each item can change the table.
+
+    def __repr__(self):
+        return f'<HashTable {len(self.entries)} entries>'
+
+
+def _as_table(table) -> HashTable:
+    if not isinstance(table, HashTable):
+        raise TypeError(f'expected a hash table, got {table!r}')
+    return table
+
+def hash_set(table, key, value):
+    _as_table(table).set(key, value)
+
+def hash_remove(table, key):
+    _as_table(table).remove(key)
+
+def hash_for_each(table, proc):
+    """Call proc with each key and value."""
+    for key, value in _as_table(table).items():
+        proc(key, value)
+
+
+# -- Association lists.
+
+_indexes = {} # (id(alist), kind) -> (weakref to alist, index) for each long list looked up.
+
+def _index(alist: Pair, kind: str) -> dict:
+    """Get the index of a long association list, making it the first time.
+
+    @param kind: 'assoc' to index by table_key(key), or 'assq' by id(key).
+    """
+    cache_key = (id(alist), kind)
+    cached = _indexes.get(cache_key)
+    if cached is not None and cached[0]() is alist:
+        return cached[1]
+
+    # Walk up to the first tail that has an index, if any, and take it over.
+    entries = []
+    index = {}
+    x = alist
+    while type(x) is Pair:
+        tail_key = (id(x), kind)
+        cached = _indexes.get(tail_key)
+        if cached is not None and cached[0]() is x:
+            del _indexes[tail_key]
+            index = cached[1]
+            break
+        entries.append(x.car)
+        x = force(x.cdr)
+    key_of = table_key if kind == 'assoc' else id
+    for entry in reversed(entries):
+        index[key_of(car(entry))] = entry # The first entry for a key wins, as when walking the list.
+    _indexes[cache_key] = (weakref.ref(alist, lambda _: _indexes.pop(cache_key, None)), index)
+    return index
+
+def assoc(key, alist):
+    """The first entry of alist whose car is equal? to key, or False."""
+    alist = x = as_lisp_list(alist)
+    for _ in range(index_threshold):
+        if type(x) is not Pair:
+            return False
+        entry = x.car
+        if car(entry) == key:
+            return entry
+        x = force(x.cdr)
+    return _index(alist, 'assoc').get(table_key(key), False)
+
+def assq(key, alist):
+    """The first entry of alist whose car is eq? to key, or False."""
+    alist = x = as_lisp_list(alist)
+    for _ in range(index_threshold):
+        if type(x) is not Pair:
+            return False
+        entry = x.car
+        if car(entry) is key:
+            return entry
+        x = force(x.cdr)
+    return _index(alist, 'assq').get(id(key), False)
+
+
+def builtins() -> dict:
+    return {
+        'make-hash':     HashTable,
+        'hash?':         lambda x: isinstance(x, HashTable),
+        'hash-ref':      lambda table, key, *default: _as_table(table).ref(key, *default),
+        'hash-set!':     hash_set,
+        'hash-remove!':  hash_remove,
+        'hash-has-key?': lambda table, key: key in _as_table(table),
+        'hash-count':    lambda table: len(_as_table(table)),
+        'hash-keys':     lambda table: make_list(list(_as_table(table))),
+        'hash-values':   lambda table: make_list([value for _, value in _as_table(table).items()]),
+        'hash->list':    lambda table: make_list([make_list(item) for item in _as_table(table).items()]),
+        'hash-for-each': hash_for_each,
+        'assoc':         assoc,
+        'assq':          assq,
+    }
@@ -0,0 +1,264 @@
+"""Lightweight cooperative tasks.
+
+    (define ch (make-channel))
+    (define ticker (lambda (n) (begin (send ch n) (sleep 0.1) (ticker (+ n 1)))))
+    (define printer (lambda () (begin (print (recv ch)) (printer))))
+    (spawn ticker 0)
+    (spawn printer)
+
+(spawn proc args...) starts a task that calls proc, and returns it.  Tasks take turns: one runs
+until it calls (yield), (sleep seconds), (recv channel) or (join task), and then the Scheduler
+runs the next one that is ready.  (send channel value) never waits.
+
+Each task runs on a ricolisp.vm.Thread, whose state is a few lists, so a task costs well under a
+kilobyte and switching tasks is a Python exception and a list append.  Procedures made by the
+closure compiler are compiled to bytecode the first time a task calls them, so tasks work with
+the 'compile' and 'vm' engines; the 'eval' engine's procedures are Python calls all the way down,
+so spawn refuses them.  A task can only pause in Lisp code: a blocking primitive called from inside
+a Python builtin (say, the procedure given to map) raises CannotSuspend, and the task fails.
+
+Called from outside any task, the blocking primitives run the other tasks until they can return,
+so a program's top level can (join) or (recv) from tasks, and (sleep) there waits even if there
+are no tasks.  (run-tasks) runs until every task has
+finished or is waiting for something that will never happen.  LispInterpreter.repl_async() runs
+tasks in the background of an asyncio event loop while waiting for input.
+"""
+import heapq
+import itertools
+import sys
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from . import ports
+from .interpreter import GlobalEnv, Procedure
+from .vm import BytecodeCompiler, Suspend, Thread
+
+
+class TaskError(Exception):
+    """Raised when joining a task that failed."""
+
+
+class Task:
+    """One green thread.  state is 'ready', 'waiting', 'done' or 'failed'."""
+    __slots__ = ('name', 'thread', 'state', 'result', 'error', 'joiners')
+
+    def __init__(self, name: str, thread: Thread):
+        self.name = name
+        self.thread = thread
+        self.state = 'ready'
+        self.result = None
+        self.error = None
+        self.joiners = [] # Tasks waiting in (join) for this one.
+
+    def __repr__(self):
+        return f'<Task {self.name} {self.state}>'
+
+
+class Channel:
+    """An unbounded queue of values between tasks."""
+    __slots__ = ('items', 'receivers')
+
+    def __init__(self):
+        self.items = deque()
+        self.receivers = deque() # Tasks waiting in (recv), first come first served.
+
+    def __repr__(self):
+        return f'<Channel {len(self.items)} items, {len(self.receivers)} waiting>'
+
+
+class Primitive:
+    """A builtin that may pause the task that calls it."""
+    __slots__ = ('name', 'function')
+
+    def __init__(self, name: str, function: Callable):
+        self.name = name
+        self.function = function
+
+    def __call__(self, *args):
+        try:
+            return self.function(*args)
+        except Suspend as suspend:
+            suspend.primitive = self
+            raise
+
+    def __repr__(self):
+        return self.name
+
+
+class Scheduler:
+    def __init__(self, env: GlobalEnv, compiler: BytecodeCompiler = None, clock: Callable[[], float] = time.monotonic):
+        """
+        @param env: The global environment the tasks run in.
+        @param compiler: Compiles procedures for the tasks' Threads.  By default one is made for env
+        when the first task is spawned.
+        """
+        self.env = env
+        self.compiler = compiler
+        self.clock = clock
+        self.ready = deque() # (task, value to resume it with)
+        self.sleepers = []   # Heap of (time to wake, sequence number, task).
+        self.sequence = itertools.count()
+        self.current: Optional[Task] = None
+        self.names = itertools.count(1)
+        self.paused: Optional[Callable[[Task], None]] = None # Where the current task goes once it has paused (see _pause).
+
+    def builtins(self) -> dict:
+        return {
+            'spawn':        self.spawn,
+            'yield':        Primitive('yield', self.yield_),
+            'sleep':        Primitive('sleep', self.sleep),
+            'make-channel': Channel,
+            'send':         self.send,
+            'recv':         Primitive('recv', self.recv),
+            'join':         Primitive('join', self.join),
+            'run-tasks':    self.run,
+        }
+
+    # -- Running tasks.
+
+    def spawn(self, proc: Callable, *args) -> Task:
+        """Start a task that calls proc(*args)."""
+        if isinstance(proc, Procedure) and proc.code is None:
+            raise TypeError(f'spawn needs the compile or vm engine: {proc!r} was made by the eval engine, '
+                'which can\'t pause it')
+        if self.compiler is None:
+            self.compiler = BytecodeCompiler(self.env)
+        code = getattr(proc, 'code', None)
+        name = f'{getattr(code, "name", "task")}-{next(self.names)}'
+        task = Task(name, Thread(proc, args, self.compiler))
+        self.ready.append((task, None))
+        return task
+
+    def _run(self, task: Task, value):
+        """Run a task until it pauses or finishes."""
+        self.current = task
+        try:
+            result = task.thread.resume(value)
+        except Exception as error:
+            task.state, task.error = 'failed', error
+            if not task.joiners:
+                print(f'task {task.name} failed: {error!r}', file=sys.stderr)
+        else:
+            if type(result) is Suspend:
+                queue, self.paused = self.paused, None
+                queue(task)
+                return
+            task.state, task.result = 'done', result
+        finally:
+            self.current = None
+        self._finished(task)
+
+    def _finished(self, task: Task):
+        """Wake up the tasks joining one that has finished.  If it failed, so do they."""
+        task.thread = None
+        for joiner in task.joiners:
+            if joiner is None: # The top level, which is running the scheduler until the task finishes.
+                continue
+            if task.state == 'done':
+                self.ready.append((joiner, task.result))
+            else:
+                joiner.state, joiner.error = 'failed', TaskError(f'task {task.name} failed: {task.error!r}')
+                self._finished(joiner)
+
+    def step(self) -> bool:
+        """Run each task that is ready now, once.  Returns False if there was nothing to run."""
+        now = self.clock()
+        while self.sleepers and self.sleepers[0][0] <= now:
+            task = heapq.heappop(self.sleepers)[2]
+            self.ready.append((task, None))
+        if not self.ready:
+            return False
+        for _ in range(len(self.ready)):
+            task, value = self.ready.popleft()
+            task.state = 'ready'
+            self._run(task, value)
+        return True
+
+    def idle_time(self) -> Optional[float]:
+        """How long until a task will be ready: 0 if one is now, None if none is even sleeping."""
+        if self.ready:
+            return 0
+        if self.sleepers:
+            return max(0, self.sleepers[0][0] - self.clock())
+        return None
+
+    def run(self, until: Callable[[], bool] = None, wake: Optional[float] = None):
+        """Run tasks until until() is true, or by default until no task can run any more.
+
+        @param wake: A time until() will be true at, so there is no need for a task to make it true.
+        """
+        while until is None or not until():
+            delay = self.idle_time()
+            if wake is not None:
+                until_wake = max(0, wake - self.clock())
+                delay = until_wake if delay is None else min(delay, until_wake)
+            if delay is None:
+                if until is None:
+                    return
+                raise Exception('Deadlock: waiting for something no task can do')
+            if delay:
+                ports.current_output_port().flush() # So what the tasks printed shows up while we wait.
+                time.sleep(delay)
+            self.step()
+
+    async def run_async(self, poll_interval: float = 0.05):
+        """Run tasks forever in an asyncio event loop, letting other coroutines run in between."""
+        import asyncio
+        while True:
+            self.step()
+            ports.current_output_port().flush()
+            delay = self.idle_time()
+            await asyncio.sleep(poll_interval if delay is None else min(delay, poll_interval))
+
+    # -- Primitives.  Inside a task they pause it; outside any task they run the tasks until they can return.
+
+    def _pause(self, queue: Callable[[Task], None], state: str = 'waiting'):
+        """Pause the current task.  Once it has paused, queue(task) puts it where it will be resumed
+        from.  It is left until then because the task may not be able to pause (see CannotSuspend),
+        in which case it fails instead, and mustn't be resumed."""
+        self.current.state = state
+        self.paused = queue
+        raise Suspend()
+
+    def yield_(self):
+        """Let the other tasks run."""
+        if self.current is None:
+            self.step()
+            return None
+        self._pause(lambda task: self.ready.append((task, None)), 'ready')
+
+    def sleep(self, seconds: float):
+        wake = self.clock() + seconds
+        if self.current is None:
+            self.run(until=lambda: self.clock() >= wake, wake=wake)
+            return None
+        self._pause(lambda task: heapq.heappush(self.sleepers, (wake, next(self.sequence), task)))
+
+    def send(self, channel: Channel, value):
+        if channel.receivers:
+            self.ready.append((channel.receivers.popleft(), value))
+        else:
+            channel.items.append(value)
+
+    def recv(self, channel: Channel):
+        if channel.items:
+            return channel.items.popleft()
+        if self.current is None:
+            self.run(until=lambda: bool(channel.items))
+            return channel.items.popleft()
+        self._pause(channel.receivers.append)
+
+    def join(self, task: Task):
+        """Wait for a task to finish and return its result."""
+        if task.state not in ('done', 'failed'):
+            if self.current is None:
+                task.joiners.append(None) # So a failure is reported here rather than printed.
+                self.run(until=lambda: task.state in ('done', 'failed'))
+            else:
+                if task is self.current:
+                    raise TaskError('A task cannot join itself')
+                self._pause(task.joiners.append)
+        if task.state == 'failed':
+            raise TaskError(f'task {task.name} failed: {task.error!r}')
+        return task.result
@@ -0,0 +1,140 @@
+"""A timeline of what the interpreter did, for finding the frames of a game loop that took too long.
+
+    lisp = LispInterpreter(trace=True)
+    lisp.run_file('game.lisp')
+    lisp.tracer.save('trace.json')   ; Or (trace-save (quote "trace.json")) from lisp.
+
+The profiler (see ricolisp.profiler) adds up where the time went; a Tracer keeps when it went.
+Every procedure call and every LispInterpreter.run records an enter event and an exit event, each
+with a timestamp, and save() writes them in the Chrome Trace Event format, which chrome://tracing,
+Perfetto and speedscope open as a flame chart over time.
+
+Events go into a ring buffer that is allocated up front, capacity events long: a list of names and
+an array of integer nanoseconds.  Recording one is a read of the clock and two stores, with no
+allocation, so tracing can be left on.  Once the buffer is full each new event overwrites
+the oldest, so the trace always holds the most recent capacity events.  A call whose enter event has
+been overwritten is left out of the export; one still running when it is exported has no end.
+
+Tracing needs the compile engine.  It instruments procedure bodies the way the profiler does, and
+the Python functions the Jit makes (see ricolisp.jit) record their calls too.
+"""
+import contextlib
+import os
+import time
+from array import array
+from typing import Callable, Iterator, List, Optional, Tuple
+
+default_capacity = 1 << 16 # Events kept.
+
+
+class Tracer:
+    def __init__(self, capacity: int = default_capacity, clock: Callable[[], int] = time.perf_counter_ns):
+        """
+        @param capacity: How many events to keep.  It is rounded up to a power of two.
+        @param clock: Returns the time in integer nanoseconds.
+        """
+        self.capacity = 1 << max(capacity - 1, 0).bit_length()
+        self.clock = clock
+        self.names: List[Optional[str]] = [None] * self.capacity
+        self.times = array('q', bytes(8 * self.capacity)) # Enter events are stored as the time, exit events as minus it.
+        self.origin = clock() # Exported timestamps are from here.
+        self.enter, self.exit, self._recorded, self._reset = self._recorders()
+
+    def _recorders(self):
+        """Make enter(name) and exit(name), which record events, and functions to get and reset the count.
+
+        They are closures rather than methods because recording has to be cheap, and the count is
+        kept in a closure variable because that is quicker to update than an attribute."""
+        names, times, clock, mask = self.names, self.times, self.clock, self.capacity - 1
+        n = 0 # Events recorded, including those overwritten since.
+        def enter(name: str):
+            nonlocal n
+            i = n & mask
+            names[i] = name
+            times[i] = clock()
+            n += 1
+        def exit(name: str):
+            nonlocal n
+            i = n & mask
+            names[i] = name
+            times[i] = -clock()
+            n += 1
+        def recorded() -> int:
+            return n
+        def reset():
+            nonlocal n
+            n = 0
+        return enter, exit, recorded, reset
+
+    @property
+    def recorded(self) -> int:
+        """Events recorded since the tracer was made or cleared, including those overwritten since."""
+        return self._recorded()
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """Record entering name at the start and leaving it at the end."""
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit(name)
+
+    def wrap_procedure(self, lam, name: str, body: Callable) -> Callable:
+        """Instrument the compiled body of a Lambda."""
+        enter, exit = self.enter, self.exit
+        def traced_body(frame):
+            enter(name)
+            try:
+                return body(frame)
+            finally:
+                exit(name)
+        return traced_body
+
+    def clear(self):
+        self._reset()
+        self.origin = self.clock()
+
+    @property
+    def dropped(self) -> int:
+        """How many events have been overwritten."""
+        return max(self.recorded - self.capacity, 0)
+
+    def events(self) -> Iterator[Tuple[str, str, int]]:
+        """The events in the buffer, oldest first, as (phase, name, nanoseconds), where phase is
+        'B' for entering name and 'E' for leaving it, as the Chrome format spells them."""
+        recorded = self.recorded
+        for n in range(max(recorded - self.capacity, 0), recorded):
+            i = n & (self.capacity - 1)
+            ns = self.times[i]
+            yield ('B', self.names[i], ns) if ns >= 0 else ('E', self.names[i], -ns)
+
+    def chrome_trace(self) -> dict:
+        """The events as a Chrome Trace Event Format object, ready for json.dump."""
+        pid = os.getpid()
+        trace = []
+        depth = 0
+        for phase, name, ns in self.events():
+            if phase == 'E':
+                if depth == 0:
+                    continue # Its enter event was overwritten.
+                depth -= 1
+            else:
+                depth += 1
+            trace.append({'name': name, 'cat': 'lisp', 'ph': phase, 'ts': (ns - self.origin) / 1000,
+                'pid': pid, 'tid': 1})
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms', 'otherData': {'dropped': self.dropped}}
+
+    def save(self, path: str):
+        """Write the events to a file in the Chrome Trace Event Format."""
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+    def __repr__(self):
+        return f'<Tracer {min(self.recorded, self.capacity)}/{self.capacity} events>'
+
+
+def traced(tracer: Optional[Tracer], name: str):
+    """A context manager recording a span on tracer, or doing nothing if it is None."""
+    return contextlib.nullcontext() if tracer is None else tracer.span(name)
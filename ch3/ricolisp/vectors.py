@@ -0,0 +1,110 @@
+"""Numeric vectors backed by NumPy arrays.
+
+A vector is a one-dimensional numpy.ndarray.  The arithmetic and comparison builtins in the
+standard environment (+, -, *, /, <, ...) already work elementwise on arrays, and builtins() wraps
+the functions copied in from math so that sqrt, sin and friends do too.  Together with the
+reductions and masked selection below, a whole frame of per-entity updates can be a handful of
+vectorized calls instead of thousands of interpreted ones:
+
+    (define x (+ x (* vx dt)))
+    (define hit (< (sqrt (+ (* dx dx) (* dy dy))) radius))
+    (vector-count hit)
+
+NumPy is optional.  Without it, builtins() returns nothing and the interpreter works as before.
+Importing NumPy takes far longer than the rest of startup, so it is only imported when a vector is
+first made (see load_numpy).
+"""
+import importlib.util
+import math
+import sys
+from typing import Callable, Dict
+
+from . import pairs
+
+numpy = None # The numpy module, once load_numpy() has imported it.
+
+
+def load_numpy():
+    global numpy
+    if numpy is None:
+        import numpy
+    return numpy
+
+
+def ndarray_type():
+    """numpy.ndarray, or None if nothing has imported NumPy yet, in which case there are no arrays to find."""
+    module = sys.modules.get('numpy')
+    return None if module is None else module.ndarray
+
+
+def broadcasting(name: str, scalar: Callable) -> Callable:
+    """Make a function that uses the math version for plain numbers and the numpy version of the same name for vectors."""
+    def function(*args):
+        ndarray = ndarray_type()
+        if ndarray is not None:
+            for arg in args:
+                if type(arg) is ndarray:
+                    elementwise = getattr(load_numpy(), name, None)
+                    if isinstance(elementwise, numpy.ufunc):
+                        return elementwise(*args)
+        return scalar(*args)
+    function.__name__ = name
+    function.__doc__ = scalar.__doc__
+    return function
+
+
+def vector(*items):
+    return load_numpy().array(items, dtype=float)
+
+def make_vector(n: int, fill=0.0):
+    return load_numpy().full(n, fill, dtype=float)
+
+def vector_range(*args):
+    """(vector-range stop), (vector-range start stop) or (vector-range start stop step)."""
+    return load_numpy().arange(*args, dtype=float)
+
+def list_to_vector(x):
+    return load_numpy().array(list(pairs.as_lisp_list(x)), dtype=float)
+
+def vector_to_list(v):
+    return pairs.make_list(v.tolist())
+
+def vector_set(v, i: int, value):
+    v[i] = value
+
+def is_vector(x) -> bool:
+    ndarray = ndarray_type()
+    return ndarray is not None and isinstance(x, ndarray)
+
+
+def builtins() -> Dict[str, Callable]:
+    """The vector builtins for the standard environment, or nothing if NumPy isn't installed."""
+    if importlib.util.find_spec('numpy') is None:
+        return {}
+    env = {name: broadcasting(name, scalar) for name, scalar in vars(math).items() if callable(scalar)}
+    env.update({
+        'vector':         vector,
+        'make-vector':    make_vector,
+        'vector-range':   vector_range,
+        'list->vector':   list_to_vector,
+        'vector->list':   vector_to_list,
+        'vector?':        is_vector,
+        'vector-length':  len,
+        'vector-ref':     lambda v, i: v[i].item(),
+        'vector-set!':    vector_set,
+        'vector-copy':    lambda v: v.copy(),
+        'vector-sum':     lambda v: v.sum().item(),
+        'vector-min':     lambda v: v.min().item(),
+        'vector-max':     lambda v: v.max().item(),
+        'vector-argmin':  lambda v: int(v.argmin()),
+        'vector-argmax':  lambda v: int(v.argmax()),
+        'vector-dot':     lambda a, b: load_numpy().dot(a, b).item(),
+        'vector-any':     lambda v: bool(v.any()),
+        'vector-all':     lambda v: bool(v.all()),
+        'vector-count':   lambda mask: int(load_numpy().count_nonzero(mask)),
+        'vector-select':  lambda v, mask: v[mask],        # The elements where mask is true.
+        'vector-where':   lambda mask, a, b: load_numpy().where(mask, a, b), # a where mask is true, else b.
+        'vector-indexes': lambda mask: load_numpy().flatnonzero(mask).astype(float),
+        'vector-clip':    lambda v, low, high: load_numpy().clip(v, low, high),
+    })
+    return env
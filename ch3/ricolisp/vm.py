@@ -0,0 +1,521 @@
+"""A bytecode compiler and stack virtual machine for ricolisp.
+
+The BytecodeCompiler lowers a parsed expression to a CodeObject: a flat list of integers holding
+opcodes with their operands inline, plus a table of constants.  run() executes a CodeObject with
+one loop that fetches an opcode and dispatches on it, keeping intermediate values on a list used as
+a stack.
+
+Variables are resolved the same way as in ricolisp.compiler, and procedure activations use the
+same list frames, so both engines can share Procedure objects.  When one VM procedure calls
+another, the VM saves where it was and jumps into the callee instead of calling run() again, so
+deep recursion doesn't use the Python stack at all, and tail calls reuse the current activation.
+"""
+from functools import partial
+from typing import Callable, Dict, Optional
+from typing import List as PythonList
+
+from . import memo, pairs
+from .limits import refuel, tick
+from .macros import Macro, expand_macro_definition
+from .interpreter import Symbol, List, Exp, GlobalEnv, Procedure, unparse
+from .compiler import Scope, Lambda, defined_names, unassigned
+
+# Opcodes.  Any operands follow the opcode in the instruction list.
+CONST         = 0  # CONST k: push constants[k].
+LOCAL         = 1  # LOCAL i: push slot i of the current frame.
+OUTER         = 2  # OUTER depth i: push slot i of the frame depth levels out.
+GLOBAL        = 3  # GLOBAL k: push the value of the Cell in constants[k].
+STORE_LOCAL   = 4  # STORE_LOCAL i: pop a value into slot i of the current frame.
+STORE_OUTER   = 5  # STORE_OUTER depth i: pop a value into slot i of the frame depth levels out.
+STORE_GLOBAL  = 6  # STORE_GLOBAL k: pop a value and pass it to the setter in constants[k] (define or set!).
+JUMP          = 7  # JUMP target: continue at instruction target.
+JUMP_IF_FALSE = 8  # JUMP_IF_FALSE target: pop a value, and jump if it is false.
+IF_ASSIGNED   = 9  # IF_ASSIGNED target: jump if the top of the stack isn't unassigned; otherwise pop it.
+CALL          = 10 # CALL n: call the value under the top n values, with them as the arguments.
+TAIL_CALL     = 11 # TAIL_CALL n: like CALL, but the callee replaces the current activation.
+CLOSURE       = 12 # CLOSURE k: push a Procedure for the Lambda in constants[k], closed over the current frame.
+POP           = 13 # POP: throw away the top of the stack.
+RETURN        = 14 # RETURN: return the top of the stack to the caller.
+
+opcode_names = {
+    CONST: 'CONST', LOCAL: 'LOCAL', OUTER: 'OUTER', GLOBAL: 'GLOBAL', STORE_LOCAL: 'STORE_LOCAL',
+    STORE_OUTER: 'STORE_OUTER', STORE_GLOBAL: 'STORE_GLOBAL', JUMP: 'JUMP', JUMP_IF_FALSE: 'JUMP_IF_FALSE',
+    IF_ASSIGNED: 'IF_ASSIGNED', CALL: 'CALL', TAIL_CALL: 'TAIL_CALL', CLOSURE: 'CLOSURE', POP: 'POP',
+    RETURN: 'RETURN',
+}
+operand_counts = {CONST: 1, LOCAL: 1, OUTER: 2, GLOBAL: 1, STORE_LOCAL: 1, STORE_OUTER: 2, STORE_GLOBAL: 1,
+    JUMP: 1, JUMP_IF_FALSE: 1, IF_ASSIGNED: 1, CALL: 1, TAIL_CALL: 1, CLOSURE: 1, POP: 0, RETURN: 0}
+
+
+class CodeObject:
+    """Compiled bytecode for a top-level expression or a procedure body.
+
+    Calling it with a frame runs it, so it can be used anywhere the closure compiler's Code can.
+    """
+    __slots__ = ('instructions', 'constants', 'name')
+
+    def __init__(self, instructions: PythonList[int], constants: list, name: str):
+        self.instructions = instructions
+        self.constants = constants
+        self.name = name
+
+    def __call__(self, frame):
+        return run(self, frame)
+
+    def __repr__(self):
+        return f'<CodeObject {self.name}, {len(self.instructions)} words>'
+
+
+def disassemble(code: CodeObject) -> str:
+    """Describe the instructions in a CodeObject, one per line."""
+    lines = []
+    pc = 0
+    while pc < len(code.instructions):
+        op = code.instructions[pc]
+        operands = code.instructions[pc + 1:pc + 1 + operand_counts[op]]
+        line = f'{pc:4} {opcode_names[op]:<14}' + ' '.join(map(str, operands))
+        if op in (CONST, GLOBAL, STORE_GLOBAL, CLOSURE):
+            line += f'  ({code.constants[operands[0]]!r})'
+        lines.append(line.rstrip())
+        pc += 1 + len(operands)
+    return '\n'.join(lines)
+
+
+class Assembler:
+    """Collects the instructions and constants for one CodeObject."""
+    def __init__(self, name: str):
+        self.name = name
+        self.instructions = []
+        self.constants = []
+        self.constant_indexes = {} # id(value) -> index in constants.
+
+    def emit(self, *words: int):
+        self.instructions.extend(words)
+
+    def constant(self, value) -> int:
+        """Get the index of a value in the constant table, adding it if needed."""
+        index = self.constant_indexes.get(id(value))
+        if index is None:
+            index = self.constant_indexes[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def jump(self, op: int) -> int:
+        """Emit a jump whose target isn't known yet, and return where to patch it with set_target()."""
+        self.emit(op, -1)
+        return len(self.instructions) - 1
+
+    def set_target(self, operand: int):
+        """Make the jump operand at the given position jump to the next instruction emitted."""
+        self.instructions[operand] = len(self.instructions)
+
+    def assemble(self) -> CodeObject:
+        return CodeObject(self.instructions, self.constants, self.name)
+
+
+class BytecodeCompiler:
+    """Compiles expressions into CodeObjects that run against one GlobalEnv."""
+    def __init__(self, env: GlobalEnv):
+        """
+        @param env: The global environment compiled code will read and write.
+        """
+        self.env = env
+        self.special_forms: Dict[str, Callable[[List, Optional[Scope], bool, Assembler], None]] = {
+            'quote':  self.emit_quote,
+            'if':     self.emit_if,
+            'define': self.emit_define,
+            'define-memo': self.emit_define_memo,
+            'define-macro': self.emit_define_macro,
+            'defmacro': self.emit_define_macro,
+            'define-syntax': self.emit_define_macro,
+            'import': self.emit_import,
+            'require': self.emit_import,
+            'set!':   self.emit_set,
+            'lambda': self.emit_lambda,
+            'while':  self.emit_while,
+            'begin':  self.emit_begin,
+        }
+
+    def compile(self, x: Exp) -> CodeObject:
+        """Compile a top-level expression."""
+        asm = Assembler('<top level>')
+        self.emit(x, None, False, asm)
+        asm.emit(RETURN)
+        return asm.assemble()
+
+    def emit(self, x: Exp, scope: Optional[Scope], tail: bool, asm: Assembler):
+        """Emit instructions that leave the value of an expression on the stack.
+
+        @param scope: The scope of the procedure the expression appears in, or None at the top level.
+        @param tail: True if the expression is in tail position of a procedure body.
+        """
+        if isinstance(x, Symbol):        # variable reference
+            self.emit_symbol(x, scope, asm)
+        elif not isinstance(x, List):    # constant number
+            asm.emit(CONST, asm.constant(x))
+        elif x and isinstance(x[0], Symbol) and x[0] in self.special_forms:
+            self.special_forms[x[0]](x, scope, tail, asm)
+        elif x and isinstance(x[0], Symbol) and self._is_global(x[0], scope) and type(self.env.get(x[0])) is Macro:
+            self.emit(self.env[x[0]].expand(x), scope, tail, asm) # Emit what the macro use expands into.
+        else:
+            self.emit_call(x, scope, tail, asm)
+
+    def emit_symbol(self, name: Symbol, scope: Optional[Scope], asm: Assembler, depth: int = 0):
+        while scope is not None and name not in scope.slots:
+            scope, depth = scope.outer, depth + 1
+        if scope is None:
+            asm.emit(GLOBAL, asm.constant(self.env.cell(name)))
+            return
+        i = scope.slots[name]
+        if depth == 0:
+            asm.emit(LOCAL, i)
+        else:
+            asm.emit(OUTER, depth, i)
+        if name in scope.defined:
+            # Until the body runs its define, the name still refers to whatever it meant outside.
+            assigned = asm.jump(IF_ASSIGNED)
+            self.emit_symbol(name, scope.outer, asm, depth + 1)
+            asm.set_target(assigned)
+
+    def emit_quote(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        (_, value) = self._expect(x, 2)
+        asm.emit(CONST, asm.constant(pairs.from_python(value)))
+
+    def emit_if(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        (_, test, conseq, alt) = self._expect(x, 4)
+        self.emit(test, scope, False, asm)
+        to_alt = asm.jump(JUMP_IF_FALSE)
+        self.emit(conseq, scope, tail, asm)
+        to_end = asm.jump(JUMP)
+        asm.set_target(to_alt)
+        self.emit(alt, scope, tail, asm)
+        asm.set_target(to_end)
+
+    def emit_define(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        (_, symbol, exp) = self._expect(x, 3)
+        self.emit(exp, scope, False, asm)
+        if scope is None:
+            asm.emit(STORE_GLOBAL, asm.constant(partial(self.env.__setitem__, symbol)))
+        else:
+            asm.emit(STORE_LOCAL, scope.slots[symbol])
+        asm.emit(CONST, asm.constant(None))
+
+    def emit_define_memo(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        self.emit_define(memo.expand_define_memo(x), scope, tail, asm)
+
+    def emit_define_macro(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        self.emit_define(expand_macro_definition(x, scope is None), scope, tail, asm)
+
+    def emit_import(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        from .modules import expand_import
+        self.emit(expand_import(x), scope, tail, asm)
+
+    def emit_set(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        (_, symbol, exp) = self._expect(x, 3)
+        self._emit_assignment(symbol, exp, scope, scope, 0, asm)
+        asm.emit(CONST, asm.constant(None))
+
+    def _emit_assignment(self, name: Symbol, exp: Exp, scope: Optional[Scope], target: Optional[Scope], depth: int,
+            asm: Assembler):
+        """Emit set! of name to the value of exp, leaving nothing on the stack.
+
+        @param scope: The scope the set! appears in.
+        @param target: The scope to start looking for name in, depth frames out from scope.
+        """
+        while target is not None and name not in target.slots:
+            target, depth = target.outer, depth + 1
+        if target is None:
+            self.emit(exp, scope, False, asm)
+            asm.emit(STORE_GLOBAL, asm.constant(self._global_setter(name)))
+            return
+
+        i = target.slots[name]
+        if name in target.defined:
+            # Like a reference, assigning a name before the body defines it affects the outer binding.
+            if depth == 0:
+                asm.emit(LOCAL, i)
+            else:
+                asm.emit(OUTER, depth, i)
+            assigned = asm.jump(IF_ASSIGNED)
+            self._emit_assignment(name, exp, scope, target.outer, depth + 1, asm)
+            to_end = asm.jump(JUMP)
+            asm.set_target(assigned)
+            asm.emit(POP)
+        self.emit(exp, scope, False, asm)
+        if depth == 0:
+            asm.emit(STORE_LOCAL, i)
+        else:
+            asm.emit(STORE_OUTER, depth, i)
+        if name in target.defined:
+            asm.set_target(to_end)
+
+    def _global_setter(self, name: Symbol) -> Callable:
+        env = self.env
+        def set_global(value):
+            if name not in env:
+                raise Exception(f'Variable "{name}" not found')
+            env[name] = value
+        return set_global
+
+    def emit_lambda(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        (_, parms, body) = self._expect(x, 3)
+        if not isinstance(parms, List) or not all(isinstance(p, Symbol) for p in parms):
+            raise SyntaxError(f'lambda parameters must be a list of symbols, got {parms}')
+        defined = [name for name in defined_names(body) if name not in parms]
+        inner = Scope(parms, defined, scope)
+        code = self._assemble_body(parms, body, inner)
+        asm.emit(CLOSURE, asm.constant(Lambda(parms, body, len(defined), code, bytecode=code, scope=inner)))
+
+    def compile_body(self, lam: Lambda) -> CodeObject:
+        """Compile the body of a Lambda that was made by the closure compiler."""
+        return self._assemble_body(lam.parms, lam.source, lam.scope)
+
+    def _assemble_body(self, parms, body: Exp, scope: Scope) -> CodeObject:
+        asm = Assembler(f'(lambda {" ".join(parms)})')
+        self.emit(body, scope, True, asm)
+        asm.emit(RETURN)
+        return asm.assemble()
+
+    def emit_while(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        (_, cond, statement) = self._expect(x, 3)
+        asm.emit(CONST, asm.constant(None)) # The result if the loop body never runs.
+        top = len(asm.instructions)
+        self.emit(cond, scope, False, asm)
+        to_end = asm.jump(JUMP_IF_FALSE)
+        asm.emit(POP)
+        self.emit(statement, scope, False, asm)
+        asm.emit(JUMP, top)
+        asm.set_target(to_end)
+
+    def emit_begin(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        if len(x) == 1:
+            asm.emit(CONST, asm.constant(None))
+            return
+        for exp in x[1:-1]:
+            self.emit(exp, scope, False, asm)
+            asm.emit(POP)
+        self.emit(x[-1], scope, tail, asm)
+
+    def emit_call(self, x: List, scope: Optional[Scope], tail: bool, asm: Assembler):
+        for exp in x:
+            self.emit(exp, scope, False, asm)
+        asm.emit(TAIL_CALL if tail else CALL, len(x) - 1)
+
+    def _is_global(self, name: Symbol, scope: Optional[Scope]) -> bool:
+        while scope is not None:
+            if name in scope.slots:
+                return False
+            scope = scope.outer
+        return True
+
+    def _expect(self, x: List, length: int) -> List:
+        """Check that a special form has the right number of parts before unpacking it."""
+        if len(x) != length:
+            raise SyntaxError(f'{x[0]} expects {length - 1} arguments, got {len(x) - 1}')
+        return x
+
+
+class Suspend(Exception):
+    """Raised by a primitive, such as a task's recv, to pause the Thread that called it.
+
+    Whatever raises it is responsible for resuming the Thread later.  The primitive attribute is
+    set to the callable that raised it, so the VM can check that it was called directly by the
+    paused code and not from inside some other Python function, which can't be paused.
+    """
+    primitive = None
+
+
+class CannotSuspend(Exception):
+    """A primitive tried to pause a task from somewhere that can't be paused."""
+
+
+class Thread:
+    """A run of the VM that can be paused when it calls a primitive that raises Suspend, then resumed.
+
+    ricolisp.tasks runs each task on one of these.  The Thread's state is just the VM's registers:
+    an activation's instructions, constants, pc and frame, the value stack, and the saved activations.
+    """
+    __slots__ = ('instructions', 'constants', 'pc', 'frame', 'stack', 'calls', 'compiler', 'tail')
+
+    def __init__(self, proc: Callable, args, compiler: 'BytecodeCompiler'):
+        """
+        @param proc: What the thread will call, with args.
+        @param compiler: Compiles procedures the closure compiler made to bytecode when the thread
+        calls them, so they can be paused too.
+        """
+        asm = Assembler('<thread>')
+        for value in (proc, *args):
+            asm.emit(CONST, asm.constant(value))
+        asm.emit(CALL, len(args))
+        asm.emit(RETURN)
+        code = asm.assemble()
+        self.instructions = code.instructions
+        self.constants = code.constants
+        self.pc = 0
+        self.frame = None
+        self.stack = []
+        self.calls = []
+        self.compiler = compiler
+        self.tail = False # Whether the paused call was a tail call.
+
+    def resume(self, value=None):
+        """Run until the thread finishes, returning its value, or pauses, returning the Suspend.
+
+        @param value: The result of the primitive call the thread paused in.
+        """
+        if self.pc:
+            self.stack.append(value)
+            if self.tail: # The primitive's value is also the value of the activation that called it.
+                if not self.calls:
+                    return self.stack.pop()
+                self.instructions, self.constants, self.pc, self.frame = self.calls.pop()
+        return execute(self.instructions, self.constants, self.pc, self.frame, self.stack, self.calls, self)
+
+
+def run(code: CodeObject, frame) -> object:
+    """Run a CodeObject in a frame (None at the top level) and return its value."""
+    return execute(code.instructions, code.constants, 0, frame, [], [], None)
+
+
+def execute(instructions: PythonList[int], constants: list, pc: int, f, stack: list, calls: list,
+        thread: Optional[Thread]) -> object:
+    """The VM's loop.  Starting at instructions[pc], run until the outermost activation returns.
+
+    @param calls: (instructions, constants, pc, frame) to go back to for each VM procedure we're inside.
+    @param thread: The Thread being run, if this run can be paused.  Its state is saved there
+    when it is, and the Suspend is returned.
+    """
+    push = stack.append
+    pop = stack.pop
+
+    try:
+        while True:
+            op = instructions[pc]
+            if op == LOCAL:
+                push(f[instructions[pc + 1]])
+                pc += 2
+                continue
+            elif op == GLOBAL:
+                cell = constants[instructions[pc + 1]]
+                try:
+                    push(cell.value)
+                except AttributeError:
+                    raise Exception(f'Variable "{cell.name}" not found') from None
+                pc += 2
+                continue
+            elif op == CONST:
+                push(constants[instructions[pc + 1]])
+                pc += 2
+                continue
+            elif op == CALL or op == TAIL_CALL:
+                n = instructions[pc + 1]
+                pc += 2
+                proc = stack[-n - 1]
+                lam = proc.code if type(proc) is Procedure else None
+                if lam is not None and lam.bytecode is not None:
+                    if n != lam.nparms:
+                        raise TypeError(f'procedure expected {lam.nparms} arguments, got {n}')
+                    try:
+                        tick() # Burn fuel for each activation (see ricolisp.limits).
+                    except IndexError:
+                        refuel()
+                    # The procedure and its arguments are already in place to become the new frame.
+                    new_frame = stack[-n - 1:]
+                    new_frame[0] = proc.env
+                    if lam.locals:
+                        new_frame += lam.locals
+                    del stack[-n - 1:]
+                    if op == CALL:
+                        calls.append((instructions, constants, pc, f))
+                    f = new_frame
+                    instructions = lam.bytecode.instructions
+                    constants = lam.bytecode.constants
+                    pc = 0
+                    continue
+                if lam is not None and thread is not None:
+                    # Made by the closure compiler.  Compile it for the VM too, so that it can be paused.
+                    lam.bytecode = thread.compiler.compile_body(lam)
+                    pc -= 2
+                    continue
+                # Anything else is a Python callable, such as a builtin: call it and leave the result.
+                # The callee and arguments stay on the stack until it returns, in case it raises Suspend.
+                if n == 1:
+                    stack[-2] = proc(stack[-1])
+                    pop()
+                elif n == 2:
+                    stack[-3] = proc(stack[-2], stack[-1])
+                    del stack[-2:]
+                else:
+                    stack[-n - 1] = proc(*stack[len(stack) - n:])
+                    del stack[len(stack) - n:]
+                if op == TAIL_CALL:
+                    op = RETURN # The callee's value is this activation's value.
+                else:
+                    continue
+            elif op == JUMP_IF_FALSE:
+                if pop():
+                    pc += 2
+                else:
+                    pc = instructions[pc + 1]
+                continue
+            elif op == IF_ASSIGNED:
+                if stack[-1] is unassigned:
+                    pop()
+                    pc += 2
+                else:
+                    pc = instructions[pc + 1]
+                continue
+            elif op == STORE_LOCAL:
+                f[instructions[pc + 1]] = pop()
+                pc += 2
+                continue
+            elif op == POP:
+                pop()
+                pc += 1
+                continue
+            elif op == JUMP:
+                target = instructions[pc + 1]
+                if target < pc: # Back to the top of a while loop: burn fuel for the iteration.
+                    try:
+                        tick()
+                    except IndexError:
+                        refuel()
+                pc = target
+                continue
+            elif op == OUTER:
+                frame_at = f
+                for _ in range(instructions[pc + 1]):
+                    frame_at = frame_at[0]
+                push(frame_at[instructions[pc + 2]])
+                pc += 3
+                continue
+            elif op == STORE_OUTER:
+                frame_at = f
+                for _ in range(instructions[pc + 1]):
+                    frame_at = frame_at[0]
+                frame_at[instructions[pc + 2]] = pop()
+                pc += 3
+                continue
+            elif op == STORE_GLOBAL:
+                constants[instructions[pc + 1]](pop())
+                pc += 2
+                continue
+            elif op == CLOSURE:
+                lam = constants[instructions[pc + 1]]
+                push(Procedure(lam.parms, lam.source, f, lam))
+                pc += 2
+                continue
+
+            if op == RETURN:
+                # The return value stays on top of the stack for the caller.
+                if not calls:
+                    return pop()
+                instructions, constants, pc, f = calls.pop()
+    except Suspend as suspend:
+        if thread is None or not (op == CALL or op == TAIL_CALL) or suspend.primitive is not proc:
+            raise CannotSuspend(f'{unparse(suspend.primitive)} can only pause a task when the task calls it '
+                'directly, not from inside a Python builtin such as map') from None
+        del stack[len(stack) - n - 1:] # The result will be pushed in its place when the thread resumes.
+        thread.instructions, thread.constants, thread.pc, thread.frame = instructions, constants, pc, f
+        thread.tail = op == TAIL_CALL
+        return suspend
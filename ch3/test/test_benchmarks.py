@@ -0,0 +1,45 @@
+import unittest
+
+from benchmarks import startup
+from benchmarks.frames import bytes_per_call
+from benchmarks.runner import compare, measure
+from benchmarks.workloads import WORKLOADS, fib_calls, tak_calls
+from ricolisp import LispInterpreter
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_workloads_run(self):
+        for workload in WORKLOADS:
+            result = measure(workload, 'compile', 1, 1)
+            self.assertEqual(workload.ops(1), result['ops'])
+            self.assertGreater(result['ops_per_sec'], 0)
+
+    def test_op_counts(self):
+        lisp = LispInterpreter(profile=True)
+        lisp.run('(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))')
+        lisp.run('(fib 12)')
+        lisp.run('(define tak (lambda (x y z) (if (< y x) (tak (tak (- x 1) y z) (tak (- y 1) z x) (tak (- z 1) x y)) z)))')
+        lisp.run('(tak 8 4 2)')
+        calls = {entry.name: entry.calls for entry in lisp.profiler.report()}
+        self.assertEqual(fib_calls(12), calls['fib'])
+        self.assertEqual(tak_calls(8, 4, 2), calls['tak'])
+
+    def test_compare(self):
+        baseline = {'workloads': {'fib': {'ops_per_sec': 1000}, 'tak': {'ops_per_sec': 1000}},
+            'startup': {'import_ms': 10, 'interpreter_ms': 1}}
+        results = {'workloads': {'fib': {'ops_per_sec': 950}, 'tak': {'ops_per_sec': 800}, 'new': {'ops_per_sec': 1}},
+            'startup': {'import_ms': 10.5, 'interpreter_ms': 2}}
+        regressions = compare(results, baseline, 0.10)
+        self.assertEqual(2, len(regressions))
+        self.assertTrue(regressions[0].startswith('tak'))
+        self.assertTrue(regressions[1].startswith('startup interpreter_ms'))
+
+    def test_bytes_per_call(self):
+        for engine in LispInterpreter.engines:
+            self.assertGreater(bytes_per_call(engine, 40), 0)
+
+    def test_startup(self):
+        results = startup.measure(repeat=1, count=10)
+        self.assertEqual({'import_ms', 'first_interpreter_ms', 'compile_interpreter_us', 'eval_interpreter_us',
+            'vm_interpreter_us'}, set(results))
+        self.assertTrue(all(value > 0 for value in results.values()))
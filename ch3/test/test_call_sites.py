@@ -0,0 +1,74 @@
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.interpreter import CallSite
+
+
+class TestCallSites(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter(engine='eval')
+        self.lisp.run('(define double (lambda (x) (* 2 x)))')
+        self.lisp.run('(define twice (lambda (f x) (f (f x))))')
+
+    def report(self) -> dict:
+        """(operator, kind) -> (hits, misses), added up over the sites."""
+        totals = {}
+        for operator, kind, hits, misses in self.lisp.call_site_report():
+            before = totals.get((operator, kind), (0, 0))
+            totals[operator, kind] = (before[0] + hits, before[1] + misses)
+        return totals
+
+    def test_monomorphic_sites_hit(self):
+        self.lisp.run('(define loop (lambda (n) (if (= n 0) 0 (loop (- n (- (double 1) 1))))))')
+        self.lisp.run('(loop 50)')
+        report = self.report()
+        self.assertEqual((49, 2), report[('loop', CallSite.interpreted)]) # The top-level call is a site too.
+        self.assertEqual((49, 1), report[('double', CallSite.interpreted)])
+        self.assertEqual((50, 1), report[('=', CallSite.primitive)])
+
+    def test_local_operator_is_not_cached(self):
+        self.assertEqual(8, self.lisp.run('(twice double 2)'))
+        self.assertEqual(6, self.lisp.run('(twice (lambda (x) (+ x 1)) 4)'))
+        self.assertEqual((0, 4), self.report()[('f', CallSite.local)])
+
+    def test_redefinition_invalidates(self):
+        self.lisp.run('(define apply-double (lambda (x) (double x)))')
+        self.assertEqual(6, self.lisp.run('(apply-double 3)'))
+        self.lisp.run('(define double (lambda (x) (* 3 x)))')
+        self.assertEqual(9, self.lisp.run('(apply-double 3)'))
+        self.lisp.run('(set! double abs)')
+        self.assertEqual(3, self.lisp.run('(apply-double -3)'))
+        self.assertEqual((0, 3), self.report()[('double', CallSite.primitive)])
+
+    def test_local_definition_shadows(self):
+        self.lisp.run('''(define f (lambda (x) (begin
+            (define a (double x))
+            (define double (lambda (y) y))
+            (+ a (double x)))))''')
+        self.assertEqual(9, self.lisp.run('(f 3)'))
+        self.assertEqual(9, self.lisp.run('(f 3)'))
+        self.assertEqual(6, self.lisp.run('(double 3)'))
+
+    def test_shadowing_in_a_recursive_activation(self):
+        # The inner (g 0) resolves (f) to the global first; the outer activation's own define must still win.
+        self.lisp.run('(define f (lambda () 1))')
+        self.lisp.run('''(define g (lambda (n) (begin
+            (if (= n 1) (define f (lambda () 99)) 0)
+            (if (= n 1) (g 0) 0)
+            (f))))''')
+        self.assertEqual(99, self.lisp.run('(g 1)'))
+        self.assertEqual(1, self.lisp.run('(g 0)'))
+        for engine in ('compile', 'vm'):
+            lisp = LispInterpreter(engine=engine)
+            lisp.run('(define f (lambda () 1))')
+            lisp.run('(define g (lambda (n) (begin (if (= n 1) (define f (lambda () 99)) 0) (if (= n 1) (g 0) 0) (f))))')
+            self.assertEqual(99, lisp.run('(g 1)'))
+
+    def test_arity_errors_still_raised(self):
+        with self.assertRaises(TypeError):
+            self.lisp.run('(double 1 2)')
+
+    def test_report_builtin(self):
+        self.lisp.run('(double 1)')
+        self.assertIn(['double', 'procedure', 0, 1], self.lisp.run('(call-site-report)'))
+        self.assertEqual([], LispInterpreter().call_site_report())
@@ -0,0 +1,180 @@
+import unittest
+from functools import partial
+from unittest import mock
+
+from ricolisp import LispInterpreter
+from ricolisp import interpreter
+from ricolisp.compiler import Compiler
+from ricolisp.interpreter import parse, standard_env, Procedure
+from . import test_lisp
+
+
+class TestEvalEngine(test_lisp.TestLisp):
+    """Run the whole interpreter test suite against the reference eval() engine."""
+    def setUp(self):
+        patcher = mock.patch.object(test_lisp, 'LispInterpreter', partial(LispInterpreter, engine='eval'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestActivation(unittest.TestCase):
+    """Interpreted procedures keep their variables in an Activation instead of an Env."""
+    def setUp(self):
+        self.lisp = LispInterpreter(engine='eval')
+
+    def test_parameters(self):
+        self.lisp.run('(define f (lambda (x y) (begin (set! y (* y 10)) (+ x y))))')
+        self.assertEqual(21, self.lisp.run('(f 1 2)'))
+
+    def test_define_in_body(self):
+        self.lisp.run('(define f (lambda (x) (begin (define y (* x 2)) (define x 0) (+ x y))))')
+        self.assertEqual(6, self.lisp.run('(f 3)'))
+        self.assertNotIn('y', self.lisp.env)
+
+    def test_closure_over_activation(self):
+        self.lisp.run('(define counter (lambda (n) (lambda () (begin (set! n (+ n 1)) n))))')
+        self.lisp.run('(define c (counter 5))')
+        self.lisp.run('(c)')
+        self.assertEqual(7, self.lisp.run('(c)'))
+
+    def test_no_parameters(self):
+        self.lisp.run('(define x 4)')
+        self.lisp.run('(define f (lambda () (lambda () x)))')
+        self.assertEqual(4, self.lisp.run('((f))'))
+
+    def test_wrong_number_of_arguments(self):
+        self.lisp.run('(define f (lambda (x y) x))')
+        with self.assertRaisesRegex(TypeError, 'expected 2 arguments, got 1'):
+            self.lisp.run('(f 1)')
+
+    def test_slots(self):
+        proc = self.lisp.run('(lambda (x) x)')
+        self.assertFalse(hasattr(proc, '__dict__'))
+        self.assertFalse(hasattr(interpreter.Activation(['x'], [1], None), '__dict__'))
+
+
+class TestCompiler(unittest.TestCase):
+    def test_compiled_code_does_not_use_eval(self):
+        lisp = LispInterpreter()
+        with mock.patch.object(interpreter, 'eval', side_effect=AssertionError('eval called')):
+            lisp.run('(define sq (lambda (x) (* x x)))')
+            self.assertEqual(49, lisp.run('(sq 7)'))
+
+    def test_compile_once_run_many(self):
+        env = standard_env()
+        code = Compiler(env).compile(parse('(begin (define n (+ n 1)) n)'))
+        env['n'] = 0
+        self.assertEqual([1, 2, 3], [code(None) for _ in range(3)])
+
+    def test_lambda_carries_compiled_body(self):
+        lisp = LispInterpreter()
+        proc = lisp.run('(lambda (x) (+ x 1))')
+        self.assertIsInstance(proc, Procedure)
+        self.assertIsNotNone(proc.code)
+        self.assertEqual(3, proc(2))
+        with self.assertRaises(TypeError):
+            proc(1, 2)
+
+    def test_eval_engine_interprets_procedures(self):
+        proc = LispInterpreter(engine='eval').run('(lambda (x) (+ x 1))')
+        self.assertIsNone(proc.code)
+        self.assertEqual(3, proc(2))
+
+    def test_special_form_arity(self):
+        with self.assertRaises(SyntaxError):
+            Compiler(standard_env()).compile(parse('(if 1 2)'))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            LispInterpreter(engine='jit')
+
+
+class TestLexicalAddressing(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter()
+
+    def test_frames_are_lists(self):
+        proc = self.lisp.run('((lambda (a) (lambda (b) (+ a b))) 1)')
+        self.assertIsInstance(proc.env, list)
+        self.assertEqual(1, proc.env[1])
+        self.assertEqual(3, proc(2))
+
+    def test_deeply_nested_closure(self):
+        self.lisp.run('(define make (lambda (a) (lambda (b) (lambda (c) (lambda (d) (list a b c d))))))')
+        self.assertEqual([1, 2, 3, 4], self.lisp.run('((((make 1) 2) 3) 4)'))
+
+    def test_global_defined_after_reference(self):
+        self.lisp.run('(define f (lambda (x) (g x)))')
+        self.lisp.run('(define g (lambda (x) (* x 2)))')
+        self.assertEqual(10, self.lisp.run('(f 5)'))
+        self.lisp.run('(define g (lambda (x) (* x 3)))')
+        self.assertEqual(15, self.lisp.run('(f 5)'))
+
+    def test_set_global_from_python_and_lisp(self):
+        self.lisp.run('(define get (lambda () counter))')
+        self.lisp.env['counter'] = 1
+        self.assertEqual(1, self.lisp.run('(get)'))
+        self.lisp.run('(set! counter 2)')
+        self.assertEqual(2, self.lisp.run('(get)'))
+        self.assertEqual(2, self.lisp.env['counter'])
+
+    def test_undefined_variable(self):
+        with self.assertRaisesRegex(Exception, 'Variable "nope" not found'):
+            self.lisp.run('nope')
+        with self.assertRaisesRegex(Exception, 'Variable "nope" not found'):
+            self.lisp.run('(set! nope 1)')
+
+    def test_set_captured_variable(self):
+        self.lisp.run('(define counter (lambda (n) (lambda () (begin (set! n (+ n 1)) n))))')
+        self.lisp.run('(define c (counter 10))')
+        self.assertEqual(11, self.lisp.run('(c)'))
+        self.assertEqual(12, self.lisp.run('(c)'))
+
+    def test_internal_define(self):
+        self.lisp.run('(define x 100)')
+        self.lisp.run('(define f (lambda (a) (begin (define before x) (define x a) (list before x))))')
+        self.assertEqual([100, 7], self.lisp.run('(f 7)'))
+        self.assertEqual(100, self.lisp.run('x'))
+
+    def test_internal_define_seen_by_inner_lambda(self):
+        self.lisp.run("""
+            (define f (lambda ()
+                (begin
+                    (define helper (lambda (y) (* y scale)))
+                    (define scale 3)
+                    (helper 5))))
+        """)
+        self.assertEqual(15, self.lisp.run('(f)'))
+
+
+class TestTailCalls(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.lisp = LispInterpreter(engine=self.engine)
+
+    def test_tail_recursive_loop(self):
+        self.lisp.run('(define count (lambda (n acc) (if (= n 0) acc (count (- n 1) (+ acc 1)))))')
+        self.assertEqual(100000, self.lisp.run('(count 100000 0)'))
+
+    def test_mutual_recursion(self):
+        self.lisp.run('(define even? (lambda (n) (if (= n 0) 1 (odd? (- n 1)))))')
+        self.lisp.run('(define odd? (lambda (n) (if (= n 0) 0 (even? (- n 1)))))')
+        self.assertEqual(1, self.lisp.run('(even? 50000)'))
+
+    def test_tail_call_from_begin(self):
+        self.lisp.run('(define total 0)')
+        self.lisp.run('(define loop (lambda (n) (begin (set! total (+ total n)) (if (> n 0) (loop (- n 1)) total))))')
+        self.assertEqual(50005000, self.lisp.run('(loop 10000)'))
+
+    def test_procedure_called_from_python(self):
+        self.lisp.run('(define count (lambda (n) (if (= n 0) (quote done) (count (- n 1)))))')
+        self.assertEqual('done', self.lisp.env['count'](20000))
+
+    def test_begin_value(self):
+        self.assertEqual(3, self.lisp.run('(begin 1 2 3)'))
+        self.assertIsNone(self.lisp.run('(begin)'))
+
+
+class TestEvalTailCalls(TestTailCalls):
+    engine = 'eval'
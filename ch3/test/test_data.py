@@ -0,0 +1,74 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.data import read_data
+from ricolisp.pairs import LazyList, Pair, nil
+
+
+class TestReadData(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text: str) -> str:
+        path = os.path.join(self.directory.name, 'data.sexp')
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_read(self):
+        path = self.write('(event 1 (at 2.5 -3)) (event 2 ()) done 42\n')
+        data = list(read_data(path))
+        self.assertEqual([['event', 1, ['at', 2.5, -3]], ['event', 2, []], 'done', 42], data)
+        self.assertIs(Pair, type(data[0]))
+        self.assertIs(nil, list(data[1])[2])
+
+    def test_skip(self):
+        path = self.write('(event 1 (payload (a (b)) c) ok) (payload 1 2) (event 2)')
+        self.assertEqual([['event', 1, 'ok'], ['event', 2]], list(read_data(path, skip={'payload'})))
+
+    def test_empty_file(self):
+        self.assertEqual([], list(read_data(self.write(''))))
+
+    def test_errors(self):
+        with self.assertRaises(SyntaxError):
+            list(read_data(self.write('(a (b)')))
+        with self.assertRaises(SyntaxError):
+            list(read_data(self.write('a)')))
+        with self.assertRaises(SyntaxError):
+            list(read_data(self.write('(a (skip (b)'), skip={'skip'}))
+
+    def test_skipping_keeps_memory_flat(self):
+        blob = '(blob ' + ' '.join(['(x 1 2 3)'] * 50000) + ')'
+        path = self.write(f'(record 1 {blob}) (record 2 {blob})')
+        tracemalloc.start()
+        try:
+            records = list(read_data(path, skip={'blob'}))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual([['record', 1], ['record', 2]], records)
+        self.assertLess(peak, 100_000) # The file is about 1MB.
+
+    def test_lisp_lazy_list(self):
+        path = self.write('(a 1) (b 2) (c 3)')
+        lisp = LispInterpreter()
+        lisp.run(f'(define data (read-data (quote "{path}")))')
+        data = lisp.env['data']
+        self.assertIs(LazyList, type(data))
+        self.assertEqual(['a', 1], lisp.run('(car data)'))
+        self.assertEqual('((a 1) ...)', repr(data))
+        self.assertEqual(['a', 'b', 'c'], lisp.run('(map car data)'))
+        self.assertEqual(3, lisp.run('(length data)'))
+        self.assertTrue(lisp.run('(null? (cdr (cdr (cdr data))))'))
+        self.assertEqual('((a 1) (b 2) (c 3))', repr(data))
+
+    def test_lisp_skip(self):
+        path = self.write('(a 1) (b 2) (c 3)')
+        lisp = LispInterpreter(engine='vm')
+        self.assertEqual([['a', 1], ['c', 3]], lisp.run(f'(read-data (quote {path}) (quote (b)))'))
@@ -0,0 +1,126 @@
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.limits import Budget, ResourceExhausted
+
+
+class TestJit(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter()
+        self.lisp.compiler.jit.threshold = 2
+
+    def hot(self, source: str, name: str, times: int = 3):
+        """Define a procedure and call it until it has been translated; return what the last call gave."""
+        self.lisp.run(source)
+        for _ in range(times):
+            result = self.lisp.run(name)
+        return result
+
+    def native(self, name: str):
+        return self.lisp.env[name].code.native
+
+    def test_hot_procedure_is_translated(self):
+        self.lisp.run('(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))')
+        self.lisp.run('(fib 1)')
+        self.assertIsNone(self.native('fib'))
+        self.assertEqual(6765, self.lisp.run('(fib 20)'))
+        self.assertIsNotNone(self.native('fib'))
+        source = self.lisp.run('(jit-source fib)')
+        self.assertIn('def fib(_f, n):', source)
+        self.assertIn('(n < 2)', source)
+
+    def test_while_and_defines(self):
+        self.assertEqual(5050, self.hot('''(define count (lambda (n) (begin
+            (define i 0)
+            (define total 0)
+            (while (< i n) (begin (set! i (+ i 1)) (set! total (+ total i))))
+            total)))''', '(count 100)'))
+        self.assertIn('while (i < n):', self.lisp.jit_source(self.lisp.env['count']))
+
+    def test_tail_calls_run_in_constant_stack(self):
+        self.lisp.run('(define even? (lambda (n) (if (= n 0) 1 (odd? (- n 1)))))')
+        self.lisp.run('(define odd? (lambda (n) (if (= n 0) 0 (even? (- n 1)))))')
+        self.lisp.run('(define loop (lambda (n acc) (if (= n 0) acc (loop (- n 1) (+ acc 1)))))')
+        self.assertEqual(1, self.lisp.run('(even? 100000)'))
+        self.assertEqual(100000, self.lisp.run('(loop 100000 0)'))
+        self.assertIsNotNone(self.native('even?'))
+        self.assertIn('continue', self.lisp.jit_source(self.lisp.env['loop']))
+
+    def test_closures(self):
+        self.lisp.run('(define make-counter (lambda () (begin (define n 0) (lambda () (begin (set! n (+ n 1)) n)))))')
+        self.lisp.run('(define a (make-counter))')
+        self.lisp.run('(define b (make-counter))')
+        self.assertEqual(3, self.hot('(define tally (lambda () (begin (a) (a) (b) (a))))', '(tally)', times=1))
+        self.assertEqual(2, self.lisp.run('(b)'))
+        self.assertIsNotNone(self.native('a'))
+        self.assertIn('make-counter is not translated: lambda', self.lisp.jit_source(self.lisp.env['make-counter']))
+
+    def test_names_used_before_their_define(self):
+        self.lisp.run('(define x 10)')
+        self.assertEqual(11, self.hot('(define f (lambda () (begin (define y x) (define x (+ y 1)) x)))', '(f)'))
+        self.assertIsNotNone(self.native('f'))
+
+    def test_redefining_a_builtin_goes_back_to_closures(self):
+        self.hot('(define f (lambda (a b) (+ (car a) b)))', '(f (list 1) 2)')
+        self.assertIsNotNone(self.native('f'))
+        self.lisp.run('(define + -)')
+        self.assertIsNone(self.native('f'))
+        self.assertEqual(-1, self.lisp.run('(f (list 1) 2)'))
+        self.lisp.run('(f (list 1) 2)')
+        self.assertEqual(-1, self.lisp.run('(f (list 1) 2)'))
+        self.assertIn('_sub(_car(a), b)', self.lisp.jit_source(self.lisp.env['f'])) # Translated again, calling - as a builtin.
+
+    def test_redefining_itself(self):
+        self.hot('(define down (lambda (n) (if (= n 0) (quote done) (down (- n 1)))))', '(down 5)')
+        self.lisp.run('(define old down)')
+        self.lisp.run('(define down (lambda (n) (quote replaced)))')
+        self.assertIsNone(self.native('old'))
+        self.assertEqual('replaced', self.lisp.run('(old 5)'))
+
+    def test_undefined_variable(self):
+        self.hot('(define g (lambda (x) (if x missing 0)))', '(g 0)')
+        self.assertIsNotNone(self.native('g'))
+        with self.assertRaisesRegex(Exception, 'Variable "missing" not found'):
+            self.lisp.run('(g 1)')
+        with self.assertRaisesRegex(Exception, 'Variable "nowhere" not found'):
+            self.hot('(define s (lambda () (set! nowhere 1)))', '(s)')
+
+    def test_arity_is_checked(self):
+        self.hot('(define id (lambda (x) x))', '(id 1)')
+        with self.assertRaises(TypeError):
+            self.lisp.run('(id 1 2)')
+
+    def test_fuel_is_burnt(self):
+        self.hot('(define count (lambda (n) (if (= n 0) 0 (count (- n 1)))))', '(count 1)')
+        self.assertIsNotNone(self.native('count'))
+        budget = Budget(steps=1000)
+        self.lisp.run('(count 100)', budget)
+        self.assertEqual(101, budget.steps_used)
+        with self.assertRaises(ResourceExhausted):
+            self.lisp.run('(count 100)', Budget(steps=100))
+        self.hot('(define spin (lambda () (begin (define i 0) (while 1 (set! i (+ i 1))))))', '(quote (spin))')
+        self.lisp.env['spin'].code.countdown = 1
+        with self.assertRaises(ResourceExhausted):
+            self.lisp.run('(spin)', Budget(steps=1000))
+        with self.assertRaises(ResourceExhausted):
+            self.lisp.run('(spin)', Budget(steps=1000))
+        self.assertIsNotNone(self.native('spin'))
+
+    def test_macros_are_expanded(self):
+        self.lisp.run('(defmacro inc! (name) (list (quote set!) name (list (quote +) name 1)))')
+        self.assertEqual(3, self.hot('(define f (lambda (x) (begin (inc! x) (inc! x) x)))', '(f 1)'))
+        self.assertIn('x = (x + 1)', self.lisp.jit_source(self.lisp.env['f']))
+
+    def test_not_hot_yet(self):
+        self.lisp.compiler.jit.threshold = 1000
+        self.lisp.run('(define f (lambda () 1))')
+        self.lisp.run('(f)')
+        self.assertEqual('# f is not translated yet: 999 more calls to go', self.lisp.run('(jit-source f)'))
+
+    def test_off(self):
+        lisp = LispInterpreter(jit=False)
+        lisp.run('(define f (lambda () 1))')
+        for _ in range(2000):
+            lisp.run('(f)')
+        self.assertIsNone(lisp.env['f'].code.native)
+        self.assertIsNone(lisp.run('(jit-source f)'))
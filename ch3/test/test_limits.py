@@ -0,0 +1,72 @@
+import time
+import unittest
+
+from ricolisp import LispInterpreter, limits
+from ricolisp.limits import Budget, ResourceExhausted
+
+
+class TestLimits(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.lisp = LispInterpreter(engine=self.engine)
+        self.lisp.run('(define count (lambda (n) (if (= n 0) 0 (count (- n 1)))))')
+        self.lisp.run('(define spin (lambda () (begin (define i 0) (while 1 (set! i (+ i 1))))))')
+        self.lisp.run('(define grow (lambda (xs) (grow (cons 1 xs))))')
+
+    def test_within_budget(self):
+        budget = Budget(steps=1000, seconds=10, cells=10)
+        self.assertEqual(0, self.lisp.run('(count 100)', budget))
+        self.assertEqual(101, budget.steps_used)
+        self.assertEqual(3, self.lisp.run('(length (list 1 2 3))', budget))
+        self.assertEqual(3, budget.cells_used)
+
+    def test_step_limit_is_exact_for_calls(self):
+        self.assertEqual(0, self.lisp.run('(count 99)', Budget(steps=100)))
+        with self.assertRaises(ResourceExhausted):
+            self.lisp.run('(count 100)', Budget(steps=100))
+
+    def test_infinite_loop(self):
+        with self.assertRaisesRegex(ResourceExhausted, 'steps'):
+            self.lisp.run('(spin)', Budget(steps=100000))
+
+    def test_time_limit(self):
+        start = time.monotonic()
+        with self.assertRaisesRegex(ResourceExhausted, 'seconds'):
+            self.lisp.run('(spin)', Budget(seconds=0.2))
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_cell_limit(self):
+        with self.assertRaisesRegex(ResourceExhausted, 'cells'):
+            self.lisp.run('(grow (list))', Budget(cells=10000))
+
+    def test_usable_afterwards(self):
+        with self.assertRaises(ResourceExhausted):
+            self.lisp.run('(spin)', Budget(steps=1000))
+        self.assertEqual(0, self.lisp.run('(count 5000)'))
+        self.assertEqual(0, self.lisp.run('(count 50)', Budget(steps=100)))
+
+    def test_nested_budgets(self):
+        outer = Budget(steps=150)
+        with outer:
+            self.assertEqual(0, self.lisp.run('(count 99)', Budget(steps=100)))
+            with self.assertRaises(ResourceExhausted):
+                self.lisp.run('(count 99)', Budget(steps=100))
+        self.assertGreater(outer.steps_used, 150)
+
+    def test_run_stream(self):
+        with self.assertRaises(ResourceExhausted):
+            self.lisp.run_stream('(count 60) (count 60)', Budget(steps=100))
+
+    def test_unmetered_refills(self):
+        self.assertEqual(0, self.lisp.run(f'(count {limits.batch * 3})'))
+        self.lisp.run(f'(begin (define i 0) (while (< i {limits.batch * 3}) (set! i (+ i 1))))')
+        self.assertEqual(limits.batch * 3, self.lisp.run('i'))
+
+
+class TestEvalLimits(TestLimits):
+    engine = 'eval'
+
+
+class TestVMLimits(TestLimits):
+    engine = 'vm'
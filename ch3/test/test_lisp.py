@@ -1,7 +1,7 @@
 import unittest
 
 from ricolisp import LispInterpreter
-from ricolisp.interpreter import tokenize, parse, standard_env
+from ricolisp.interpreter import builtin_env, tokenize, parse, standard_env
 
 class TestConsole:
     def __init__(self):
@@ -56,6 +56,29 @@ class TestLisp(unittest.TestCase):
 
     def test_standard_environment(self):
         env = standard_env()
+        self.assertIs(builtin_env(), env.base)
+        self.assertIn('+', env)
+        self.assertIn('sqrt', list(env))
+        self.assertEqual(len(list(env)), len(env))
+
+    def test_builtins_are_shared_and_frozen(self):
+        a, b = LispInterpreter(), LispInterpreter(engine='eval')
+        a.run('(define + -)')
+        self.assertEqual(-1, a.run('(+ 1 2)'))
+        self.assertEqual(3, b.run('(+ 1 2)'))
+        with self.assertRaises(TypeError):
+            builtin_env()['+'] = None
+
+    def test_delete_builtin(self):
+        lisp = LispInterpreter()
+        del lisp.env['abs']
+        self.assertNotIn('abs', lisp.env)
+        self.assertNotIn('abs', list(lisp.env))
+        with self.assertRaises(Exception):
+            lisp.run('(abs -1)')
+        self.assertIn('abs', LispInterpreter().env)
+        lisp.env['abs'] = abs
+        self.assertEqual(1, lisp.run('(abs -1)'))
 
     def test_interpreter(self):
         lisp = LispInterpreter()
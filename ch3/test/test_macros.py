@@ -0,0 +1,104 @@
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.macros import Macro
+
+
+class TestMacros(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.lisp = LispInterpreter(engine=self.engine)
+        self.lisp.run('(define-macro (unless test . body) (list (quote if) test 0 (cons (quote begin) body)))')
+        self.lisp.run('(defmacro inc! (name) (list (quote set!) name (list (quote +) name 1)))')
+        self.lisp.run('(define-syntax my-or (syntax-rules () ((_) 0) ((_ e) e) ((_ e rest ...) (if e e (my-or rest ...)))))')
+
+    def report(self) -> dict:
+        return {name: (expansions, hits) for name, expansions, hits, ms in self.lisp.macro_report()}
+
+    def test_define_macro(self):
+        self.assertEqual(3, self.lisp.run('(unless 0 1 2 3)'))
+        self.assertEqual(0, self.lisp.run('(unless 1 (car 1))')) # The body isn't evaluated.
+        self.assertIsInstance(self.lisp.env['unless'], Macro)
+
+    def test_defmacro(self):
+        self.lisp.run('(define n 1)')
+        self.lisp.run('(inc! n)')
+        self.assertEqual(2, self.lisp.run('n'))
+
+    def test_syntax_rules(self):
+        self.assertEqual(0, self.lisp.run('(my-or)'))
+        self.assertEqual(7, self.lisp.run('(my-or 0 0 7 (car 1))'))
+        self.lisp.run('(define-syntax my-let (syntax-rules () ((_ ((name value) ...) body) ((lambda (name ...) body) value ...))))')
+        self.assertEqual(3, self.lisp.run('(my-let ((a 1) (b 2)) (+ a b))'))
+
+    def test_syntax_rules_literals_and_tails(self):
+        self.lisp.run('''(define-syntax for
+            (syntax-rules (from to)
+                ((_ var from start to end body ...)
+                 (begin (define var start) (while (< var end) (begin body ... (set! var (+ var 1))))))))''')
+        self.lisp.run('(define total 0)')
+        self.lisp.run('(for i from 0 to 5 (set! total (+ total i)))')
+        self.assertEqual(10, self.lisp.run('total'))
+        self.lisp.run('(define-syntax first-of (syntax-rules () ((_ a . rest) a)))')
+        self.assertEqual(1, self.lisp.run('(first-of 1 2 3)'))
+        with self.assertRaises(SyntaxError):
+            self.lisp.run('(for i 0 5 i)')
+
+    def test_expansion_is_cached_per_form(self):
+        self.lisp.run('''(define count-up (lambda (n) (begin
+            (define i 0)
+            (define t 0)
+            (while (< i n) (begin (inc! i) (set! t (my-or 0 (+ t i)))))
+            t)))''')
+        self.assertEqual(5050, self.lisp.run('(count-up 100)'))
+        self.assertEqual(15, self.lisp.run('(count-up 5)'))
+        expansions, hits = self.report()['inc!']
+        self.assertEqual(1, expansions)
+        self.assertEqual(self.cached_uses(105), hits)
+
+    def cached_uses(self, runs: int) -> int:
+        """How many times the expansion cache is hit for a use run this many times."""
+        return 0 # Compiled code is expanded when it is compiled, and never looks at the macro again.
+
+    def test_macroexpand(self):
+        self.assertEqual(['if', 'a', 'a', ['my-or', 'b']], self.lisp.run('(macroexpand (quote (my-or a b)))'))
+        self.assertEqual(['car', 'x'], self.lisp.run('(macroexpand (quote (car x)))'))
+
+    def test_gensym(self):
+        self.lisp.run('''(define-macro (swap! a b)
+            (begin (define tmp (gensym))
+                (list (quote begin) (list (quote define) tmp a) (list (quote set!) a b) (list (quote set!) b tmp))))''')
+        self.lisp.run('(define tmp 1)')
+        self.lisp.run('(define other 2)')
+        self.lisp.run('(swap! tmp other)')
+        self.assertEqual([2, 1], self.lisp.run('(list tmp other)'))
+
+    def test_macro_is_not_a_procedure(self):
+        with self.assertRaises(TypeError):
+            self.lisp.run('(map unless (list 1))')
+
+    def test_defined_and_used_in_one_begin(self):
+        self.assertEqual(6, self.lisp.run('(begin (defmacro twice (e) (list (quote +) e e)) (define x 3) (twice x))'))
+
+    def test_not_inside_a_procedure(self):
+        for definition in ('(defmacro m (a) a)', '(define-macro (m a) a)', '(define-syntax m (syntax-rules () ((_ a) a)))'):
+            with self.subTest(definition=definition), self.assertRaisesRegex(SyntaxError, 'top level'):
+                self.lisp.run(f'(define h (lambda (x) (begin {definition} (m x))))')
+                self.lisp.run('(h 1)')
+
+    def test_bad_definitions(self):
+        for source in ('(define-macro 1 2)', '(defmacro m x)', '(define-syntax m (lambda (x) x))'):
+            with self.subTest(source=source), self.assertRaises(SyntaxError):
+                self.lisp.run(source)
+
+
+class TestEvalMacros(TestMacros):
+    engine = 'eval'
+
+    def cached_uses(self, runs: int) -> int:
+        return runs - 1 # eval meets the use every time, and only the first one expands it.
+
+
+class TestVMMacros(TestMacros):
+    engine = 'vm'
@@ -0,0 +1,108 @@
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.memo import Memoized, canonical_key
+from ricolisp.pairs import Pair, make_list, nil
+
+
+class TestMemoize(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.lisp = LispInterpreter(engine=self.engine)
+        self.calls = []
+        self.lisp.env['note'] = lambda x: self.calls.append(x) or x
+
+    def test_memoize_builtin(self):
+        self.lisp.run('(define double (memoize (lambda (x) (* 2 (note x)))))')
+        self.assertEqual(6, self.lisp.run('(double 3)'))
+        self.assertEqual(6, self.lisp.run('(double 3)'))
+        self.assertEqual(8, self.lisp.run('(double 4)'))
+        self.assertEqual([3, 4], self.calls)
+        self.assertEqual({'hits': 1, 'misses': 2, 'evictions': 0, 'size': 2, 'maxsize': 128},
+            self.lisp.env['double'].stats())
+
+    def test_define_memo_recursion(self):
+        self.lisp.run('(define-memo fib (lambda (n) (if (< n 2) (note n) (+ (fib (- n 1)) (fib (- n 2))))))')
+        self.assertEqual(354224848179261915075, self.lisp.run('(fib 100)'))
+        self.assertEqual([1, 0], self.calls)
+        self.assertEqual([['hits', 98], ['misses', 101], ['evictions', 0], ['size', 101], ['maxsize', 128]],
+            self.lisp.run('(memo-stats fib)'))
+
+    def test_lru_eviction(self):
+        self.lisp.run('(define-memo square (lambda (x) (* (note x) x)) 2)')
+        self.lisp.run('(square 1)')
+        self.lisp.run('(square 2)')
+        self.lisp.run('(square 1)') # 2 is now the least recently used...
+        self.lisp.run('(square 3)') # ...so this evicts it.
+        self.lisp.run('(square 1)')
+        self.lisp.run('(square 2)')
+        self.assertEqual([1, 2, 3, 2], self.calls)
+        stats = self.lisp.env['square'].stats()
+        self.assertEqual(2, stats['evictions'])
+        self.assertEqual(2, stats['size'])
+
+    def test_clear(self):
+        self.lisp.run('(define-memo id (lambda (x) (note x)))')
+        self.lisp.run('(id 1)')
+        self.lisp.run('(memo-clear! id)')
+        self.assertEqual([['hits', 0], ['misses', 0], ['evictions', 0], ['size', 0], ['maxsize', 128]],
+            self.lisp.run('(memo-stats id)'))
+        self.lisp.run('(id 1)')
+        self.assertEqual([1, 1], self.calls)
+
+    def test_list_arguments(self):
+        self.lisp.run('(define-memo total (lambda (xs) (note (if (null? xs) 0 (+ (car xs) (total (cdr xs)))))))')
+        self.assertEqual(6, self.lisp.run('(total (list 1 2 3))'))
+        self.assertEqual(6, self.lisp.run('(total (quote (1 2 3)))'))
+        self.assertEqual(5, self.lisp.run('(total (list 2 3))'))
+        self.assertEqual([0, 3, 5, 6], self.calls)
+
+    def test_local_define_memo(self):
+        self.lisp.run('(define f (lambda (x) (begin (define-memo g (lambda (y) (note y))) (+ (g x) (g x)))))')
+        self.assertEqual(4, self.lisp.run('(f 2)'))
+        self.assertEqual([2], self.calls)
+        self.assertNotIn('g', self.lisp.env)
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            self.lisp.run('(memoize 1)')
+        with self.assertRaises(ValueError):
+            self.lisp.run('(memoize car 0)')
+        with self.assertRaises(TypeError):
+            self.lisp.run('(memo-stats car)')
+        with self.assertRaises(SyntaxError):
+            self.lisp.run('(define-memo f)')
+
+
+class TestEvalMemoize(TestMemoize):
+    engine = 'eval'
+
+
+class TestVMMemoize(TestMemoize):
+    engine = 'vm'
+
+
+class TestMemoized(unittest.TestCase):
+    def test_canonical_key(self):
+        self.assertEqual(((1, 2), 3), canonical_key([make_list([1, 2]), 3]))
+        self.assertEqual((), canonical_key(nil))
+        self.assertNotEqual(canonical_key(make_list([1, 2])), canonical_key(Pair(1, 2)))
+
+    def test_unbounded(self):
+        square = Memoized(lambda x: x * x, maxsize=None)
+        for i in range(1000):
+            square(i)
+        self.assertEqual(1000, square.stats()['size'])
+        self.assertEqual(0, square.stats()['evictions'])
+
+    def test_exceptions_are_not_cached(self):
+        calls = []
+        def fail(x):
+            calls.append(x)
+            raise ValueError(x)
+        memo = Memoized(fail)
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                memo(1)
+        self.assertEqual([1, 1], calls)
@@ -0,0 +1,101 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ricolisp import LispInterpreter, modules
+
+
+class TestModules(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.write('geometry.lisp', '''
+            (define square (lambda (x) (* x x)))
+            (define area (lambda (r) (* pi (square r))))''')
+        self.write('lib/shapes.lisp', '''
+            (import "../geometry.lisp" g)
+            (define ring (lambda (outer inner) (- (g/area outer) (g/area inner))))''')
+        self.lisp = LispInterpreter(engine=self.engine)
+        self.lisp.directory = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, source: str):
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(source)
+        return path
+
+    def test_import(self):
+        self.lisp.run('(import "geometry.lisp")')
+        self.assertEqual(9, self.lisp.run('(geometry/square 3)'))
+        self.assertNotIn('square', self.lisp.env)
+
+    def test_prefix_and_nested_import(self):
+        self.lisp.run('(import "lib/shapes.lisp" s)')
+        self.assertAlmostEqual(3.14159 * 3, self.lisp.run('(s/ring 2 1)'), places=4)
+        self.assertNotIn('g/area', self.lisp.env)
+
+    def test_require(self):
+        self.lisp.run('(require "geometry.lisp")')
+        self.assertEqual(16, self.lisp.run('(square 4)'))
+
+    def test_modules_have_their_own_globals(self):
+        self.write('counter.lisp', '(define count (if (procedure? square) 1 0))')
+        self.lisp.run('(define square 5)')
+        with self.assertRaises(Exception):
+            self.lisp.run('(import "counter.lisp")')
+
+    def test_loaded_once(self):
+        self.write('noisy.lisp', '(print 1) (define x 1)')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.lisp.run('(begin (import "noisy.lisp") (import "noisy.lisp" again))')
+        self.assertEqual('1\n', output.getvalue())
+        self.assertEqual(1, self.lisp.run('again/x'))
+
+    def test_reloaded_when_changed(self):
+        path = self.write('value.lisp', '(define x 1)')
+        self.lisp.run('(import "value.lisp")')
+        self.write('value.lisp', '(define x 22)')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+        self.lisp.run('(import "value.lisp")')
+        self.assertEqual(22, self.lisp.run('value/x'))
+
+    def test_disk_cache(self):
+        self.lisp.run('(import "geometry.lisp")')
+        self.assertTrue(os.path.exists(modules.cache_path(os.path.join(self.directory.name, 'geometry.lisp'))))
+        lisp = LispInterpreter(engine=self.engine)
+        lisp.directory = self.directory.name
+        with mock.patch.object(modules, 'read', side_effect=AssertionError('parsed again')):
+            lisp.run('(import "geometry.lisp")')
+        self.assertEqual(4, lisp.run('(geometry/square 2)'))
+
+    def test_circular_import(self):
+        self.write('a.lisp', '(import "b.lisp")')
+        self.write('b.lisp', '(import "a.lisp")')
+        with self.assertRaises(ImportError):
+            self.lisp.run('(import "a.lisp")')
+
+    def test_run_file_imports_relative_to_file(self):
+        main = self.write('lib/main.lisp', '(import "shapes.lisp") (shapes/ring 1 0)')
+        lisp = LispInterpreter(engine=self.engine)
+        self.assertAlmostEqual(3.14159, lisp.run_file(main), places=4)
+
+    def test_bad_form(self):
+        with self.assertRaises(SyntaxError):
+            self.lisp.run('(require "a.lisp" b)')
+
+
+class TestEvalModules(TestModules):
+    engine = 'eval'
+
+
+class TestVMModules(TestModules):
+    engine = 'vm'
@@ -0,0 +1,117 @@
+import math
+import time
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.compiler import Compiler
+from ricolisp.interpreter import parse, standard_env
+from ricolisp.limits import Budget
+from ricolisp.optimizer import Optimizer
+
+
+class TestOptimizer(unittest.TestCase):
+    def setUp(self):
+        self.env = standard_env()
+        self.optimizer = Optimizer(self.env)
+        self.compiler = Compiler(self.env, optimizer=self.optimizer)
+
+    def compile(self, source: str):
+        return self.compiler.compile(parse(source))
+
+    def test_folds_constants(self):
+        code = self.compile('(+ 1 (* 5 10))')
+        self.assertEqual((51, frozenset(('+', '*'))), self.optimizer.static[code])
+        self.assertEqual(51, code(None))
+
+    def test_folds_constant_globals(self):
+        code = self.compile('(* 2 pi)')
+        self.assertEqual(2 * math.pi, self.optimizer.static[code][0])
+
+    def test_doesnt_fold_variables_or_errors(self):
+        self.env['r'] = 2
+        self.assertNotIn(self.compile('(* r r)'), self.optimizer.static)
+        code = self.compile('(/ 1 0)')
+        self.assertNotIn(code, self.optimizer.static)
+        with self.assertRaises(ZeroDivisionError):
+            code(None)
+
+    def test_doesnt_fold_expensive_calls(self):
+        self.assertNotIn(self.compile('(factorial 20)'), self.optimizer.static)
+        source = '4294967296'
+        for _ in range(4):
+            source = f'(* {source} {source})'
+        self.assertEqual(2 ** 512, self.optimizer.static[self.compile(source)][0])
+        big = self.compile(f'(* {source} {source})')
+        self.assertNotIn(big, self.optimizer.static)
+        self.assertEqual(2 ** 1024, big(None))
+        self.assertEqual(3.0, self.optimizer.static[self.compile('(sqrt 9)')][0])
+
+    def test_doesnt_fold_in_dead_branches(self):
+        code = self.compile('(if (> 1 2) (+ 1 2) (* 2 5))')
+        self.assertEqual(10, code(None))
+        self.assertEqual(0, self.optimizer.unreachable_depth)
+        values = [value for value, _ in self.optimizer.static.values()]
+        self.assertIn(10, values)
+        self.assertNotIn(3, values)
+        with self.optimizer.unreachable():
+            self.assertNotIn(self.compile('(+ 1 2)'), self.optimizer.static)
+
+    def test_dead_branch_costs_nothing_under_a_budget(self):
+        lisp = LispInterpreter()
+        start = time.perf_counter()
+        self.assertEqual(1, lisp.run('(if 0 (factorial 300000) 1)', Budget(seconds=0.05, steps=100)))
+        self.assertLess(time.perf_counter() - start, 0.05)
+
+    def test_inlines_operators(self):
+        self.env['x'] = 3
+        code = self.compile('(- x 1)')
+        self.assertEqual('sub', code.__name__)
+        self.assertEqual(2, code(None))
+
+    def test_doesnt_inline_local_names(self):
+        self.env['f'] = self.compile('(lambda (+) (+ 1 2))')(None)
+        self.assertEqual(-1, self.env['f'](lambda a, b: a - b))
+
+
+class TestInvalidation(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter()
+
+    def test_redefine_operator(self):
+        self.lisp.run('(define f (lambda (x) (+ x (* 5 10))))')
+        self.assertEqual(51, self.lisp.run('(f 1)'))
+        self.lisp.run('(define + -)')
+        self.assertEqual(-49, self.lisp.run('(f 1)'))
+        self.lisp.run('(set! * (lambda (a b) 0))')
+        self.assertEqual(1, self.lisp.run('(f 1)'))
+
+    def test_redefine_constant(self):
+        self.lisp.run('(define area (lambda (r) (* pi (* r r))))')
+        self.lisp.run('(define circumference (lambda () (* 2 pi)))')
+        self.lisp.run('(define pi 3)')
+        self.assertEqual(12, self.lisp.run('(area 2)'))
+        self.assertEqual(6, self.lisp.run('(circumference)'))
+
+    def test_redefine_while_running(self):
+        self.lisp.run('(define evil (lambda () (set! + -)))')
+        self.lisp.run('(define g (lambda () (begin (evil) (+ 1 2))))')
+        self.assertEqual(-1, self.lisp.run('(g)'))
+
+    def test_redefine_in_same_expression(self):
+        self.assertEqual(-1, self.lisp.run('(begin (define + -) (+ 1 2))'))
+
+    def test_redefine_as_procedure_in_tail_position(self):
+        self.lisp.run('(define f (lambda (x) (+ x 1)))')
+        self.lisp.run('(define + (lambda (a b) (* a b)))')
+        self.assertEqual(5, self.lisp.run('(f 5)'))
+
+    def test_delete(self):
+        self.lisp.run('(define f (lambda () (+ 1 2)))')
+        del self.lisp.env['+']
+        with self.assertRaisesRegex(Exception, 'Variable "\\+" not found'):
+            self.lisp.run('(f)')
+
+    def test_optimize_off(self):
+        lisp = LispInterpreter(optimize=False)
+        self.assertIsNone(lisp.compiler.optimizer)
+        self.assertEqual(51, lisp.run('(+ 1 (* 5 10))'))
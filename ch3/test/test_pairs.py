@@ -0,0 +1,78 @@
+import pickle
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.interpreter import unparse
+from ricolisp.pairs import Pair, nil, make_list, from_python, to_python
+
+
+class TestPairs(unittest.TestCase):
+    def test_equality_with_python_sequences(self):
+        x = make_list([1, [2, 3]])
+        self.assertEqual(x, [1, [2, 3]])
+        self.assertEqual(x, make_list([1, make_list([2, 3])]))
+        self.assertNotEqual(x, [1, [2, 3], 4])
+        self.assertNotEqual(x, [1])
+        self.assertEqual(nil, [])
+        self.assertFalse(nil)
+        self.assertTrue(make_list([0]))
+
+    def test_conversion(self):
+        nested = [1, [2, [3]], []]
+        self.assertIs(Pair, type(from_python(nested)))
+        self.assertEqual(nested, to_python(from_python(nested)))
+        self.assertIs(list, type(to_python(from_python(nested))[1]))
+
+    def test_unparse(self):
+        self.assertEqual('(1 (2 3) ())', unparse(from_python([1, [2, 3], []])))
+        self.assertEqual('(1 . 2)', unparse(Pair(1, 2)))
+
+    def test_pickle_keeps_nil_singleton(self):
+        self.assertIs(nil, pickle.loads(pickle.dumps(nil)))
+        self.assertEqual([1, 2], pickle.loads(pickle.dumps(make_list([1, 2]))))
+
+
+class TestListBuiltins(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter()
+
+    def test_cons_shares_tail(self):
+        self.lisp.run('(define tail (list 2 3))')
+        self.lisp.run('(define whole (cons 1 tail))')
+        self.assertIs(self.lisp.env['tail'], self.lisp.run('(cdr whole)'))
+        self.assertEqual(1, self.lisp.run('(car whole)'))
+
+    def test_long_recursive_walk(self):
+        self.lisp.run('(define build (lambda (n acc) (if (= n 0) acc (build (- n 1) (cons n acc)))))')
+        self.lisp.run('(define walk (lambda (l n) (if (null? l) n (walk (cdr l) (+ n 1)))))')
+        self.assertEqual(50000, self.lisp.run('(walk (build 50000 (list)) 0)'))
+
+    def test_builtins(self):
+        self.assertEqual([1, 2, 3, 4], self.lisp.run('(append (list 1 2) (list 3) (list 4))'))
+        self.assertEqual(3, self.lisp.run('(length (list 1 2 3))'))
+        self.assertEqual([5, 7], self.lisp.run('(map + (list 1 2) (list 4 5))'))
+        self.assertTrue(self.lisp.run('(null? (list))'))
+        self.assertFalse(self.lisp.run('(null? (list 1))'))
+        self.assertTrue(self.lisp.run('(list? (quote (1 2)))'))
+        self.assertEqual(6, self.lisp.run('(apply + (list 2 4))'))
+        self.assertTrue(self.lisp.run('(equal? (list 1 (list 2)) (quote (1 (2))))'))
+
+    def test_quote_makes_lisp_lists(self):
+        for engine in LispInterpreter.engines:
+            value = LispInterpreter(engine=engine).run('(quote (a (b c)))')
+            self.assertIs(Pair, type(value))
+            self.assertEqual(['a', ['b', 'c']], value)
+
+    def test_quote_gives_the_same_list_each_time(self):
+        for engine in LispInterpreter.engines:
+            lisp = LispInterpreter(engine=engine)
+            lisp.run('(define q (lambda () (quote (1 2))))')
+            self.assertTrue(lisp.run('(eq? (q) (q))'), engine)
+            self.assertFalse(lisp.run('(eq? (q) (quote (1 2)))'), engine)
+
+    def test_python_lists_from_outside(self):
+        self.lisp.env['data'] = [1, 2, 3]
+        self.assertEqual(1, self.lisp.run('(car data)'))
+        self.assertEqual([2, 3], self.lisp.run('(cdr data)'))
+        self.assertEqual([0, 1, 2, 3], self.lisp.run('(cons 0 data)'))
+        self.assertEqual(3, self.lisp.run('(length data)'))
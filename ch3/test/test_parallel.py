@@ -0,0 +1,91 @@
+import pickle
+import unittest
+from unittest import mock
+
+from ricolisp import LispInterpreter, parallel
+from ricolisp.pairs import Pair, make_list
+from ricolisp.parallel import Pool, free_variables
+
+
+class TestPmap(unittest.TestCase):
+    engine = 'compile'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.lisp = LispInterpreter(engine=cls.engine)
+        cls.lisp.pool = Pool(cls.lisp.env, workers=2)
+        cls.patcher = mock.patch.object(parallel, 'sequential_below', 4)
+        cls.patcher.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.lisp.close()
+        cls.patcher.stop()
+
+    def test_closure_and_globals(self):
+        self.lisp.run('(define weight 3)')
+        self.lisp.run('(define square (lambda (x) (* x x)))')
+        self.lisp.run('(define make-scorer (lambda (k) (lambda (x) (+ (square x) (* k weight)))))')
+        self.assertEqual([31, 34, 39, 46, 55, 66], self.lisp.run('(pmap (make-scorer 10) (list 1 2 3 4 5 6))'))
+
+    def test_recursion_and_chunk_size(self):
+        self.lisp.run('(define fact (lambda (n) (if (= n 0) 1 (* n (fact (- n 1))))))')
+        self.assertEqual([1, 2, 6, 24, 120, 720, 5040], self.lisp.run('(pmap fact (list 1 2 3 4 5 6 7) 2)'))
+
+    def test_captured_local_procedure(self):
+        self.lisp.run('''(define summer (lambda (n) (begin
+            (define loop (lambda (i acc) (if (= i 0) acc (loop (- i 1) (+ acc i)))))
+            (lambda (x) (loop (+ n x) 0)))))''')
+        self.assertEqual([3, 6, 10, 15, 21], self.lisp.run('(pmap (summer 1) (list 1 2 3 4 5))'))
+
+    def test_lists(self):
+        self.assertEqual([2, 1, 0, 3], self.lisp.run('(pmap length (list (list 1 2) (list 3) (list) (list 4 5 6)))'))
+        self.assertEqual([[2, 3], [4], [], [5, 6, 7]],
+            self.lisp.run('(pmap (lambda (xs) (map (lambda (x) (+ x 1)) xs)) (list (list 1 2) (list 3) (list) (list 4 5 6)))'))
+
+    def test_builtin_under_another_builtins_name(self):
+        self.addCleanup(self.lisp.env.__setitem__, 'max', self.lisp.env['max'])
+        self.lisp.run('(define max min)')
+        self.assertEqual([1, 2, 3, 3, 3], self.lisp.run('(pmap (lambda (x) (max x 3)) (list 1 2 3 4 5))'))
+
+    def test_builtin_rebound_between_pmaps(self):
+        self.addCleanup(self.lisp.env.__setitem__, 'max', self.lisp.env['max'])
+        self.lisp.run('(define orig max)')
+        self.lisp.run('(define max min)')
+        self.lisp.run('(define f (lambda (x) (max x 5)))')
+        self.assertEqual([1, 2, 3, 4, 5, 5], self.lisp.run('(pmap f (list 1 2 3 4 5 6) 1)'))
+        self.lisp.run('(set! max orig)')
+        self.assertEqual([197, 198, 199, 5, 5, 6], self.lisp.run('(pmap f (list 197 198 199 4 5 6) 1)'))
+
+    def test_memoized_global(self):
+        self.lisp.run('(define-memo cube (lambda (x) (* x (* x x))))')
+        self.assertEqual([1, 8, 27, 8, 1], self.lisp.run('(pmap (lambda (x) (cube x)) (list 1 2 3 2 1))'))
+        self.assertEqual([1, 8, 27, 64, 125], self.lisp.run('(pmap cube (list 1 2 3 4 5))'))
+
+    def test_python_api(self):
+        proc = self.lisp.run('(lambda (x) (* x 2))')
+        self.assertEqual([0, 2, 4, 6, 8], self.lisp.pmap(proc, range(5), chunk_size=1))
+
+
+class TestEvalPmap(TestPmap):
+    engine = 'eval'
+
+
+class TestVMPmap(TestPmap):
+    engine = 'vm'
+
+
+class TestSerialization(unittest.TestCase):
+    def test_small_inputs_run_sequentially(self):
+        lisp = LispInterpreter()
+        self.assertEqual([1, 4, 9], lisp.run('(pmap (lambda (x) (* x x)) (list 1 2 3))'))
+        self.assertIsNone(lisp.pool.executor)
+
+    def test_free_variables(self):
+        self.assertEqual(['+', 'x', 'y'],
+            free_variables(['+', 'a', 'x', ['quote', 'q'], ['lambda', ['z'], ['+', 'z', 'y']]], {'a'}))
+        self.assertEqual(['begin', 'define', '*'], free_variables(['begin', ['define', 'd', 1], ['*', 'd', 'd']], {'d'}))
+
+    def test_pickle_long_list(self):
+        items = make_list(range(100000), Pair(1, 2))
+        self.assertEqual(items, pickle.loads(pickle.dumps(items)))
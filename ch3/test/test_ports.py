@@ -0,0 +1,129 @@
+import contextlib
+import gc
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from ricolisp import LispInterpreter, ports
+from ricolisp.interpreter import Console, unparse
+from ricolisp.pairs import LazyList, make_list
+from ricolisp.ports import FilePort, StringPort
+
+
+class TestPorts(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.output = StringPort()
+        self.lisp = LispInterpreter(engine=self.engine, output=self.output)
+
+    def test_print_goes_to_the_interpreter_port(self):
+        self.lisp.run('(print 1 (quote (a (b c))) (list))')
+        self.lisp.run('(begin (display (quote x)) (newline))')
+        self.assertEqual('1 (a (b c)) ()\nx\n', self.output.getvalue())
+
+    def test_string_port(self):
+        self.lisp.run('(define out (open-output-string))')
+        self.lisp.run('(begin (display (list 1 2) out) (display 3 out))')
+        self.assertEqual('(1 2)3', self.lisp.run('(get-output-string out)'))
+        self.assertEqual('', self.output.getvalue())
+
+    def read(self, path: str) -> str:
+        with open(path) as f:
+            return f.read()
+
+    def test_file_port(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.txt')
+            self.lisp.run(f'(define log (open-output-file (quote "{path}")))')
+            self.lisp.run('(begin (display (quote started) log) (newline log))')
+            self.assertEqual('', self.read(path)) # Still in the buffer.
+            self.lisp.run('(flush-output log)')
+            self.assertEqual('started\n', self.read(path))
+            self.lisp.run('(begin (display 2 log) (close-port log))')
+            self.assertEqual('started\n2', self.read(path))
+            with self.assertRaises(ValueError):
+                self.lisp.run('(display 3 log)')
+
+    def test_file_port_is_flushed_at_exit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.txt')
+            program = ('from ricolisp import LispInterpreter\n'
+                f'lisp = LispInterpreter(engine={self.engine!r})\n'
+                f'lisp.run("(define log (open-output-file (quote {path})))")\n'
+                'lisp.run("(display (quote unclosed) log)")\n')
+            subprocess.run([sys.executable, '-c', program], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+            self.assertEqual('unclosed', self.read(path))
+
+    def test_dropped_file_port_is_flushed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log.txt')
+            self.lisp.run(f'(display (quote dropped) (open-output-file (quote "{path}")))')
+            gc.collect()
+            self.assertEqual('dropped', self.read(path))
+
+    def test_stdout_is_flushed_after_a_run(self):
+        lisp = LispInterpreter(engine=self.engine)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            lisp.run('(begin (print 1) (print 2))')
+        self.assertEqual('1\n2\n', output.getvalue())
+
+
+class TestEvalPorts(TestPorts):
+    engine = 'eval'
+
+
+class TestVMPorts(TestPorts):
+    engine = 'vm'
+
+
+class TestBuffering(unittest.TestCase):
+    def test_buffer_size(self):
+        file = io.StringIO()
+        port = FilePort(file, buffer_size=10)
+        port.write('12345')
+        self.assertEqual('', file.getvalue())
+        port.write('67890')
+        self.assertEqual('1234567890', file.getvalue())
+
+    def test_line_buffered(self):
+        file = io.StringIO()
+        port = FilePort(file, line_buffered=True)
+        port.write('no newline yet')
+        self.assertEqual('', file.getvalue())
+        port.write('\n')
+        self.assertEqual('no newline yet\n', file.getvalue())
+
+    def test_unbuffered(self):
+        file = io.StringIO()
+        FilePort(file, buffer_size=0).write('x')
+        self.assertEqual('x', file.getvalue())
+
+    def test_console(self):
+        port = StringPort()
+        console = Console(port)
+        console.print(make_list([1, make_list([2])]))
+        console.print(None)
+        self.assertEqual('(1 (2))\n', port.getvalue())
+
+    def test_current_port(self):
+        port = StringPort()
+        with ports.output_to(port):
+            self.assertIs(port, ports.current_output_port())
+        self.assertIs(ports.stdout, ports.current_output_port())
+
+
+class TestWriteValue(unittest.TestCase):
+    def test_matches_unparse(self):
+        values = [1, 'a', [1, [2, 3], []], make_list([1, make_list(['b']), 2.5]), make_list([1], 2),
+            LazyList(iter([1, 2]))]
+        for value in values:
+            port = StringPort()
+            port.write_value(value)
+            self.assertEqual(unparse(value), port.getvalue())
+        self.assertEqual('(1 2 (3) . 4)', unparse(make_list([1, 2, make_list([3])], 4)))
+        self.assertEqual('(...)', unparse(LazyList(iter([1]))))
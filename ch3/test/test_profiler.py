@@ -0,0 +1,69 @@
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.pairs import to_python
+
+FIB = '(define fib (lambda (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2))))))'
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter(profile=True)
+        self.lisp.run(FIB)
+
+    def entries(self):
+        return {entry.name: entry for entry in self.lisp.profiler.report()}
+
+    def test_procedure_calls_and_times(self):
+        self.assertEqual(55, self.lisp.run('(fib 10)'))
+        fib = self.entries()['fib']
+        self.assertEqual('procedure', fib.kind)
+        self.assertEqual(177, fib.calls)
+        self.assertGreater(fib.nodes, 177)
+        self.assertGreater(fib.inclusive, 0)
+        self.assertLessEqual(fib.exclusive, fib.inclusive)
+
+    def test_primitives(self):
+        self.lisp.run('(fib 10)')
+        entries = self.entries()
+        self.assertEqual(88, entries['+'].calls)
+        self.assertEqual(177, entries['<'].calls)
+        self.assertEqual('primitive', entries['+'].kind)
+
+    def test_exclusive_time_excludes_callees(self):
+        clock = iter(range(1000)).__next__
+        self.lisp = LispInterpreter(profile=True)
+        self.lisp.profiler.clock = clock
+        self.lisp.run('(define inner (lambda () 1))')
+        self.lisp.run('(define outer (lambda () (+ 1 (inner))))')
+        self.lisp.run('(outer)')
+        outer, inner, plus = [self.entries()[name] for name in ('outer', 'inner', '+')]
+        self.assertEqual(outer.inclusive - inner.inclusive - plus.inclusive, outer.exclusive)
+        self.assertGreater(outer.exclusive, 0)
+
+    def test_tail_calls_are_not_nested(self):
+        self.lisp.run('(define loop (lambda (n) (if (= n 0) 0 (loop (- n 1)))))')
+        self.lisp.run('(loop 3000)')
+        self.assertEqual(3001, self.entries()['loop'].calls)
+
+    def test_profile_report_builtin(self):
+        self.lisp.run('(fib 5)')
+        rows = to_python(self.lisp.run('(profile-report)'))
+        self.assertIn('fib', [row[0] for row in rows])
+        exclusive = [row[4] for row in rows]
+        self.assertEqual(sorted(exclusive, reverse=True), exclusive)
+        self.assertIn('fib', self.lisp.profiler.format_report())
+
+    def test_reset(self):
+        self.lisp.run('(fib 5)')
+        self.lisp.profiler.reset()
+        self.assertNotIn('fib', self.entries())
+
+    def test_disabled_by_default(self):
+        lisp = LispInterpreter()
+        self.assertIsNone(lisp.compiler.profiler)
+        self.assertEqual([], lisp.run('(profile-report)'))
+
+    def test_needs_compile_engine(self):
+        with self.assertRaises(ValueError):
+            LispInterpreter(engine='vm', profile=True)
@@ -0,0 +1,70 @@
+import io
+import os
+import tempfile
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.interpreter import read, read_tokens, read_from_tokens, parse
+
+
+class TestReader(unittest.TestCase):
+    def test_read_multiple_forms(self):
+        forms = list(read('(define x 1) x (+ x 2.5)'))
+        self.assertEqual([['define', 'x', 1], 'x', ['+', 'x', 2.5]], forms)
+
+    def test_tokens_split_across_chunks(self):
+        chunks = ['(def', 'ine long', 'name 12', '3) (f', 'oo)', ' bar']
+        self.assertEqual(['(', 'define', 'longname', '123', ')', '(', 'foo', ')', 'bar'], list(read_tokens(chunks)))
+        self.assertEqual([['define', 'longname', 123], ['foo'], 'bar'], list(read(chunks)))
+
+    def test_read_file_object(self):
+        source = io.StringIO('(a (b (c)))\n(d)\n')
+        self.assertEqual([['a', ['b', ['c']]], ['d']], list(read(source)))
+
+    def test_deep_nesting(self):
+        depth = 10000
+        expression = parse('(' * depth + ')' * depth)
+        for _ in range(depth - 1):
+            expression = expression[0]
+        self.assertEqual([], expression)
+
+    def test_errors(self):
+        with self.assertRaisesRegex(SyntaxError, 'unexpected EOF'):
+            parse('(+ 1 2')
+        with self.assertRaisesRegex(SyntaxError, 'unexpected EOF'):
+            parse('')
+        with self.assertRaisesRegex(SyntaxError, 'unexpected \\)'):
+            parse(')')
+
+    def test_read_from_tokens_iterator(self):
+        tokens = iter(['(', 'a', ')', 'b'])
+        self.assertEqual(['a'], read_from_tokens(tokens))
+        self.assertEqual('b', read_from_tokens(tokens))
+
+    def test_forms_are_yielded_as_soon_as_they_are_read(self):
+        def chunks():
+            yield '(define x 1)'
+            yield ' (define y (+ x 1))'
+            raise AssertionError('read past the second form')
+        forms = read(chunks())
+        self.assertEqual(['define', 'x', 1], next(forms))
+        self.assertEqual(['define', 'y', ['+', 'x', 1]], next(forms))
+
+
+class TestRunStream(unittest.TestCase):
+    def test_run_stream_executes_as_it_reads(self):
+        lisp = LispInterpreter()
+        executed = []
+        def chunks():
+            yield '(define x 1)'
+            executed.append(lisp.env['x'])
+            yield '(define x (+ x 1)) x'
+        self.assertEqual(2, lisp.run_stream(chunks()))
+        self.assertEqual([1], executed)
+
+    def test_run_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.lisp', delete=False) as f:
+            f.write('(define square (lambda (x) (* x x)))\n(square 12)\n')
+        self.addCleanup(os.remove, f.name)
+        for engine in LispInterpreter.engines:
+            self.assertEqual(144, LispInterpreter(engine=engine).run_file(f.name))
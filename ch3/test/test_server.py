@@ -0,0 +1,156 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.server import InterpreterPool, LatencyStats, Server, request
+
+
+class TestOverlayEnv(unittest.TestCase):
+    def setUp(self):
+        self.base = LispInterpreter()
+        self.base.run('(define square (lambda (x) (* x x)))')
+        self.base.run('(define counter 0)')
+
+    def test_sees_base(self):
+        lisp = LispInterpreter(env=self.base.env.overlay())
+        self.assertEqual(49, lisp.run('(square 7)'))
+        self.assertEqual(3, lisp.run('(+ counter 3)'))
+
+    def test_changes_stay_in_overlay(self):
+        lisp = LispInterpreter(env=self.base.env.overlay())
+        lisp.run('(set! counter 10)')
+        lisp.run('(define square (lambda (x) x))')
+        self.assertEqual(7, lisp.run('(square 7)'))
+        self.assertEqual(10, lisp.run('counter'))
+        self.assertEqual(49, self.base.run('(square 7)'))
+        self.assertEqual(0, self.base.run('counter'))
+        other = LispInterpreter(env=self.base.env.overlay())
+        self.assertEqual(49, other.run('(square 7)'))
+
+    def test_every_engine(self):
+        for engine in LispInterpreter.engines:
+            lisp = LispInterpreter(engine=engine, env=self.base.env.overlay())
+            self.assertEqual(16, lisp.run('(begin (define y 4) (square y))'), engine)
+            self.assertNotIn('y', self.base.env)
+
+    def test_frozen_base(self):
+        self.base.run('(define bump (lambda () (begin (set! counter (+ counter 1)) counter)))')
+        self.base.env.freeze()
+        for engine in LispInterpreter.engines:
+            lisp = LispInterpreter(engine=engine, env=self.base.env.overlay())
+            with self.assertRaisesRegex(TypeError, 'counter'):
+                lisp.run('(bump)')
+            self.assertEqual(5, lisp.run('(begin (set! counter 5) counter)'), engine)
+            self.assertEqual(0, self.base.env['counter'])
+
+
+class TestLatencyStats(unittest.TestCase):
+    def test_percentiles(self):
+        stats = LatencyStats()
+        self.assertEqual({'count': 0, 'p50_ms': None, 'p90_ms': None, 'p99_ms': None, 'max_ms': None}, stats.report())
+        for ms in range(1, 101):
+            stats.record(ms / 1000)
+        self.assertEqual({'count': 100, 'p50_ms': 50, 'p90_ms': 90, 'p99_ms': 99, 'max_ms': 100}, stats.report())
+
+
+class TestInterpreterPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.NamedTemporaryFile('w', suffix='.lisp', delete=False) as f:
+            f.write('(define fact (lambda (n) (if (= n 0) 1 (* n (fact (- n 1))))))\n')
+            f.write('(define counter 0)\n')
+            f.write('(define bump (lambda () (begin (set! counter (+ counter 1)) counter)))\n')
+        cls.prelude = f.name
+        cls.pool = InterpreterPool(workers=2, preludes=[cls.prelude], timeout=5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        os.unlink(cls.prelude)
+
+    def test_evaluate(self):
+        response = self.pool.evaluate('(print (fact 5)) (fact 10)')
+        self.assertTrue(response['ok'])
+        self.assertEqual('3628800', response['value'])
+        self.assertEqual('120\n', response['output'])
+        self.assertGreater(response['ms'], 0)
+
+    def test_requests_are_isolated(self):
+        self.pool.evaluate('(define fact (lambda (n) 0))')
+        self.assertEqual('6', self.pool.evaluate('(fact 3)')['value'])
+
+    def test_prelude_state_is_frozen(self):
+        for _ in range(3):
+            response = self.pool.evaluate('(bump)')
+            self.assertFalse(response['ok'])
+            self.assertIn("Can't change counter", response['error'])
+        self.assertEqual('0', self.pool.evaluate('counter')['value'])
+
+    def test_error(self):
+        response = self.pool.evaluate('(car 1)')
+        self.assertFalse(response['ok'])
+        self.assertIn('TypeError', response['error'])
+
+    def test_timeout(self):
+        response = self.pool.evaluate('(define spin (lambda () (spin))) (spin)', timeout=0.2)
+        self.assertFalse(response['ok'])
+        self.assertIn('RequestTimeout', response['error'])
+        self.assertEqual('2', self.pool.evaluate('(+ 1 1)')['value'])
+
+    def test_bad_timeout(self):
+        for timeout in ('2', -1, 0, float('nan'), True):
+            with self.subTest(timeout=timeout), self.assertRaises(ValueError):
+                self.pool.evaluate('1', timeout=timeout)
+        response = asyncio.run(Server(self.pool).respond(b'{"source": "1", "timeout": "2"}'))
+        self.assertFalse(response['ok'])
+        self.assertIn('timeout', response['error'])
+        worker = self.pool.idle.get() # A bad request that gets past the checks doesn't stop the worker.
+        try:
+            worker.connection.send(('1', '2'))
+            self.assertIn('TypeError', worker.connection.recv()['error'])
+        finally:
+            self.pool.idle.put(worker)
+        for _ in range(len(self.pool.workers) + 1):
+            self.assertEqual('2', self.pool.evaluate('(+ 1 1)')['value'])
+
+    def test_dead_worker_is_replaced(self):
+        pool = InterpreterPool(workers=1, timeout=5)
+        try:
+            dead = pool.workers[0]
+            dead.process.kill()
+            dead.process.join()
+            response = pool.evaluate('(+ 1 1)')
+            self.assertFalse(response['ok'])
+            self.assertIn('WorkerDied', response['error'])
+            self.assertIsNot(dead, pool.workers[0])
+            self.assertEqual('2', pool.evaluate('(+ 1 1)')['value'])
+        finally:
+            pool.close()
+
+    def test_socket(self):
+        path = os.path.join(tempfile.mkdtemp(), 'lisp.sock')
+        started = threading.Event()
+        loop = asyncio.new_event_loop()
+        async def serve():
+            try:
+                await Server(self.pool).serve(unix=path, started=started)
+            except asyncio.CancelledError:
+                pass
+        serving = loop.create_task(serve())
+        thread = threading.Thread(target=loop.run_until_complete, args=(serving,))
+        thread.start()
+        try:
+            self.assertTrue(started.wait(5))
+            self.assertEqual('24', request(path, {'source': '(fact 4)'})['value'])
+            self.assertFalse(request(path, {'sauce': '(fact 4)'})['ok'])
+            stats = request(path, {'stats': True})['stats']
+            self.assertGreaterEqual(stats['count'], 1)
+            self.assertLessEqual(stats['p50_ms'], stats['max_ms'])
+        finally:
+            loop.call_soon_threadsafe(serving.cancel)
+            thread.join()
+            loop.close()
+            os.unlink(path)
@@ -0,0 +1,116 @@
+import unittest
+
+from ricolisp import LispInterpreter, tables
+from ricolisp.pairs import make_list
+from ricolisp.tables import HashTable, assoc, assq
+
+
+class TestHashTables(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.lisp = LispInterpreter(engine=self.engine)
+        self.lisp.run('(define h (make-hash))')
+
+    def test_set_and_ref(self):
+        self.lisp.run('(hash-set! h (quote a) 1)')
+        self.lisp.run('(hash-set! h (quote b) 2)')
+        self.lisp.run('(hash-set! h (quote a) 3)')
+        self.assertEqual(3, self.lisp.run('(hash-ref h (quote a))'))
+        self.assertEqual(2, self.lisp.run('(hash-count h)'))
+        self.assertEqual(0, self.lisp.run('(hash-ref h (quote c) 0)'))
+        with self.assertRaises(KeyError):
+            self.lisp.run('(hash-ref h (quote c))')
+
+    def test_list_keys_are_equal_by_contents(self):
+        self.lisp.run('(hash-set! h (list 1 (list 2 3)) (quote found))')
+        self.assertEqual('found', self.lisp.run('(hash-ref h (quote (1 (2 3))))'))
+        self.assertTrue(self.lisp.run('(hash-has-key? h (cons 1 (list (list 2 3))))'))
+        self.assertFalse(self.lisp.run('(hash-has-key? h (list 1 2 3))'))
+        self.assertEqual([[1, [2, 3]]], self.lisp.run('(hash-keys h)'))
+
+    def test_remove(self):
+        self.lisp.run('(hash-set! h (list) 1)')
+        self.lisp.run('(hash-remove! h (quote ()))')
+        self.lisp.run('(hash-remove! h (quote missing))')
+        self.assertEqual(0, self.lisp.run('(hash-count h)'))
+
+    def test_iteration(self):
+        self.lisp.run('(define h (make-hash (quote ((a 1) (b 2) (c 3)))))')
+        self.assertEqual(['a', 'b', 'c'], self.lisp.run('(hash-keys h)'))
+        self.assertEqual([1, 2, 3], self.lisp.run('(hash-values h)'))
+        self.assertEqual([['a', 1], ['b', 2], ['c', 3]], self.lisp.run('(hash->list h)'))
+        self.lisp.run('(define total 0)')
+        self.lisp.run('(hash-for-each h (lambda (k v) (set! total (+ total v))))')
+        self.assertEqual(6, self.lisp.run('total'))
+
+    def test_not_a_table(self):
+        with self.assertRaises(TypeError):
+            self.lisp.run('(hash-ref (list 1) 1)')
+        self.assertFalse(self.lisp.run('(hash? (list))'))
+        self.assertTrue(self.lisp.run('(hash? h)'))
+
+    def test_assoc(self):
+        self.lisp.run('(define colors (quote ((red 1) ((dark red) 2) (blue 3))))')
+        self.assertEqual(['blue', 3], self.lisp.run('(assoc (quote blue) colors)'))
+        self.assertEqual([['dark', 'red'], 2], self.lisp.run('(assoc (list (quote dark) (quote red)) colors)'))
+        self.assertFalse(self.lisp.run('(assoc (quote green) colors)'))
+
+
+class TestEvalHashTables(TestHashTables):
+    engine = 'eval'
+
+
+class TestVMHashTables(TestHashTables):
+    engine = 'vm'
+
+
+class TestIndexedAssociationLists(unittest.TestCase):
+    def setUp(self):
+        self.keys = [make_list([i, 'k']) for i in range(tables.index_threshold * 3)]
+        self.alist = make_list([make_list([key, i]) for i, key in enumerate(self.keys)] + [make_list([self.keys[5], 'late'])])
+
+    def test_long_list_is_indexed(self):
+        self.assertEqual([[90, 'k'], 90], assoc(make_list([90, 'k']), self.alist))
+        self.assertIn((id(self.alist), 'assoc'), tables._indexes)
+        self.assertEqual([[70, 'k'], 70], assoc(make_list([70, 'k']), self.alist))
+        self.assertEqual([[5, 'k'], 5], assoc(make_list([5, 'k']), self.alist)) # The first entry wins.
+        self.assertFalse(assoc('missing', self.alist))
+
+    def test_assq_is_by_identity(self):
+        self.assertEqual([self.keys[80], 80], assq(self.keys[80], self.alist))
+        self.assertFalse(assq(make_list([80, 'k']), self.alist))
+
+    def test_short_list_is_not_indexed(self):
+        short = make_list([make_list([i, i]) for i in range(tables.index_threshold - 1)])
+        self.assertFalse(assoc(-1, short))
+        self.assertNotIn((id(short), 'assoc'), tables._indexes)
+
+    def test_index_goes_with_the_list(self):
+        assoc('missing', self.alist)
+        key = (id(self.alist), 'assoc')
+        self.assertIn(key, tables._indexes)
+        del self.alist
+        self.assertNotIn(key, tables._indexes)
+
+    def test_growing_with_cons_reuses_the_index(self):
+        lisp = LispInterpreter()
+        lisp.run('(define env (quote ()))')
+        lisp.run('''(define grow (lambda (n) (while (> n 0) (begin
+            (set! env (cons (list n (* n n)) env))
+            (assoc 0 env)
+            (set! n (- n 1))))))''')
+        before = len(tables._indexes)
+        lisp.run('(grow 2000)')
+        self.assertEqual(1, len(tables._indexes) - before) # One index, passed along from head to head.
+        self.assertEqual([1, 1], lisp.run('(assoc 1 env)'))
+        self.assertEqual([2000, 4000000], lisp.run('(assoc 2000 env)'))
+        lisp.run('(set! env (cons (list 2000 (quote shadowed)) env))')
+        self.assertEqual([2000, 'shadowed'], lisp.run('(assoc 2000 env)'))
+        self.assertEqual([2000, 4000000], lisp.run('(assoc 2000 (cdr env))')) # Its old index was taken, so this makes a new one.
+
+    def test_python_table(self):
+        table = HashTable()
+        table.set(make_list([1, 2]), 'x')
+        self.assertEqual('x', table.ref([1, 2]))
+        self.assertEqual(1, len(table))
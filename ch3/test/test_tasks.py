@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from ricolisp import LispInterpreter
+from ricolisp.interpreter import Console
+from ricolisp.ports import StringPort
+from ricolisp.tasks import TaskError
+from ricolisp.vm import CannotSuspend
+
+
+class TestTasks(unittest.TestCase):
+    engine = 'compile'
+
+    def setUp(self):
+        self.lisp = LispInterpreter(engine=self.engine)
+
+    def test_channels(self):
+        self.lisp.run('(define ch (make-channel))')
+        self.lisp.run('(define producer (lambda (n) (if (= n 0) (send ch -1) (begin (send ch n) (yield) (producer (- n 1))))))')
+        self.lisp.run('(define consumer (lambda (total) (begin (define x (recv ch)) (if (< x 0) total (consumer (+ total x))))))')
+        self.lisp.run('(spawn producer 100)')
+        self.assertEqual(5050, self.lisp.run('(join (spawn consumer 0))'))
+
+    def test_interleaving(self):
+        self.lisp.run('(define log (list))')
+        self.lisp.run('(define note (lambda (x) (set! log (cons x log))))')
+        self.lisp.run('(define worker (lambda (name n) (if (= n 0) 0 (begin (note name) (yield) (worker name (- n 1))))))')
+        self.lisp.run('(spawn worker 1 3)')
+        self.lisp.run('(spawn worker 2 3)')
+        self.lisp.run('(run-tasks)')
+        self.assertEqual([1, 2, 1, 2, 1, 2], list(reversed(list(self.lisp.run('log')))))
+
+    def test_sleep(self):
+        self.lisp.run('(define ch (make-channel))')
+        self.lisp.run('(spawn (lambda () (begin (sleep 0.02) (send ch 2))))')
+        self.lisp.run('(spawn (lambda () (send ch 1)))')
+        start = time.monotonic()
+        self.assertEqual(1, self.lisp.run('(recv ch)'))
+        self.assertEqual(2, self.lisp.run('(recv ch)'))
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+
+    def test_pause_in_tail_position(self):
+        self.lisp.run('(define ch (make-channel))')
+        self.lisp.run('(define get (lambda () (recv ch)))')
+        self.lisp.run('(define task (spawn (lambda () (+ 1 (get)))))')
+        task = self.lisp.run('task')
+        self.lisp.run('(yield)')
+        self.assertEqual('waiting', task.state)
+        self.lisp.run('(send ch 41)')
+        self.assertEqual(42, self.lisp.run('(join (spawn (lambda () (join task))))'))
+
+    def test_many_tasks(self):
+        self.lisp.run('(define count 0)')
+        self.lisp.run('(define worker (lambda (n) (if (= n 0) (set! count (+ count 1)) (begin (yield) (worker (- n 1))))))')
+        self.lisp.run('(define i 0)')
+        self.lisp.run('(while (< i 2000) (begin (spawn worker 5) (set! i (+ i 1))))')
+        self.lisp.run('(run-tasks)')
+        self.assertEqual(2000, self.lisp.run('count'))
+
+    def test_failure(self):
+        self.lisp.run('(define task (spawn (lambda () (begin (yield) (car 1)))))')
+        task = self.lisp.run('task')
+        with self.assertRaises(TaskError):
+            self.lisp.run('(join (spawn (lambda () (join task))))')
+        self.assertEqual('failed', task.state)
+
+    def test_cannot_pause_inside_builtin(self):
+        with self.assertRaises(TaskError) as raised:
+            self.lisp.run('(join (spawn (lambda () (map (lambda (x) (yield)) (list 1 2)))))')
+        self.assertIn('CannotSuspend', str(raised.exception))
+
+    def test_task_that_cannot_pause_is_not_resumed(self):
+        for pause in ('(yield)', '(sleep 0)', '(recv ch)', '(join other)'):
+            self.lisp.run('(define ch (make-channel))')
+            self.lisp.run('(define other (spawn (lambda () (yield))))')
+            task = self.lisp.run(f'(spawn (lambda () (map (lambda (x) {pause}) (list 1))))')
+            with mock.patch('sys.stderr'):
+                self.lisp.run('(run-tasks)')
+            self.lisp.run('(send ch 1)')
+            self.lisp.run('(run-tasks)')
+            self.assertEqual('failed', task.state, pause)
+            self.assertIsInstance(task.error, CannotSuspend, pause)
+
+    def test_sleep_without_tasks(self):
+        start = time.monotonic()
+        self.assertIsNone(self.lisp.run('(sleep 0.02)'))
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
+
+    def test_deadlock(self):
+        with self.assertRaisesRegex(Exception, 'Deadlock'):
+            self.lisp.run('(recv (make-channel))')
+
+    def test_repl_async(self):
+        self.lisp.run('(define count 0)')
+        self.lisp.run('(define ticker (lambda () (begin (set! count (+ count 1)) (sleep 0.001) (ticker))))')
+        self.lisp.run('(spawn ticker)')
+        console = mock.Mock(spec=Console)
+        lines = iter(['(define seen count)', 'exit'])
+        def slow_input(prompt):
+            time.sleep(0.05)
+            return next(lines)
+        console.read.side_effect = slow_input
+        asyncio.run(self.lisp.repl_async(console=console))
+        self.assertGreater(self.lisp.run('seen'), 0)
+        console.input.assert_not_called()
+        self.assertEqual(2, console.flush.call_count)
+
+    def test_repl_async_uses_the_port_on_one_thread(self):
+        threads = set()
+        class Port(StringPort):
+            def write(self, text):
+                threads.add(threading.current_thread())
+                super().write(text)
+            def flush(self):
+                threads.add(threading.current_thread())
+        class SlowConsole(Console):
+            lines = iter(['(define seen 1)', 'exit'])
+            def read(self, prompt):
+                time.sleep(0.02)
+                return next(self.lines)
+        port = Port()
+        self.lisp.run('(define ticker (lambda () (begin (display 1 port) (sleep 0.001) (ticker))))')
+        self.lisp.env['port'] = port
+        self.lisp.run('(spawn ticker)')
+        asyncio.run(self.lisp.repl_async(console=SlowConsole(port)))
+        self.assertEqual({threading.main_thread()}, threads)
+        self.assertIn('11', port.getvalue())
+
+
+class TestVMTasks(TestTasks):
+    engine = 'vm'
+
+
+class TestEvalTasks(unittest.TestCase):
+    def test_spawn_needs_a_pausable_engine(self):
+        lisp = LispInterpreter(engine='eval')
+        with self.assertRaisesRegex(TypeError, 'spawn needs the compile or vm engine'):
+            lisp.run('(spawn (lambda () (yield)))')
+        self.assertEqual(3, lisp.run('(join (spawn + 1 2))'))
+        lisp.run('(sleep 0.01)')
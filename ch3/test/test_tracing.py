@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ricolisp import LispInterpreter
+from ricolisp.tracing import Tracer
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter(trace=True)
+        self.lisp.run('(define fact (lambda (n) (if (< n 2) 1 (* n (fact (- n 1))))))')
+        self.lisp.tracer.clear()
+
+    def phases(self) -> list:
+        return [(phase, name) for phase, name, ns in self.lisp.tracer.events()]
+
+    def test_records_runs_and_calls(self):
+        self.lisp.run('(fact 3)')
+        self.assertEqual([('B', 'run'), ('B', 'fact'), ('B', 'fact'), ('B', 'fact'),
+            ('E', 'fact'), ('E', 'fact'), ('E', 'fact'), ('E', 'run')], self.phases())
+        times = [ns for phase, name, ns in self.lisp.tracer.events()]
+        self.assertEqual(sorted(times), times)
+
+    def test_exit_is_recorded_on_error(self):
+        with self.assertRaises(TypeError):
+            self.lisp.run('(fact (quote x))')
+        self.assertEqual([('B', 'run'), ('B', 'fact'), ('E', 'fact'), ('E', 'run')], self.phases())
+
+    def test_jit_functions_are_traced(self):
+        self.lisp.compiler.jit.threshold = 2
+        self.lisp.run('(define fact (lambda (n) (if (< n 2) 1 (* n (fact (- n 1))))))')
+        self.assertEqual(120, self.lisp.run('(fact 5)'))
+        self.assertIsNotNone(self.lisp.env['fact'].code.native)
+        self.lisp.tracer.clear()
+        self.lisp.run('(fact 3)')
+        self.assertEqual(8, len(self.phases()))
+
+    def test_chrome_trace(self):
+        self.lisp.run('(fact 2)')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trace.json')
+            self.lisp.run(f'(trace-save (quote "{path}"))')
+            with open(path) as f:
+                trace = json.load(f)
+        events = trace['traceEvents']
+        self.assertEqual(['run', 'fact', 'fact', 'fact', 'fact', 'run', 'run'], [event['name'] for event in events])
+        self.assertEqual({'B', 'E'}, {event['ph'] for event in events})
+        self.assertTrue(all(event['ts'] >= 0 for event in events))
+        self.assertEqual(0, trace['otherData']['dropped'])
+
+    def test_needs_the_compile_engine(self):
+        with self.assertRaises(ValueError):
+            LispInterpreter(engine='eval', trace=True)
+        with self.assertRaises(ValueError):
+            LispInterpreter().save_trace('trace.json')
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_capacity_is_a_power_of_two(self):
+        self.assertEqual(8, Tracer(5).capacity)
+        self.assertEqual(8, Tracer(8).capacity)
+
+    def test_oldest_events_are_overwritten(self):
+        ticks = iter(range(1, 1000))
+        tracer = Tracer(4, clock=lambda: next(ticks))
+        tracer.enter('a')
+        tracer.enter('b')
+        tracer.exit('b')
+        tracer.enter('c')
+        tracer.exit('c')
+        tracer.exit('a')
+        self.assertEqual(6, tracer.recorded)
+        self.assertEqual(2, tracer.dropped)
+        self.assertEqual([('E', 'b', 4), ('B', 'c', 5), ('E', 'c', 6), ('E', 'a', 7)], list(tracer.events()))
+        # The exits whose enters were overwritten are left out.
+        self.assertEqual([('c', 'B', 4.0 / 1000), ('c', 'E', 5.0 / 1000)],
+            [(event['name'], event['ph'], event['ts']) for event in tracer.chrome_trace()['traceEvents']])
@@ -0,0 +1,79 @@
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from ricolisp import LispInterpreter, vectors
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'needs numpy')
+class TestVectors(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter()
+
+    def assertVectorEqual(self, expected, actual):
+        numpy.testing.assert_allclose(actual, expected, atol=1e-12)
+
+    def test_elementwise_arithmetic(self):
+        self.lisp.run('(define x (vector 1 2 3))')
+        self.lisp.run('(define vx (vector 10 20 30))')
+        self.assertVectorEqual([6, 12, 18], self.lisp.run('(+ x (* vx 0.5))'))
+        self.assertVectorEqual([False, True, True], self.lisp.run('(> x 1.5)'))
+
+    def test_math_functions_broadcast(self):
+        self.assertVectorEqual([1, 2, 3], self.lisp.run('(sqrt (vector 1 4 9))'))
+        self.assertVectorEqual([0, 1], self.lisp.run('(sin (vector 0 (/ pi 2)))'))
+        self.assertEqual(3.0, self.lisp.run('(sqrt 9)'))
+        self.assertIsInstance(self.lisp.run('(sqrt 9)'), float)
+
+    def test_reductions(self):
+        self.lisp.run('(define v (vector 3 1 2))')
+        self.assertEqual(6, self.lisp.run('(vector-sum v)'))
+        self.assertEqual(1, self.lisp.run('(vector-min v)'))
+        self.assertEqual(3, self.lisp.run('(vector-max v)'))
+        self.assertEqual(1, self.lisp.run('(vector-argmin v)'))
+        self.assertEqual(0, self.lisp.run('(vector-argmax v)'))
+
+    def test_masked_selection(self):
+        self.lisp.run('(define d (vector 5 0.5 3 0.1))')
+        self.lisp.run('(define hit (< d 1))')
+        self.assertEqual(2, self.lisp.run('(vector-count hit)'))
+        self.assertVectorEqual([0.5, 0.1], self.lisp.run('(vector-select d hit)'))
+        self.assertVectorEqual([5, 0, 3, 0], self.lisp.run('(vector-where hit 0 d)'))
+        self.assertVectorEqual([1, 3], self.lisp.run('(vector-indexes hit)'))
+
+    def test_frame_update(self):
+        self.lisp.run('(define x (vector 0 10 20))')
+        self.lisp.run('(define vx (vector 1 -1 0))')
+        self.lisp.run('(define step (lambda (dt) (set! x (+ x (* vx dt)))))')
+        self.lisp.run('(step 2)')
+        self.assertVectorEqual([2, 8, 20], self.lisp.run('x'))
+
+    def test_conversions(self):
+        self.assertEqual([1.0, 2.0], self.lisp.run('(vector->list (list->vector (list 1 2)))'))
+        self.assertEqual(4, self.lisp.run('(vector-length (make-vector 4 0))'))
+        self.assertEqual(2.0, self.lisp.run('(vector-ref (vector-range 3) 2)'))
+        self.assertTrue(self.lisp.run('(vector? (vector-range 3))'))
+        self.assertFalse(self.lisp.run('(vector? (list 1 2))'))
+
+    def test_vector_set(self):
+        self.lisp.run('(define v (make-vector 3 0))')
+        self.lisp.run('(vector-set! v 1 5)')
+        self.assertVectorEqual([0, 5, 0], self.lisp.run('v'))
+
+
+class TestWithoutNumpy(unittest.TestCase):
+    def test_no_vectors_without_numpy(self):
+        with mock.patch.object(vectors.importlib.util, 'find_spec', return_value=None):
+            self.assertEqual({}, vectors.builtins())
+
+    def test_numpy_imported_when_needed(self):
+        script = ('import sys; from ricolisp import LispInterpreter; lisp = LispInterpreter(); '
+            'print(lisp.run("(sqrt 4)"), "numpy" in sys.modules)')
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+        self.assertEqual('2.0 False', output.strip())
@@ -0,0 +1,64 @@
+import unittest
+from functools import partial
+from unittest import mock
+
+from ricolisp import LispInterpreter
+from ricolisp.interpreter import parse, standard_env, Procedure
+from ricolisp.vm import BytecodeCompiler, CodeObject, disassemble
+from . import test_lisp, test_compiler
+
+
+class TestVMEngine(test_lisp.TestLisp):
+    """Run the whole interpreter test suite on the bytecode VM."""
+    def setUp(self):
+        patcher = mock.patch.object(test_lisp, 'LispInterpreter', partial(LispInterpreter, engine='vm'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestVMTailCalls(test_compiler.TestTailCalls):
+    engine = 'vm'
+
+
+class TestVMLexicalAddressing(test_compiler.TestLexicalAddressing):
+    def setUp(self):
+        self.lisp = LispInterpreter(engine='vm')
+
+
+class TestVM(unittest.TestCase):
+    def setUp(self):
+        self.lisp = LispInterpreter(engine='vm')
+
+    def test_compiles_to_flat_instructions(self):
+        code = BytecodeCompiler(standard_env()).compile(parse('(if (< x 1) (quote small) (f x 2))'))
+        self.assertIsInstance(code, CodeObject)
+        self.assertTrue(all(isinstance(word, int) for word in code.instructions))
+        listing = disassemble(code)
+        self.assertIn('JUMP_IF_FALSE', listing)
+        self.assertIn('CALL', listing)
+        self.assertTrue(listing.endswith('RETURN'))
+
+    def test_lambda_body_ends_in_tail_call(self):
+        proc = self.lisp.run('(lambda (n) (g n))')
+        self.assertIn('TAIL_CALL', disassemble(proc.code.bytecode))
+
+    def test_deep_recursion_does_not_use_python_stack(self):
+        self.lisp.run('(define sum (lambda (n) (if (= n 0) 0 (+ n (sum (- n 1))))))')
+        self.assertEqual(50005000, self.lisp.run('(sum 10000)'))
+
+    def test_procedures_callable_from_python(self):
+        proc = self.lisp.run('(lambda (a b) (list b a))')
+        self.assertIsInstance(proc, Procedure)
+        self.assertEqual([2, 1], proc(1, 2))
+        self.assertEqual([[1, 2], [3, 4]], self.lisp.run('(map (lambda (x) (list x (+ x 1))) (list 1 3))'))
+
+    def test_while_value(self):
+        self.assertIsNone(self.lisp.run('(while 0 1)'))
+        self.lisp.run('(define i 0)')
+        self.assertEqual(3, self.lisp.run('(while (< i 3) (begin (set! i (+ i 1)) i))'))
+
+    def test_set_before_internal_define_assigns_outer(self):
+        self.lisp.run('(define x 1)')
+        self.lisp.run('(define f (lambda (y) (begin (set! x y) (define x 10) x)))')
+        self.assertEqual(10, self.lisp.run('(f 5)'))
+        self.assertEqual(5, self.lisp.run('x'))